@@ -1,35 +1,195 @@
-from fastapi import FastAPI
+import time
+
+_import_started = time.perf_counter()
+
+import asyncio
+import json
+import os
+from contextlib import asynccontextmanager
+from typing import Optional
+from fastapi import FastAPI, HTTPException, Request
+from fastapi.responses import JSONResponse, Response, StreamingResponse
+from prometheus_client import CONTENT_TYPE_LATEST, generate_latest
 from pydantic import BaseModel
-from chatbot import ask_chatbot  # Import chatbot logic
-from scripts.seasonal_advice import get_seasonal_advice, get_current_season
+from chatbot import aask_chatbot, aask_chatbot_batch, aretrieval_options, astream_chatbot, coalescing_stats, context_stats, readiness, startup_timings, topics, warm_up  # Import chatbot logic
+from scripts.admission import AdmissionController, ClientDisconnected, DeadlineExceeded, Overloaded
+from scripts.llm_client import aclose as close_llm_client
+from scripts.metrics import SHED_REQUESTS, register_stats
+from scripts.seasonal_advice import aget_seasonal_advice, astream_seasonal_advice, get_current_season
+from scripts.seasonal_advice import coalescing_stats as advice_coalescing_stats
+
+startup_timings["import"] = round(time.perf_counter() - _import_started, 3)
+
+# Load the index and warm the chain in the background once the port is bound;
+# requests that arrive earlier simply trigger the same lazy initialization.
+WARMUP_ON_STARTUP = os.getenv("WARMUP_ON_STARTUP", "1") == "1"
+
+
+async def run_warm_up():
+    started = time.perf_counter()
+    try:
+        await asyncio.to_thread(warm_up)
+    except Exception as e:
+        print(f"Warm-up failed: {type(e).__name__}: {e}")
+        return
+    startup_timings["warm_up"] = round(time.perf_counter() - started, 3)
+    print("Startup timings (s): " + ", ".join(f"{name} {seconds}" for name, seconds in startup_timings.items()))
+
+
+@asynccontextmanager
+async def lifespan(app):
+    task = asyncio.create_task(run_warm_up()) if WARMUP_ON_STARTUP else None
+    yield
+    if task is not None and not task.done():
+        task.cancel()
+    await close_llm_client()
 
-app = FastAPI(title="Farm Advisor AI API", description="API for AI-powered agricultural assistant", version="1.0.0")
+
+app = FastAPI(title="Farm Advisor AI API", description="API for AI-powered agricultural assistant", version="1.0.0",
+              lifespan=lifespan)
+
+# Per-process cap on concurrent LLM-backed requests; the rest wait in a bounded
+# queue and are shed with 503 + Retry-After when it is full (see scripts/admission.py)
+MAX_CONCURRENT_REQUESTS = int(os.getenv("MAX_CONCURRENT_REQUESTS", "16"))
+admission = AdmissionController(MAX_CONCURRENT_REQUESTS)
+register_stats("admission", "Admission control", admission.stats)
+MAX_BATCH_SIZE = int(os.getenv("MAX_BATCH_SIZE", "100"))
 
 # Request Body Models
 class QueryRequest(BaseModel):
     question: str
+    # Optional retrieval overrides: "similarity" or "mmr", and the MMR settings
+    search_type: Optional[str] = None
+    fetch_k: Optional[int] = None
+    lambda_mult: Optional[float] = None
+    max_per_source: Optional[int] = None
+    # Optional filters: a topic from topics.json, or parts of source file names
+    topic: Optional[str] = None
+    sources: Optional[list[str]] = None
+
+    async def retrieval(self):
+        try:
+            return await aretrieval_options(self.search_type, self.fetch_k, self.lambda_mult, self.max_per_source,
+                                     self.topic, self.sources)
+        except ValueError as e:
+            raise HTTPException(status_code=422, detail=str(e))
+
+class BatchQueryRequest(BaseModel):
+    questions: list[str]
 
 class SeasonalAdviceRequest(BaseModel):
     location: str
     crop_type: str = ""
     hemisphere: str
 
+def sse_event(event, data):
+    """Format one Server-Sent Event; data is JSON-encoded so newlines in tokens survive."""
+    return f"event: {event}\ndata: {json.dumps(data)}\n\n"
+
+@app.exception_handler(Overloaded)
+async def overloaded(request, exc):
+    return JSONResponse({"detail": str(exc)}, status_code=503, headers={"Retry-After": str(exc.retry_after)})
+
+@app.exception_handler(DeadlineExceeded)
+async def deadline_exceeded(request, exc):
+    return JSONResponse({"detail": str(exc)}, status_code=504)
+
+@app.exception_handler(ClientDisconnected)
+async def client_disconnected(request, exc):
+    # Nobody is listening; 499 only shows up in access logs
+    return Response(status_code=499)
+
+async def admitted_events(operation, events):
+    """
+    Stream SSE events while holding an LLM slot. Streams are not cut off by the
+    request deadline (only their first token is), and Starlette cancels them when
+    the client disconnects; a stream that is shed from the queue or misses its
+    first-token deadline ends with an "error" event.
+    """
+    try:
+        async with admission.admit(operation):
+            async for event in events:
+                yield event
+    except Overloaded as e:
+        yield sse_event("error", {"detail": str(e), "retry_after": e.retry_after})
+    except DeadlineExceeded as e:
+        SHED_REQUESTS.labels(operation, "deadline").inc()
+        yield sse_event("error", {"detail": str(e)})
+
 # 🟢 Home Route
 @app.get("/")
 def home():
     return {"message": "Farm Advisor AI API is running!"}
 
+# 🟢 Liveness probe: the process is up and serving
+@app.get("/healthz")
+def healthz():
+    return {"status": "ok"}
+
+# 🟢 Readiness probe: 503 until the index is loaded and the chain is warmed
+@app.get("/readyz")
+def readyz():
+    status = readiness()
+    return JSONResponse(status, status_code=200 if status["ready"] else 503)
+
+# 🟢 Request coalescing counters ("coalesced" = LLM calls saved)
+@app.get("/stats/coalescing")
+def coalescing():
+    return {"ask": coalescing_stats(), "seasonal_advice": advice_coalescing_stats()}
+
+# 🟢 Context packing totals (prompt tokens saved by merging/de-duplicating chunks)
+@app.get("/stats/context")
+def context():
+    return context_stats()
+
+# 🟢 Topics accepted by the "topic" filter on /ask, with the sources each one searches
+@app.get("/topics")
+def list_topics():
+    return {"topics": topics()}
+
+# 🟢 Prometheus metrics: request/stage latency histograms, in-flight requests,
+# LLM token counts, cache hit rates and index size (per worker process)
+@app.get("/metrics")
+def metrics():
+    return Response(generate_latest(), media_type=CONTENT_TYPE_LATEST)
+
 # 🟢 Chatbot API
 @app.post("/ask")
-def ask_question(request: QueryRequest):
-    response = ask_chatbot(request.question)
+async def ask_question(request: QueryRequest, http_request: Request):
+    retrieval = await request.retrieval()
+    response = await admission.run("ask", aask_chatbot(request.question, retrieval), http_request.receive)
     return {"question": request.question, "answer": response}
 
+# 🟢 Chatbot API (batch): results in request order, each with "answer" or "error"
+@app.post("/ask/batch")
+async def ask_batch(request: BatchQueryRequest, http_request: Request):
+    if len(request.questions) > MAX_BATCH_SIZE:
+        raise HTTPException(status_code=413, detail=f"At most {MAX_BATCH_SIZE} questions per batch.")
+    results = await admission.run("ask_batch", aask_chatbot_batch(request.questions), http_request.receive)
+    return {"results": results}
+
+# 🟢 Chatbot API (streaming): "token" events, then "sources", then "done"
+@app.post("/ask/stream")
+async def ask_question_stream(request: QueryRequest):
+    retrieval = await request.retrieval()
+    admission.check("ask_stream")
+
+    async def events():
+        async for event, data in astream_chatbot(request.question, retrieval):
+            yield sse_event(event, data)
+        yield sse_event("done", {"question": request.question})
+
+    return StreamingResponse(admitted_events("ask_stream", events()), media_type="text/event-stream", headers={"Cache-Control": "no-cache"})
+
 # 🟢 Seasonal Advice API
 @app.post("/seasonal_advice")
-def seasonal_advice(request: SeasonalAdviceRequest):
+async def seasonal_advice(request: SeasonalAdviceRequest, http_request: Request):
     season = get_current_season(request.hemisphere.lower())
-    advice = get_seasonal_advice(request.location, request.crop_type, request.hemisphere.lower())
+    advice = await admission.run(
+        "seasonal_advice",
+        aget_seasonal_advice(request.location, request.crop_type, request.hemisphere.lower()),
+        http_request.receive,
+    )
 
     return {
         "location": request.location,
@@ -38,6 +198,20 @@ def seasonal_advice(request: SeasonalAdviceRequest):
         "advice": advice
     }
 
+# 🟢 Seasonal Advice API (streaming): "token" events, then "done"
+@app.post("/seasonal_advice/stream")
+async def seasonal_advice_stream(request: SeasonalAdviceRequest):
+    hemisphere = request.hemisphere.lower()
+    season = get_current_season(hemisphere)
+    admission.check("seasonal_advice_stream")
+
+    async def events():
+        async for token in astream_seasonal_advice(request.location, request.crop_type, hemisphere):
+            yield sse_event("token", token)
+        yield sse_event("done", {"location": request.location, "season": season, "crop_type": request.crop_type})
+
+    return StreamingResponse(admitted_events("seasonal_advice_stream", events()), media_type="text/event-stream", headers={"Cache-Control": "no-cache"})
+
 # 🟢 Quick Questions API
 @app.get("/quick_questions")
 def quick_questions():
@@ -1,5 +1,5 @@
 import streamlit as st
-from chatbot import ask_chatbot
+from chatbot import stream_chatbot
 from scripts.seasonal_advice import get_seasonal_advice, get_current_season
 import os
 
@@ -62,9 +62,7 @@ with tab1:
         
         # Generate and display assistant response
         with st.chat_message("assistant"):
-            with st.spinner("Thinking..."):
-                response = ask_chatbot(query)
-            st.markdown(response)
+            response = st.write_stream(stream_chatbot(query))
         
         # Add assistant response to chat history
         st.session_state.messages.append({"role": "assistant", "content": response})
@@ -78,9 +76,7 @@ with tab1:
             query = "How do I improve soil quality naturally?"
             st.session_state.messages.append({"role": "user", "content": query})
             with st.chat_message("assistant"):
-                with st.spinner("Thinking..."):
-                    response = ask_chatbot(query)
-                st.markdown(response)
+                response = st.write_stream(stream_chatbot(query))
             st.session_state.messages.append({"role": "assistant", "content": response})
 
     with col2:
@@ -88,9 +84,7 @@ with tab1:
             query = "What crops are best for sandy soil?"
             st.session_state.messages.append({"role": "user", "content": query})
             with st.chat_message("assistant"):
-                with st.spinner("Thinking..."):
-                    response = ask_chatbot(query)
-                st.markdown(response)
+                response = st.write_stream(stream_chatbot(query))
             st.session_state.messages.append({"role": "assistant", "content": response})
 
 with tab2:
@@ -0,0 +1,379 @@
+import argparse
+import asyncio
+import contextlib
+import datetime
+import json
+import os
+import platform
+import subprocess
+import sys
+import tempfile
+import time
+
+import numpy as np
+
+from scripts.fake_backends import FakeEmbeddings, FakeGeminiServer, FakeLLM, isolate_state
+from scripts.vector_index import INDEX_TYPES, build_ann_index, resolve_index_config
+
+# Modules that read cache and log paths at import time (load_data, page_cache,
+# metrics and everything importing them) are imported inside the functions that
+# use them, once main() has pointed those paths at a scratch directory
+
+# Offline benchmarks of the RAG and seasonal-advice hot paths. Gemini is replaced
+# by deterministic fakes with configurable latency, so runs are reproducible
+# and cost nothing. Results are written as JSON; --compare flags regressions.
+# Usage: python benchmark.py --max-files 2 --output benchmark_results/run.json [--compare old.json]
+
+QUESTIONS = [
+    f"{question} {crop}?"
+    for question in ("How do I control pests in", "What fertilizer schedule suits", "When should I irrigate",
+                     "How can I improve soil health for", "What diseases commonly affect")
+    for crop in ("rice", "wheat", "maize", "tomatoes", "potatoes", "cotton", "sugarcane", "soybeans")
+]
+
+
+def summarize(samples_ms):
+    """
+    Returns:
+        dict: count, mean and p50/p95/p99 of latency samples in milliseconds
+    """
+    samples = np.asarray(samples_ms, dtype=np.float64)
+    return {
+        "count": len(samples),
+        "mean_ms": round(float(samples.mean()), 3),
+        "p50_ms": round(float(np.percentile(samples, 50)), 3),
+        "p95_ms": round(float(np.percentile(samples, 95)), 3),
+        "p99_ms": round(float(np.percentile(samples, 99)), 3),
+    }
+
+
+@contextlib.contextmanager
+def quiet():
+    # Per-request progress prints would otherwise flood the report
+    with open(os.devnull, "w") as devnull, contextlib.redirect_stdout(devnull):
+        yield
+
+
+def bench_parse_split(files, chunk_size, chunk_overlap, workers, page_cache=None):
+    """
+    Parse and split the corpus with load_data.iter_file_chunks.
+
+    With an empty page_cache database every PDF is parsed (and cached); running
+    again with the same database measures re-chunking from cached pages.
+
+    Returns:
+        tuple: (result dict, {path: chunks}) so later stages can reuse the chunks
+    """
+    from scripts.load_data import iter_file_chunks
+
+    started = time.perf_counter()
+    parsed = {}
+    with quiet():
+        for path, chunks, error in iter_file_chunks(files, chunk_size, chunk_overlap, workers=workers, progress=False,
+                                                     page_cache=page_cache):
+            if error is None:
+                parsed[path] = chunks
+    seconds = time.perf_counter() - started
+
+    chunks = [doc for docs in parsed.values() for doc in docs]
+    pages = len({(doc.metadata.get("source"), doc.metadata.get("page")) for doc in chunks})
+    megabytes = sum(os.path.getsize(path) for path in parsed) / 1e6
+    return {
+        "files": len(parsed),
+        "pages": pages,
+        "chunks": len(chunks),
+        "megabytes": round(megabytes, 2),
+        "seconds": round(seconds, 3),
+        "pages_per_s": round(pages / seconds, 1),
+        "chunks_per_s": round(len(chunks) / seconds, 1),
+        "mb_per_s": round(megabytes / seconds, 2),
+    }, parsed
+
+
+def bench_index_build(parsed, embeddings, folder, index_type, concurrency):
+    """Embed the parsed chunks with the fake embeddings and build/save the index (parsing excluded)."""
+    from scripts.embedding_pipeline import EmbeddingStage
+    from scripts.index_builder import update_index
+
+    def load_files(paths):
+        return ((path, parsed[path], None) for path in paths)
+
+    stage = EmbeddingStage(embeddings, batch_size=100, max_concurrency=concurrency)
+    started = time.perf_counter()
+    with quiet():
+        report = update_index(list(parsed), load_files, embeddings, folder, settings={"benchmark": True},
+                              full=True, embedding_stage=stage, index_config={"type": index_type})
+    seconds = time.perf_counter() - started
+    return {
+        "index_type": index_type,
+        "chunks": report["total_chunks"],
+        "seconds": round(seconds, 3),
+        "chunks_per_s": round(report["total_chunks"] / seconds, 1),
+    }
+
+
+def bench_search(sizes, dimension, num_queries, k, index_types):
+    """FAISS search latency (single query, like the chatbot) at several corpus sizes."""
+    rng = np.random.default_rng(0)
+    results = []
+    for size in sizes:
+        centers = rng.standard_normal((max(size // 50, 1), dimension)).astype(np.float32)
+        vectors = centers[rng.integers(0, len(centers), size)] + 0.3 * rng.standard_normal((size, dimension)).astype(np.float32)
+        queries = vectors[rng.integers(0, size, num_queries)] + 0.05 * rng.standard_normal((num_queries, dimension)).astype(np.float32)
+        for index_type in index_types:
+            config = resolve_index_config({"type": index_type}, size)
+            started = time.perf_counter()
+            index = build_ann_index(vectors, config)
+            build_seconds = time.perf_counter() - started
+            samples = []
+            for query in queries:
+                started = time.perf_counter()
+                index.search(query[None, :], k)
+                samples.append((time.perf_counter() - started) * 1000)
+            results.append({"size": size, "index_type": index_type, "build_seconds": round(build_seconds, 3), **summarize(samples)})
+            print(f"  search {index_type:<6} n={size:<7} p50 {results[-1]['p50_ms']:.3f} ms  p99 {results[-1]['p99_ms']:.3f} ms")
+    return results
+
+
+def bench_ask(chatbot, questions, rounds):
+    """End-to-end ask_chatbot latency (retrieval, packing and the fake LLM), sequential."""
+    samples = []
+    with quiet():
+        for i in range(rounds):
+            question = questions[i % len(questions)]
+            started = time.perf_counter()
+            chatbot.ask_chatbot(question)
+            samples.append((time.perf_counter() - started) * 1000)
+    return summarize(samples)
+
+
+def bench_api(app, questions, num_requests, concurrency):
+    """/ask throughput and latency under concurrent load, through the FastAPI app in-process."""
+    import httpx
+
+    async def run():
+        slots = asyncio.Semaphore(concurrency)
+        samples, errors = [], 0
+
+        async def one(client, i):
+            nonlocal errors
+            async with slots:
+                started = time.perf_counter()
+                response = await client.post("/ask", json={"question": questions[i % len(questions)]})
+                samples.append((time.perf_counter() - started) * 1000)
+                errors += response.status_code != 200
+
+        transport = httpx.ASGITransport(app=app)
+        async with httpx.AsyncClient(transport=transport, base_url="http://benchmark", timeout=300) as client:
+            started = time.perf_counter()
+            await asyncio.gather(*(one(client, i) for i in range(num_requests)))
+            seconds = time.perf_counter() - started
+        return {"requests": num_requests, "concurrency": concurrency, "errors": errors, "seconds": round(seconds, 3),
+                "requests_per_s": round(num_requests / seconds, 2), **summarize(samples)}
+
+    with quiet():
+        return asyncio.run(run())
+
+
+def bench_seasonal(seasonal_advice, rounds):
+    """get_seasonal_advice latency on a cold advice store (LLM call) and a warm one (stored advice)."""
+    locations = [f"District {i}" for i in range(rounds)]
+    cold, warm = [], []
+    for samples in (cold, warm):
+        for location in locations:
+            started = time.perf_counter()
+            seasonal_advice.get_seasonal_advice(location, "rice", "northern")
+            samples.append((time.perf_counter() - started) * 1000)
+    return {"cold": summarize(cold), "warm": summarize(warm)}
+
+
+def bench_llm_client(num_requests, concurrency, latency, slow_fraction, hedge):
+    """
+    GeminiClient.agenerate against a local HTTP stand-in whose latency has a long
+    tail (slow_fraction of requests take 10x longer), with or without hedging.
+    """
+    from scripts.llm_client import GeminiClient
+
+    async def run(server):
+        client = GeminiClient(base_url=server.url, api_key=None, hedge=hedge)
+        slots = asyncio.Semaphore(concurrency)
+        samples = []
+
+        async def one(i):
+            async with slots:
+                started = time.perf_counter()
+                await client.agenerate(QUESTIONS[i % len(QUESTIONS)])
+                samples.append((time.perf_counter() - started) * 1000)
+
+        await asyncio.gather(*(one(i) for i in range(num_requests)))
+        await client.aclose()
+        stats = client.stats()
+        return {"hedges": stats["hedges"], "hedge_wins": stats["hedge_wins"], **summarize(samples)}
+
+    with FakeGeminiServer(latency=latency, slow_fraction=slow_fraction, slow_latency=latency * 10) as server:
+        result = asyncio.run(run(server))
+    return {**result, "http_requests": server.counts["requests"], "connections": server.counts["connections"]}
+
+
+# Metrics where a larger value is worse; everything ending in _per_s is better when larger
+LOWER_IS_BETTER = ("_ms", "seconds")
+
+
+def _flatten(value, prefix=""):
+    if isinstance(value, dict):
+        for key, item in value.items():
+            yield from _flatten(item, f"{prefix}{key}.")
+    elif isinstance(value, list):
+        for i, item in enumerate(value):
+            label = ".".join(str(item[key]) for key in ("index_type", "size") if isinstance(item, dict) and key in item)
+            yield from _flatten(item, f"{prefix}{label or i}.")
+    elif isinstance(value, (int, float)) and not isinstance(value, bool):
+        yield prefix.rstrip("."), value
+
+
+def compare(previous, current, threshold):
+    """
+    Print metrics that got worse by more than threshold (a fraction) since a previous run.
+
+    Returns:
+        int: Number of regressions
+    """
+    before = dict(_flatten(previous["results"]))
+    changed = sorted(key for key, value in current["meta"]["args"].items()
+                     if key not in ("output", "compare") and previous["meta"].get("args", {}).get(key) != value)
+    if changed:
+        print(f"Note: the runs used different settings ({', '.join(changed)}); differences may not be regressions.")
+    regressions = 0
+    for name, value in _flatten(current["results"]):
+        old = before.get(name)
+        if not old or name.endswith("count"):
+            continue
+        if name.endswith(LOWER_IS_BETTER):
+            change = (value - old) / old
+        elif name.endswith("_per_s"):
+            change = (old - value) / old
+        else:
+            continue
+        if change > threshold:
+            regressions += 1
+            print(f"REGRESSION {name}: {old} -> {value} ({change:+.0%})")
+    print(f"{regressions} regression(s) above {threshold:.0%} compared with {previous['meta'].get('timestamp')}")
+    return regressions
+
+
+def git_commit():
+    try:
+        return subprocess.run(["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Offline benchmarks for the chatbot and seasonal advice.")
+    parser.add_argument("--data", default="data", help="Folder with the documents to parse and index")
+    parser.add_argument("--max-files", type=int, default=3, help="Use at most this many files from --data (0 = all)")
+    parser.add_argument("--workers", type=int, default=None, help="Parser processes (default: CPU count)")
+    parser.add_argument("--chunk-size", type=int, default=500)
+    parser.add_argument("--chunk-overlap", type=int, default=100)
+    parser.add_argument("--index-type", default="flat", choices=INDEX_TYPES, help="Index type built for the ask benchmarks")
+    parser.add_argument("--search-sizes", default="1000,10000,50000", help="Comma-separated corpus sizes for the search benchmark")
+    parser.add_argument("--search-types", default="flat,hnsw", help="Comma-separated index types for the search benchmark")
+    parser.add_argument("--dimension", type=int, default=768)
+    parser.add_argument("--queries", type=int, default=200, help="Queries per search configuration")
+    parser.add_argument("--ask-rounds", type=int, default=40, help="Sequential ask_chatbot calls")
+    parser.add_argument("--api-requests", type=int, default=200, help="Total /ask requests in the load test")
+    parser.add_argument("--concurrency", type=int, default=16, help="Concurrent /ask requests in the load test")
+    parser.add_argument("--embed-latency", type=float, default=0.05, help="Fake embedding latency per request (s)")
+    parser.add_argument("--llm-latency", type=float, default=0.5, help="Fake LLM latency per answer (s)")
+    parser.add_argument("--llm-client-requests", type=int, default=300, help="Calls per LLM client configuration")
+    parser.add_argument("--output", default=None, help="JSON results file (default: benchmark_results/<timestamp>.json)")
+    parser.add_argument("--compare", default=None, help="Previous results file to check for regressions")
+    parser.add_argument("--threshold", type=float, default=0.2, help="Relative change counted as a regression")
+    args = parser.parse_args()
+
+    timestamp = datetime.datetime.now().strftime("%Y%m%dT%H%M%S")
+    results = {}
+    embeddings = FakeEmbeddings(size=args.dimension, latency=args.embed_latency)
+    llm = FakeLLM(latency=args.llm_latency, time_to_first_token=args.llm_latency / 5)
+
+    with tempfile.TemporaryDirectory() as workdir:
+        # Before chatbot and seasonal_advice are imported, which read their cache paths
+        isolate_state(workdir)
+        from scripts.load_data import list_data_files
+
+        files = list_data_files(args.data)[:args.max_files or None]
+        if not files:
+            print(f"No documents found in {args.data}; skipping parse, build and ask benchmarks.")
+        else:
+            print(f"Parsing {len(files)} file(s) from {args.data}...")
+            page_cache = os.path.join(workdir, "parsed_pages.sqlite3")
+            results["parse_split"], parsed = bench_parse_split(files, args.chunk_size, args.chunk_overlap, args.workers, page_cache)
+            print(f"  {results['parse_split']}")
+            print("Re-splitting from the parsed-page cache...")
+            results["parse_split_cached"], _ = bench_parse_split(files, args.chunk_size, args.chunk_overlap, args.workers, page_cache)
+            print(f"  {results['parse_split_cached']}")
+
+            print("Building the index with fake embeddings...")
+            index_folder = os.path.join(workdir, "faiss_index")
+            results["index_build"] = bench_index_build(parsed, embeddings, index_folder, args.index_type, concurrency=4)
+            print(f"  {results['index_build']}")
+
+            # Point the chatbot at the benchmark index with the fake backends; the
+            # semantic cache is off (isolate_state) so every call goes through
+            # retrieval and the LLM
+            import chatbot
+            chatbot.faiss_path = index_folder
+            chatbot.configure(llm=llm, embeddings=embeddings)
+
+            print("Timing ask_chatbot end to end...")
+            results["ask_chatbot"] = bench_ask(chatbot, QUESTIONS, args.ask_rounds)
+            print(f"  {results['ask_chatbot']}")
+
+            print(f"Load-testing /ask with {args.concurrency} concurrent clients...")
+            import api
+            results["api_ask"] = bench_api(api.app, QUESTIONS, args.api_requests, args.concurrency)
+            print(f"  {results['api_ask']}")
+
+        print("Timing FAISS search...")
+        sizes = [int(size) for size in args.search_sizes.split(",") if size]
+        results["search"] = bench_search(sizes, args.dimension, args.queries, 5, args.search_types.split(","))
+
+        print("Timing the pooled LLM client against a local stand-in...")
+        results["llm_client"] = {
+            name: bench_llm_client(args.llm_client_requests, args.concurrency, args.llm_latency / 5, 0.05, hedge)
+            for name, hedge in (("plain", False), ("hedged", True))
+        }
+        print(f"  {results['llm_client']}")
+
+        print("Timing seasonal advice...")
+        from scripts import seasonal_advice
+        seasonal_advice.configure(llm)
+        results["seasonal_advice"] = bench_seasonal(seasonal_advice, rounds=10)
+        print(f"  {results['seasonal_advice']}")
+
+    run = {
+        "meta": {
+            "timestamp": timestamp,
+            "git_commit": git_commit(),
+            "python": sys.version.split()[0],
+            "platform": platform.platform(),
+            "cpu_count": os.cpu_count(),
+            "args": vars(args),
+        },
+        "results": results,
+    }
+    output = args.output or os.path.join("benchmark_results", f"{timestamp}.json")
+    os.makedirs(os.path.dirname(output) or ".", exist_ok=True)
+    with open(output, "w") as f:
+        json.dump(run, f, indent=2)
+    print(f"Results written to {output}")
+
+    if args.compare:
+        with open(args.compare) as f:
+            previous = json.load(f)
+        if compare(previous, run, args.threshold):
+            sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,110 @@
+import argparse
+import json
+import time
+
+import faiss
+import numpy as np
+
+from scripts.vector_index import build_ann_index, load_vectors, resolve_index_config
+
+# Compare ANN index configurations on the vectors of a built index:
+# recall@k against exact flat search, p50/p99 single-query latency and index size.
+# Usage: python benchmark_index.py --queries 200 --k 5 [--json results.json]
+
+DEFAULT_CONFIGS = [
+    {"type": "flat"},
+    {"type": "ivf", "nprobe": 1},
+    {"type": "ivf", "nprobe": 8},
+    {"type": "ivf", "nprobe": 32},
+    {"type": "hnsw", "M": 16, "ef_search": 32},
+    {"type": "hnsw", "M": 32, "ef_search": 64},
+    {"type": "hnsw", "M": 32, "ef_search": 128},
+    {"type": "ivfpq", "nprobe": 8, "pq_m": 16},
+    {"type": "ivfpq", "nprobe": 32, "pq_m": 32},
+]
+
+
+def make_queries(vectors, num_queries, noise=0.05, seed=0):
+    """
+    Sample query vectors near the corpus: stored vectors plus small Gaussian noise,
+    so the benchmark needs no embedding calls.
+    """
+    rng = np.random.default_rng(seed)
+    rows = rng.choice(len(vectors), size=min(num_queries, len(vectors)), replace=False)
+    queries = np.array(vectors[rows], dtype=np.float32)
+    scale = noise * np.linalg.norm(queries, axis=1, keepdims=True) / np.sqrt(queries.shape[1])
+    return queries + rng.normal(size=queries.shape).astype(np.float32) * scale
+
+
+def benchmark_config(vectors, queries, truth, config, k):
+    """
+    Build one index configuration and measure it.
+
+    Returns:
+        dict: Resolved config, build time, recall@k, latency percentiles and size
+    """
+    config = resolve_index_config(config, len(vectors))
+    started = time.perf_counter()
+    index = build_ann_index(vectors, config)
+    build_seconds = time.perf_counter() - started
+
+    latencies = []
+    hits = 0
+    for query, expected in zip(queries, truth):
+        started = time.perf_counter()
+        _, found = index.search(query[None, :], k)
+        latencies.append((time.perf_counter() - started) * 1000)
+        hits += len(set(found[0]) & set(expected))
+
+    return {
+        "config": config,
+        "build_seconds": round(build_seconds, 3),
+        f"recall@{k}": round(hits / (len(queries) * k), 4),
+        "p50_ms": round(float(np.percentile(latencies, 50)), 4),
+        "p99_ms": round(float(np.percentile(latencies, 99)), 4),
+        "index_bytes": int(faiss.serialize_index(index).size),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark FAISS index types on the built index's vectors.")
+    parser.add_argument("--index-path", default="vector_store/faiss_index", help="Index folder containing vectors.npy")
+    parser.add_argument("--queries", type=int, default=200, help="Number of benchmark queries")
+    parser.add_argument("--k", type=int, default=5, help="Neighbours per query (the chatbot uses 5)")
+    parser.add_argument("--configs", default=None, help="JSON file with a list of index configs to compare")
+    parser.add_argument("--json", default=None, help="Write results to this JSON file")
+    args = parser.parse_args()
+
+    vectors = np.ascontiguousarray(load_vectors(args.index_path, mmap=False), dtype=np.float32)
+    configs = DEFAULT_CONFIGS
+    if args.configs:
+        with open(args.configs) as f:
+            configs = json.load(f)
+
+    queries = make_queries(vectors, args.queries)
+    exact = faiss.IndexFlatL2(vectors.shape[1])
+    exact.add(vectors)
+    _, truth = exact.search(queries, args.k)
+
+    print(f"{len(vectors)} vectors x {vectors.shape[1]} dims, {len(queries)} queries, k={args.k}")
+    print(f"{'config':<58} {'recall':>7} {'p50 ms':>8} {'p99 ms':>8} {'size MB':>8} {'build s':>8}")
+    results = []
+    for config in configs:
+        try:
+            result = benchmark_config(vectors, queries, truth, config, args.k)
+        except Exception as e:
+            print(f"{json.dumps(config):<58} skipped: {e}")
+            continue
+        results.append(result)
+        label = json.dumps(result["config"], separators=(",", ":"))
+        print(f"{label:<58} {result[f'recall@{args.k}']:>7.3f} {result['p50_ms']:>8.3f} {result['p99_ms']:>8.3f} "
+              f"{result['index_bytes'] / 1e6:>8.2f} {result['build_seconds']:>8.2f}")
+
+    if args.json:
+        with open(args.json, "w") as f:
+            json.dump({"num_vectors": len(vectors), "dimension": int(vectors.shape[1]), "k": args.k, "results": results}, f, indent=2)
+        print(f"Results written to {args.json}")
+
+
+if __name__ == "__main__":
+    main()
@@ -1,91 +1,129 @@
 import os
 from dotenv import load_dotenv
+import argparse
 import sys
 
 # Import FAISS and LangChain components
-from langchain_community.vectorstores import FAISS
-from langchain_google_genai import GoogleGenerativeAIEmbeddings
-from langchain.text_splitter import RecursiveCharacterTextSplitter
-from langchain_community.document_loaders import DirectoryLoader, PyPDFLoader
+from scripts.embedding_backends import (EMBEDDING_BACKEND, EMBEDDING_BACKENDS, TFIDF_DIMENSION, TFIDF_MODEL_PATH,
+                                        fit_tfidf_model, get_embedding_backend)
+from scripts.load_data import iter_file_chunks, list_data_files
+from scripts.page_cache import PAGE_CACHE_PATH
+from scripts.dedup import DEFAULT_THRESHOLD
+from scripts.index_builder import update_index, print_report
+from scripts.embedding_pipeline import EmbeddingCheckpoint, EmbeddingStage
+from scripts.vector_index import INDEX_TYPES
 
-# Load API Key
-load_dotenv()
-api_key = os.getenv("GOOGLE_API_KEY")
+# Split documents into smaller chunks
+CHUNK_SIZE, CHUNK_OVERLAP = 500, 100
 
-if not api_key:
-    raise ValueError("Google API Key not found. Please set it in your .env file.")
+def main():
+    parser = argparse.ArgumentParser(description="Build or incrementally update the FAISS index from data/.")
+    parser.add_argument("--full", action="store_true", help="Ignore the previous index and re-embed everything")
+    parser.add_argument("--workers", type=int, default=None, help="Parser processes (default: CPU count)")
+    parser.add_argument("--batch-size", type=int, default=100, help="Chunks embedded per request")
+    parser.add_argument("--concurrency", type=int, default=4, help="Maximum embedding requests in flight")
+    parser.add_argument("--index-type", choices=INDEX_TYPES, default="flat", help="ANN index to build")
+    parser.add_argument("--nlist", type=int, default=None, help="IVF/IVFPQ: number of lists (default 4*sqrt(n))")
+    parser.add_argument("--nprobe", type=int, default=None, help="IVF/IVFPQ: lists searched per query")
+    parser.add_argument("--hnsw-m", type=int, default=None, help="HNSW: neighbours per node")
+    parser.add_argument("--ef-search", type=int, default=None, help="HNSW: search beam width")
+    parser.add_argument("--pq-m", type=int, default=None, help="IVFPQ: sub-quantizers (code size in bytes at 8 bits)")
+    parser.add_argument("--pq-bits", type=int, default=None, help="IVFPQ: bits per sub-quantizer code")
+    parser.add_argument("--dedup-threshold", type=float, default=DEFAULT_THRESHOLD,
+                        help="Collapse chunks at least this similar (estimated Jaccard of word trigrams) into one vector; 0 keeps all")
+    parser.add_argument("--embedding-backend", choices=EMBEDDING_BACKENDS, default=EMBEDDING_BACKEND,
+                        help="gemini (remote API) or tfidf (local TF-IDF + SVD fitted on data/, works offline)")
+    parser.add_argument("--embedding-dimension", type=int, default=TFIDF_DIMENSION, help="tfidf: vector dimension when fitting")
+    parser.add_argument("--refit", action="store_true",
+                        help="tfidf: refit the model on the current corpus (re-embeds everything)")
+    parser.add_argument("--page-cache", default=PAGE_CACHE_PATH,
+                        help="Parsed-page cache; only new or modified PDFs are parsed again ('' to always parse)")
+    parser.add_argument("--checkpoint", default="vector_store/embedding_checkpoint.sqlite3",
+                        help="Where finished vectors are kept so an interrupted build can resume")
+    args = parser.parse_args()
 
-# Load Documents from a folder
-data_path = "data"  # Use relative path
-if not os.path.exists(data_path):
-    raise FileNotFoundError(f"Directory '{data_path}' not found. Place your documents there.")
+    # Load API Key
+    load_dotenv()
+    api_key = os.getenv("GOOGLE_API_KEY")
 
-print(f"Current working directory: {os.getcwd()}")
-print(f"Looking for documents in: {os.path.abspath(data_path)}")
+    if args.embedding_backend == "gemini" and not api_key:
+        raise ValueError("Google API Key not found. Please set it in your .env file.")
 
-# Try to load PDF files directly
-documents = []
-pdf_files = [f for f in os.listdir(data_path) if f.endswith('.pdf')]
-print(f"Found {len(pdf_files)} PDF files")
+    # Load Documents from a folder
+    data_path = "data"  # Use relative path
+    if not os.path.exists(data_path):
+        raise FileNotFoundError(f"Directory '{data_path}' not found. Place your documents there.")
 
-for pdf_file in pdf_files[:3]:  # Start with just a few files to test
-    try:
-        pdf_path = os.path.join(data_path, pdf_file)
-        print(f"Loading PDF: {pdf_path}")
-        loader = PyPDFLoader(pdf_path)
-        pdf_docs = loader.load()
-        print(f"  - Loaded {len(pdf_docs)} pages from {pdf_file}")
-        documents.extend(pdf_docs)
-    except Exception as e:
-        print(f"Error loading {pdf_file}: {e}")
+    print(f"Current working directory: {os.getcwd()}")
+    print(f"Looking for documents in: {os.path.abspath(data_path)}")
 
-if not documents:
-    print("No documents were loaded. Trying DirectoryLoader as fallback...")
-    try:
-        loader = DirectoryLoader(data_path, glob="**/*.pdf")
-        documents = loader.load()
-        print(f"Loaded {len(documents)} documents with DirectoryLoader")
-    except Exception as e:
-        print(f"DirectoryLoader failed: {e}")
+    # Parse PDF/TXT/CSV files across a process pool; chunks stream straight into embedding
+    data_files = list_data_files(data_path)
+    print(f"Found {len(data_files)} documents")
+    if not data_files:
+        print("ERROR: No documents were found. Check your data directory and file formats.")
+        sys.exit(1)
 
-# Exit if no documents loaded
-if not documents:
-    print("ERROR: No documents were loaded. Check your data directory and file formats.")
-    sys.exit(1)
+    def load_files(paths):
+        return iter_file_chunks(paths, chunk_size=CHUNK_SIZE, chunk_overlap=CHUNK_OVERLAP, workers=args.workers,
+                                page_cache=args.page_cache)
 
-# Split documents into smaller chunks
-print(f"Splitting {len(documents)} documents into chunks...")
-text_splitter = RecursiveCharacterTextSplitter(chunk_size=500, chunk_overlap=100)
-docs = text_splitter.split_documents(documents)
-print(f"Split into {len(docs)} chunks")
+    # Generate Embeddings - with error handling
+    try:
+        if args.embedding_backend == "tfidf" and (args.refit or not os.path.exists(TFIDF_MODEL_PATH)):
+            # The local model is fitted on our own chunks; the index build below re-splits
+            # them from the page cache (vectors from an older fit are replaced automatically)
+            print("Fitting local TF-IDF + SVD embeddings on the corpus...")
+            texts = [doc.page_content for _, chunks, _ in load_files(data_files) for doc in chunks]
+            fit_tfidf_model(texts, TFIDF_MODEL_PATH, args.embedding_dimension)
 
-# Check if docs are empty
-if not docs:
-    print("ERROR: No text chunks were created after splitting. Check your documents.")
-    sys.exit(1)
+        print(f"Initializing {args.embedding_backend} embedding model...")
+        embeddings = get_embedding_backend(args.embedding_backend)
+        
+        # Test with a single embedding first
+        print("Testing embedding generation...")
+        test_embedding = embeddings.embed_query("Agriculture test")
+        print(f"Test embedding successful, vector length: {len(test_embedding)}")
+        
+        # Batched, rate-limit-aware embedding; finished batches are checkpointed to disk
+        stage = EmbeddingStage(
+            embeddings,
+            checkpoint=EmbeddingCheckpoint(args.checkpoint, namespace=embeddings.model),
+            batch_size=args.batch_size,
+            max_concurrency=args.concurrency,
+        )
+
+        # Create or update the FAISS Index; only new or changed chunks are embedded
+        index_path = "vector_store/faiss_index"
+        report = update_index(
+            data_files,
+            load_files,
+            embeddings,
+            index_path,
+            settings={"chunk_size": CHUNK_SIZE, "chunk_overlap": CHUNK_OVERLAP, "dedup_threshold": args.dedup_threshold},
+            full=args.full,
+            embedding_stage=stage,
+            dedup_threshold=args.dedup_threshold,
+            index_config={
+                "type": args.index_type,
+                "nlist": args.nlist,
+                "nprobe": args.nprobe,
+                "M": args.hnsw_m,
+                "ef_search": args.ef_search,
+                "pq_m": args.pq_m,
+                "pq_bits": args.pq_bits,
+            },
+        )
+        print_report(report)
+        
+        print("✅ FAISS Index successfully created and saved!")
+    except Exception as e:
+        print(f"ERROR during embedding or indexing: {e}")
+        print("Vectors embedded so far are checkpointed; re-run to resume.")
+        import traceback
+        traceback.print_exc()
+        sys.exit(1)
 
-# Generate Embeddings - with error handling
-try:
-    print("Initializing embedding model...")
-    embeddings = GoogleGenerativeAIEmbeddings(model="models/embedding-001")
-    
-    # Test with a single embedding first
-    print("Testing embedding generation...")
-    test_embedding = embeddings.embed_query("Agriculture test")
-    print(f"Test embedding successful, vector length: {len(test_embedding)}")
-    
-    # Create FAISS Index
-    print(f"Creating FAISS index for {len(docs)} documents...")
-    faiss_index = FAISS.from_documents(docs, embeddings)
-    
-    # Save the FAISS Index
-    index_path = "vector_store/faiss_index"
-    os.makedirs(index_path, exist_ok=True)
-    faiss_index.save_local(index_path)
-    
-    print("✅ FAISS Index successfully created and saved!")
-except Exception as e:
-    print(f"ERROR during embedding or indexing: {e}")
-    import traceback
-    traceback.print_exc()
-    sys.exit(1)
\ No newline at end of file
+# Guarded so the ingestion worker processes can import this module safely
+if __name__ == "__main__":
+    main()
@@ -1,36 +1,99 @@
+import asyncio
+import atexit
 import os
+import threading
+import time
+import numpy as np
 from dotenv import load_dotenv
 
-# Import Google Generative AI
-from langchain_google_genai import GoogleGenerativeAI, GoogleGenerativeAIEmbeddings
+# The Gemini clients and RetrievalQA are imported where they are first built:
+# they are the slowest imports here and nothing needs them until a question arrives.
+from langchain_core.prompts import PromptTemplate
 
-# Import FAISS and RetrievalQA
-from langchain_community.vectorstores import FAISS
-from langchain.chains import RetrievalQA
-from langchain.prompts import PromptTemplate
+from scripts.admission import LLM_DEADLINE_SECONDS, DeadlineExceeded, with_deadline
+from scripts.context_packing import pack_context
+from scripts.embedding_backends import EMBEDDING_BACKEND, get_embedding_backend
+from scripts.embedding_cache import CachedEmbeddings, aembed_query_batch, normalize_query
+from scripts.lexical_index import load_lexical_index, reciprocal_rank_fusion
+from scripts.llm_client import get_llm as get_shared_llm
+from scripts.metrics import register_stats, trace_request
+from scripts.reranking import mmr_select
+from scripts.semantic_cache import SemanticCache
+from scripts.shards import load_shards, load_topics
+from scripts.single_flight import AsyncSingleFlight, SingleFlight
+from scripts.vector_index import VECTORS_FILE, index_version as read_index_version, load_index, load_vectors, resolve_index_folder
 
 # Load API key from environment variables
 load_dotenv()
 api_key = os.getenv("GOOGLE_API_KEY")
 
-if not api_key:
-    raise ValueError("Google API Key not found. Please set it in your .env file.")
-
-# Ensure FAISS Index Exists
 faiss_path = "vector_store/faiss_index"
-if not os.path.exists(f"{faiss_path}/index.faiss"):
-    raise FileNotFoundError(f"FAISS index file not found at: {faiss_path}/index.faiss. Please create the FAISS index first.")
+TOP_K = 5
+
+# index.faiss is memory-mapped read-only so uvicorn workers share one copy of the
+# vectors; every INDEX_RELOAD_INTERVAL seconds the live version is checked and a
+# newly published index is swapped in (0 disables the check)
+INDEX_MMAP = os.getenv("INDEX_MMAP", "1") == "1"
+INDEX_RELOAD_INTERVAL = float(os.getenv("INDEX_RELOAD_INTERVAL", "5"))
+
+# Hybrid retrieval: BM25 keyword hits are fused with vector hits (reciprocal rank
+# fusion). Short keyword queries that every top BM25 hit matches in full skip
+# the embedding call altogether.
+HYBRID_SEARCH_ENABLED = os.getenv("HYBRID_SEARCH_ENABLED", "1") == "1"
+HYBRID_FETCH_K = int(os.getenv("HYBRID_FETCH_K", "20"))
+RRF_K = int(os.getenv("RRF_K", "60"))
+LEXICAL_FAST_PATH_ENABLED = os.getenv("LEXICAL_FAST_PATH_ENABLED", "1") == "1"
+LEXICAL_FAST_PATH_MAX_TERMS = int(os.getenv("LEXICAL_FAST_PATH_MAX_TERMS", "4"))
+LEXICAL_FAST_PATH_MIN_HITS = int(os.getenv("LEXICAL_FAST_PATH_MIN_HITS", "3"))
+
+# Retrieval mode: "similarity" (vector + BM25 fusion) or "mmr", which over-fetches
+# MMR_FETCH_K candidates and re-ranks them for diversity using their stored vectors.
+# All of these can be overridden per request (see retrieval_options).
+SEARCH_TYPES = ("similarity", "mmr")
+RETRIEVAL_MODE = os.getenv("RETRIEVAL_MODE", "similarity")
+MMR_FETCH_K = int(os.getenv("MMR_FETCH_K", "30"))
+MMR_LAMBDA = float(os.getenv("MMR_LAMBDA", "0.5"))
+MMR_MAX_PER_SOURCE = int(os.getenv("MMR_MAX_PER_SOURCE", "0"))
+
+# Indexes are also split into per-source shards. Questions whose words match a
+# topic's keywords (topics.json) only search that topic's shards; a request can
+# instead name a topic or sources explicitly (see retrieval_options).
+SHARD_ROUTING_ENABLED = os.getenv("SHARD_ROUTING_ENABLED", "1") == "1"
+
+# Semantic answer cache: near-duplicate questions reuse an earlier answer
+answer_cache = SemanticCache(
+    threshold=float(os.getenv("SEMANTIC_CACHE_THRESHOLD", "0.95")),
+    max_entries=int(os.getenv("SEMANTIC_CACHE_SIZE", "1000")),
+    ttl_seconds=float(os.getenv("SEMANTIC_CACHE_TTL", "86400")),
+    path=os.getenv("SEMANTIC_CACHE_PATH", "vector_store/semantic_cache.npz"),
+)
+SEMANTIC_CACHE_ENABLED = os.getenv("SEMANTIC_CACHE_ENABLED", "1") == "1"
+if SEMANTIC_CACHE_ENABLED:
+    answer_cache.load()
+    atexit.register(answer_cache.save)
+
+# Query vectors are memoized in memory and in a SQLite file shared by all workers
+EMBEDDING_CACHE_ENABLED = os.getenv("EMBEDDING_CACHE_ENABLED", "1") == "1"
+EMBEDDING_CACHE_PATH = os.getenv("EMBEDDING_CACHE_PATH", "cache/query_embeddings.sqlite3")
+EMBEDDING_CACHE_MEMORY_SIZE = int(os.getenv("EMBEDDING_CACHE_MEMORY_SIZE", "10000"))
+
+# Retrieved chunks are merged, de-duplicated and packed into a token budget before the LLM call
+CONTEXT_PACKING_ENABLED = os.getenv("CONTEXT_PACKING_ENABLED", "1") == "1"
+CONTEXT_TOKEN_BUDGET = int(os.getenv("CONTEXT_TOKEN_BUDGET", "1500"))
+_context_totals = {"requests": 0, "tokens_in": 0, "tokens_out": 0, "tokens_saved": 0}
 
-# Load FAISS Index with deserialization enabled
-embeddings = GoogleGenerativeAIEmbeddings(model="models/embedding-001")
-db = FAISS.load_local(faiss_path, embeddings, allow_dangerous_deserialization=True)
+# Identical questions asked concurrently share one retrieval + LLM call
+COALESCE_ENABLED = os.getenv("COALESCE_ENABLED", "1") == "1"
+_ask_flight = SingleFlight()
+_aask_flight = AsyncSingleFlight()
 
-# Create Retriever with similarity search
-retriever = db.as_retriever(search_type="similarity", search_kwargs={"k": 5})
+# Concurrent LLM generations within one /ask/batch request
+BATCH_LLM_CONCURRENCY = int(os.getenv("BATCH_LLM_CONCURRENCY", "4"))
 
-# Initialize Google Gemini AI Model
-# llm = GoogleGenerativeAI(model="gemini-1.0-pro")
-llm = GoogleGenerativeAI(model="gemini-1.5-flash", api_key=api_key)
+# When the LLM misses its deadline (LLM_DEADLINE_SECONDS), answer with the
+# retrieved passages and their sources instead of an error
+LLM_FALLBACK_ENABLED = os.getenv("LLM_FALLBACK_ENABLED", "1") == "1"
+FALLBACK_PASSAGE_CHARS = 600
 
 # Define the Prompt Template
 prompt_template = """
@@ -56,44 +119,925 @@ Your helpful response:
 
 PROMPT = PromptTemplate(template=prompt_template, input_variables=["context", "question"])
 
-# Create RAG-based Chatbot with RetrievalQA
-qa_chain = RetrievalQA.from_chain_type(
-    llm=llm,
-    retriever=retriever,
-    return_source_documents=True,
-    chain_type_kwargs={"prompt": PROMPT},
-    chain_type="stuff"  # Add this to explicitly use the StuffDocumentsChain
-)
+# The LLM, embeddings, FAISS index and chain are built on first use so that
+# tests can inject local fakes through configure() before anything touches Gemini.
+# _lock is held for a whole index load, so coroutines never take it: they read
+# the references below (each replaced in one assignment) and leave loading to
+# worker threads.
+_lock = threading.RLock()
+_clients_lock = threading.Lock()
+_reload_lock = threading.Lock()
+_stats_lock = threading.Lock()
+_llm = None
+_embeddings = None
+_stores = None  # (FAISS store, keyword index, stored vectors, shards) of one index version
+_db_version = None
+_db_checked_at = 0.0
+_qa_chain = None
+
+# Warm-up state reported by readiness(); timings are in seconds
+WARMUP_QUERY = os.getenv("WARMUP_QUERY", "How do I improve soil quality naturally?")
+startup_timings = {}
+_warmup = {"index_loaded": False, "chain_warmed": False, "error": None}
+
+
+def configure(llm=None, embeddings=None):
+    """
+    Replace the LLM and/or embedding clients used by the chatbot.
+
+    Anything not passed keeps its current value (or the Gemini default when it
+    is first needed). The index and chain are rebuilt on the next question.
+
+    Args:
+        llm (BaseLLM, optional): LangChain LLM used to generate answers
+        embeddings (Embeddings, optional): LangChain embeddings used for FAISS queries
+    """
+    global _llm, _embeddings, _stores, _qa_chain
+    with _lock:
+        if llm is not None:
+            _llm = llm
+            _qa_chain = None
+        if embeddings is not None:
+            _embeddings = embeddings
+            _stores = _qa_chain = None
+
+
+def get_llm():
+    """Return the configured LLM, defaulting to the pooled Gemini client shared with the seasonal advice."""
+    global _llm
+    if _llm is not None:
+        return _llm
+    with _clients_lock:
+        if _llm is None:
+            _llm = get_shared_llm()
+        return _llm
+
+
+def get_embeddings():
+    """Return the configured embeddings, creating the EMBEDDING_BACKEND client on first use."""
+    global _embeddings
+    if _embeddings is not None:
+        return _embeddings
+    with _clients_lock:
+        if _embeddings is None:
+            if EMBEDDING_BACKEND == "gemini" and not api_key:
+                raise ValueError("Google API Key not found. Please set it in your .env file.")
+            _embeddings = get_embedding_backend(EMBEDDING_BACKEND)
+            # Local embeddings take microseconds, less than a cache lookup
+            if EMBEDDING_CACHE_ENABLED and EMBEDDING_BACKEND == "gemini":
+                _embeddings = CachedEmbeddings(_embeddings, EMBEDDING_CACHE_PATH, EMBEDDING_CACHE_MEMORY_SIZE)
+        return _embeddings
+
+
+def get_db():
+    """
+    Load the FAISS index on first use and return it.
+
+    A newly published index replaces the loaded one after the next version check.
+    Requests already running keep the store they started with, so nothing in
+    flight is dropped during the swap.
+    """
+    return _get_stores()[0]
+
+
+def _get_stores():
+    """
+    Returns:
+        tuple: The FAISS store, keyword index, stored vectors and shards of the
+        same index version, (re)loaded if needed
+    """
+    global _stores, _db_version, _db_checked_at, _qa_chain
+    with _lock:
+        now = time.monotonic()
+        if _stores is not None and (INDEX_RELOAD_INTERVAL <= 0 or now - _db_checked_at < INDEX_RELOAD_INTERVAL):
+            return _stores
+        _db_checked_at = now
+
+        try:
+            version = index_version()
+        except FileNotFoundError:
+            version = None  # load_index raises a helpful error below
+        if _stores is not None and version == _db_version:
+            return _stores
+
+        try:
+            # Load FAISS Index; the index and chunk texts are memory-mapped and shared between workers
+            folder = resolve_index_folder(faiss_path)
+            db = load_index(folder, get_embeddings(), mmap=INDEX_MMAP)
+            lexical = load_lexical_index(folder) if HYBRID_SEARCH_ENABLED else None
+            # Exact vectors (memory-mapped) for MMR; indexes saved before vectors.npy fall back to reconstruct()
+            vectors = load_vectors(folder) if os.path.exists(os.path.join(folder, VECTORS_FILE)) else None
+            shards = load_shards(folder, db.docstore.source_ids, mmap=INDEX_MMAP)
+        except Exception as e:
+            if _stores is None:
+                raise
+            print(f"Could not load FAISS index version {version}, still serving {_db_version}: {e}")
+            return _stores
+        if _stores is not None:
+            print(f"Loaded new FAISS index version {version} (was {_db_version})")
+        _stores, _db_version, _qa_chain = (db, lexical, vectors, shards), version, None
+
+        # Cached answers are only valid for the index they were generated from
+        answer_cache.set_index_version(version)
+        return _stores
+
+
+async def _aget_stores():
+    """
+    _get_stores() for coroutines, without blocking the event loop.
+
+    Loaded stores are returned right away; a due version check (and any reload)
+    runs in a background thread and later requests pick up the new version.
+    Only the first load is waited for, in a worker thread.
+    """
+    stores = _stores
+    if stores is None:
+        return await asyncio.to_thread(_get_stores)
+    if INDEX_RELOAD_INTERVAL > 0 and time.monotonic() - _db_checked_at >= INDEX_RELOAD_INTERVAL:
+        _reload_in_background()
+    return stores
+
+
+def _reload_in_background():
+    # One check at a time; requests that find one running don't start another
+    if not _reload_lock.acquire(blocking=False):
+        return
+
+    def reload():
+        try:
+            _get_stores()
+        except Exception as e:
+            print(f"Background index check failed: {type(e).__name__}: {e}")
+        finally:
+            _reload_lock.release()
+
+    threading.Thread(target=reload, name="index-reload", daemon=True).start()
+
+
+async def _aget_qa_chain():
+    # The chain is rebuilt after an index swap; that needs _lock, so it happens in a worker thread
+    chain = _qa_chain
+    if chain is None:
+        chain = await asyncio.to_thread(get_qa_chain)
+    return chain
+
+
+def reload_index():
+    """Check for a newly published index right away instead of waiting for the next interval."""
+    global _db_checked_at
+    with _lock:
+        _db_checked_at = 0.0
+    return get_db()
+
+
+def index_version():
+    """
+    Fingerprint of the live FAISS index on disk; changes whenever the index is rebuilt.
+
+    Returns:
+        str: Published version name (or file stats of an unversioned index)
+    """
+    return read_index_version(faiss_path)
+
+
+def invalidate_answer_cache():
+    """Drop all cached answers, e.g. after rebuilding the FAISS index."""
+    answer_cache.invalidate()
+    answer_cache.save()
+
+
+def get_retriever():
+    """Return a similarity retriever over the FAISS index."""
+    # Create Retriever with similarity search
+    return get_db().as_retriever(search_type="similarity", search_kwargs={"k": TOP_K})
+
+
+def get_qa_chain():
+    """Return the RAG chain, building it from the current LLM and index if needed."""
+    global _qa_chain
+    with _lock:
+        if _qa_chain is None:
+            from langchain.chains import RetrievalQA
+
+            # Create RAG-based Chatbot with RetrievalQA
+            _qa_chain = RetrievalQA.from_chain_type(
+                llm=get_llm(),
+                retriever=get_retriever(),
+                return_source_documents=True,
+                chain_type_kwargs={"prompt": PROMPT},
+                chain_type="stuff"  # Add this to explicitly use the StuffDocumentsChain
+            )
+        return _qa_chain
+
+
+def warm_up(query=None):
+    """
+    Load the index, build the chain and run one retrieval so the first real
+    question does not pay for any of it. Safe to call from a background thread.
+
+    Args:
+        query (str, optional): Question embedded and searched as the first query;
+            defaults to WARMUP_QUERY. An empty string skips the first query.
+
+    Returns:
+        dict: Seconds spent on "index_load", "chain" and "first_query"
+    """
+    query = WARMUP_QUERY if query is None else query
+    try:
+        started = time.perf_counter()
+        db = get_db()
+        startup_timings["index_load"] = round(time.perf_counter() - started, 3)
+        _warmup["index_loaded"] = True
+
+        started = time.perf_counter()
+        get_qa_chain()
+        startup_timings["chain"] = round(time.perf_counter() - started, 3)
+
+        if query:
+            # Retrieval only: warms the embeddings client and the index pages without spending LLM tokens
+            started = time.perf_counter()
+            db.similarity_search_by_vector(get_embeddings().embed_query(query), k=TOP_K)
+            startup_timings["first_query"] = round(time.perf_counter() - started, 3)
+        _warmup["chain_warmed"] = True
+        _warmup["error"] = None
+    except Exception as e:
+        _warmup["error"] = f"{type(e).__name__}: {e}"
+        raise
+    return dict(startup_timings)
+
+
+def readiness():
+    """
+    Returns:
+        dict: "ready" plus whether the index is loaded, the chain is warmed,
+        the last warm-up error and the startup timings
+    """
+    return {
+        "ready": _warmup["index_loaded"] and _warmup["chain_warmed"],
+        **_warmup,
+        "timings": dict(startup_timings),
+    }
+
+
+def coalescing_stats():
+    """
+    Returns:
+        dict: Single-flight counters for sync and async questions; "coalesced" is the number of saved calls
+    """
+    return {"sync": _ask_flight.stats(), "async": _aask_flight.stats()}
+
 
-def ask_chatbot(question):
+def format_sources(docs):
+    """
+    Build the de-duplicated list of source references for retrieved documents.
+
+    Args:
+        docs (list): Retrieved Document objects
+
+    Returns:
+        list: Strings like "file.pdf (Page 3)", in retrieval order
+    """
+    sources = []
+    for doc in docs:
+        # Chunks collapsed from near-duplicates list every place the passage appears
+        for place in doc.metadata.get("sources") or [doc.metadata]:
+            source = place.get("source") or "Unknown"
+            page = place.get("page", "")
+            source_info = f"{source} (Page {page})" if page else source
+
+            if source_info not in sources:
+                sources.append(source_info)
+    return sources
+
+
+def _sources_markdown(sources):
+    if not sources:
+        return ""
+    return "\n\n**Sources:**" + "".join(f"\n- {source_info}" for source_info in sources)
+
+
+def _retrieval_only_answer(docs):
+    """
+    Answer without the LLM: the retrieved passages, shortened (sources not included).
+
+    Returns:
+        str: Markdown answer text
+    """
+    passages = []
+    for doc in docs:
+        text = " ".join(doc.page_content.split())
+        if len(text) > FALLBACK_PASSAGE_CHARS:
+            text = text[:FALLBACK_PASSAGE_CHARS].rsplit(" ", 1)[0] + " ..."
+        passages.append(f"> {text}")
+    return ("The AI assistant is taking too long to respond right now, so here are the most relevant "
+            "passages from our agricultural resources:\n\n" + "\n\n".join(passages))
+
+
+def _build_prompt(question, docs):
+    # Same layout the "stuff" chain produces: page contents joined by blank lines
+    context = "\n\n".join(doc.page_content for doc in docs)
+    return PROMPT.format(context=context, question=question)
+
+
+def _lexical_fast_path(db, lexical, question, selection=None):
+    """
+    Retrieve chunks for a keyword-style question from the BM25 index alone.
+
+    Args:
+        selection (ShardSelection, optional): Only return chunks of these shards
+
+    Returns:
+        list or None: Documents when the question has at most LEXICAL_FAST_PATH_MAX_TERMS
+        terms, all of them known, and at least LEXICAL_FAST_PATH_MIN_HITS chunks contain
+        every one of them; None when vector search is needed.
+    """
+    if lexical is None or not LEXICAL_FAST_PATH_ENABLED:
+        return None
+    terms, known = lexical.query_terms(question)
+    if not terms or len(terms) > LEXICAL_FAST_PATH_MAX_TERMS or known < len(terms):
+        return None
+    allowed = selection.mask if selection is not None else None
+    rows = [row for row, _, matched in lexical.search(question, k=TOP_K, allowed=allowed) if matched == len(terms)]
+    if len(rows) < min(LEXICAL_FAST_PATH_MIN_HITS, TOP_K):
+        return None
+    return [db.docstore.get(row) for row in rows]
+
+
+def _fetch_k(lexical):
+    # Fusion needs a deeper vector ranking than the final TOP_K
+    return HYBRID_FETCH_K if lexical is not None else TOP_K
+
+
+def _fuse(db, lexical, question, vector_docs, selection=None):
+    """
+    Merge vector hits with BM25 hits by reciprocal rank fusion.
+
+    Args:
+        selection (ShardSelection, optional): Only take keyword hits from these shards
+
+    Returns:
+        list: The TOP_K best Documents
+    """
+    if lexical is None:
+        return vector_docs[:TOP_K]
+    docs = {doc.id: doc for doc in vector_docs}
+    allowed = selection.mask if selection is not None else None
+    keyword_rows = {db.docstore.chunk_id(row): row for row, _, _ in lexical.search(question, k=HYBRID_FETCH_K, allowed=allowed)}
+    fused = reciprocal_rank_fusion([list(docs), list(keyword_rows)], k=RRF_K)[:TOP_K]
+    return [docs[cid] if cid in docs else db.docstore.get(keyword_rows[cid]) for cid in fused]
+
+
+def retrieval_options(search_type=None, fetch_k=None, lambda_mult=None, max_per_source=None, topic=None, sources=None):
+    """
+    Complete and validate per-request retrieval settings.
+
+    Args:
+        search_type (str, optional): "similarity" or "mmr"; defaults to RETRIEVAL_MODE
+        fetch_k (int, optional): MMR candidate pool size; defaults to MMR_FETCH_K
+        lambda_mult (float, optional): MMR relevance/diversity trade-off (1 = relevance only)
+        max_per_source (int, optional): MMR cap on chunks from one source file (0 = no cap)
+        topic (str, optional): Only search the sources of this topic from topics.json
+        sources (list, optional): Only search source files whose names contain one of these
+
+    Returns:
+        dict: Settings with every key filled in
+    """
+    options = {
+        "search_type": search_type or RETRIEVAL_MODE,
+        "fetch_k": fetch_k or MMR_FETCH_K,
+        "lambda_mult": MMR_LAMBDA if lambda_mult is None else lambda_mult,
+        "max_per_source": MMR_MAX_PER_SOURCE if max_per_source is None else max_per_source,
+        "topic": topic or None,
+        "sources": tuple(sorted({source.strip() for source in sources or () if source.strip()})) or None,
+    }
+    if options["search_type"] not in SEARCH_TYPES:
+        raise ValueError(f"Unknown search_type '{options['search_type']}'. Choose one of: {', '.join(SEARCH_TYPES)}")
+    if not 0 <= options["lambda_mult"] <= 1:
+        raise ValueError("lambda_mult must be between 0 and 1")
+    if options["fetch_k"] < TOP_K or options["max_per_source"] < 0:
+        raise ValueError(f"fetch_k must be at least {TOP_K} and max_per_source must not be negative")
+    if options["topic"] and options["topic"] not in load_topics():
+        raise ValueError(f"Unknown topic '{options['topic']}'. Choose one of: {', '.join(load_topics())}")
+    if options["sources"]:
+        # Unknown file names are an error rather than a silently empty search
+        _, _, _, shards = _stores or _get_stores()
+        if shards is not None:
+            shards.matching(options["sources"])
+    return options
+
+
+async def aretrieval_options(search_type=None, fetch_k=None, lambda_mult=None, max_per_source=None, topic=None, sources=None):
+    """retrieval_options() for coroutines: checking sources needs the index, which is loaded off the event loop."""
+    if sources:
+        await _aget_stores()
+    return retrieval_options(search_type, fetch_k, lambda_mult, max_per_source, topic, sources)
+
+
+def topics():
+    """
+    Returns:
+        dict: {topic name: source file name parts} from topics.json
+    """
+    return {name: topic["sources"] for name, topic in load_topics().items()}
+
+
+def _route(shards, question, options):
+    """
+    Pick the shards a question is searched in.
+
+    Returns:
+        ShardSelection or None: None searches the whole index
+    """
+    if shards is None:
+        if options["topic"] or options["sources"]:
+            raise ValueError("The FAISS index has no shards to filter by topic or source; rebuild it with build_faiss.py.")
+        return None
+    if not (SHARD_ROUTING_ENABLED or options["topic"] or options["sources"]):
+        return None
+    # Routing decisions are counted per reason in shard_stats()
+    return shards.select(question, options["topic"], options["sources"])
+
+
+def _search_rows(db, queries, k, selection=None):
+    # FAISS rows of the nearest chunks: in the routed shards, or the whole index
+    queries = np.asarray(queries, dtype=np.float32)
+    if selection is None:
+        return db.index.search(queries, k)
+    return selection.search(queries, k)
+
+
+def _mmr_retrieve(db, vectors, vector, options, selection=None):
+    """
+    Over-fetch candidates from FAISS and re-rank them with MMR, using the
+    candidates' stored vectors (no re-embedding).
+
+    Returns:
+        list: The TOP_K picked Documents
+    """
+    _, rows = _search_rows(db, [vector], options["fetch_k"], selection)
+    rows = rows[0][rows[0] != -1]
+    if vectors is not None:
+        candidates = vectors[rows]
+    else:
+        candidates = np.vstack([db.index.reconstruct(int(row)) for row in rows])
+    picked = mmr_select(vector, candidates, TOP_K, options["lambda_mult"],
+                        groups=db.docstore.source_ids[rows], max_per_group=options["max_per_source"])
+    return [db.docstore.get(int(rows[i])) for i in picked]
+
+
+def _retrieve(db, lexical, vectors, question, vector, options=None, selection=None):
+    options = options or retrieval_options()
+    if options["search_type"] == "mmr":
+        return _mmr_retrieve(db, vectors, vector, options, selection)
+    if selection is not None:
+        return _fuse(db, lexical, question, _search_batch(db, [vector], _fetch_k(lexical), selection)[0], selection)
+    return _fuse(db, lexical, question, db.similarity_search_by_vector(vector, k=_fetch_k(lexical)))
+
+
+async def _aretrieve(db, lexical, vectors, question, vector, options=None, selection=None):
+    options = options or retrieval_options()
+    if options["search_type"] == "mmr":
+        # A single small FAISS search plus a 30x30 matrix product; cheaper inline than in a thread
+        return _mmr_retrieve(db, vectors, vector, options, selection)
+    if selection is not None:
+        hits = await asyncio.to_thread(_search_batch, db, [vector], _fetch_k(lexical), selection)
+        return _fuse(db, lexical, question, hits[0], selection)
+    return _fuse(db, lexical, question, await db.asimilarity_search_by_vector(vector, k=_fetch_k(lexical)))
+
+
+def _pack_context(docs):
+    """Pack retrieved chunks for the prompt and record how many tokens that saved."""
+    if not CONTEXT_PACKING_ENABLED:
+        return docs
+    packed, report = pack_context(docs, CONTEXT_TOKEN_BUDGET)
+    with _stats_lock:
+        _context_totals["requests"] += 1
+        for key in ("tokens_in", "tokens_out", "tokens_saved"):
+            _context_totals[key] += report[key]
+    return packed
+
+
+def context_stats():
+    """
+    Returns:
+        dict: Totals over all packed requests: requests, tokens_in, tokens_out, tokens_saved
+    """
+    with _stats_lock:
+        return dict(_context_totals)
+
+
+def shard_stats():
+    """
+    Returns:
+        dict or None: Shard count, shards loaded and routing decisions; None without shards
+    """
+    stores = _stores
+    shards = stores[3] if stores is not None else None
+    return shards.stats() if shards is not None else None
+
+
+def index_stats():
+    """
+    Returns:
+        dict or None: Chunk count and size on disk (bytes) of the live index; None until it is loaded
+    """
+    stores = _stores
+    if stores is None:
+        return None
+    db = stores[0]
+    folder = resolve_index_folder(faiss_path)
+    size = sum(entry.stat().st_size for entry in os.scandir(folder) if entry.is_file())
+    return {"chunks": db.index.ntotal, "bytes": size}
+
+
+# Exported on /metrics next to the request and stage latency histograms
+register_stats("semantic_cache", "Semantic answer cache", lambda: answer_cache.stats() if SEMANTIC_CACHE_ENABLED else None)
+register_stats("embedding_cache", "Query embedding cache",
+               lambda: _embeddings.stats() if isinstance(_embeddings, CachedEmbeddings) else None)
+register_stats("index", "Loaded FAISS index", index_stats)
+register_stats("shards", "Per-source index shards", shard_stats)
+register_stats("context", "Context packing totals", context_stats)
+register_stats("ask_coalescing", "Question coalescing", coalescing_stats)
+
+
+def _cacheable(options):
+    # Answers are cached by question alone, so only answers retrieved with the default
+    # settings (no filters, the configured search type and MMR settings) use the cache
+    return SEMANTIC_CACHE_ENABLED and (not options or options == retrieval_options())
+
+
+def _lookup_cache(vector, options=None):
+    if not _cacheable(options):
+        return None
+    cached = answer_cache.lookup(vector)
+    # Empty answers stored before they were rejected count as a miss
+    return cached if cached and cached["answer"].strip() else None
+
+
+def _store_cache(question, vector, answer, sources, options=None):
+    # Lexical fast-path answers have no query vector to key them on, and an empty
+    # (failed or aborted) answer would be served to every similar question
+    if _cacheable(options) and vector is not None and answer.strip():
+        answer_cache.store(question, vector, answer, sources)
+
+
+def _flight_key(question, options):
+    return normalize_query(question), tuple(sorted(options.items()))
+
+
+def _match(question, options, trace, stores):
+    # Shard routing and the keyword fast path; docs is None when vector search is needed
+    db, lexical, _, shards = stores
+    with trace.stage("route"):
+        selection = _route(shards, question, options)
+    with trace.stage("lexical_search"):
+        docs = _lexical_fast_path(db, lexical, question, selection)
+    return selection, docs
+
+
+def _cached_answer(vector, options, trace):
+    with trace.stage("cache_lookup"):
+        cached = _lookup_cache(vector, options)
+    if cached:
+        trace.outcome = "cache_hit"
+    return cached
+
+
+def _packed(question, docs, vector, trace):
+    with trace.stage("prompt"):
+        docs = _pack_context(docs)
+        prompt = _build_prompt(question, docs)
+    return {"docs": docs, "prompt": prompt, "vector": vector, "cached": None}
+
+
+def _prepare(question, options, trace):
+    """
+    Retrieve and pack the context of a question: shard routing, the keyword fast
+    path, embedding, the semantic cache and vector search. _aprepare is the same
+    sequence for coroutines.
+
+    Returns:
+        dict: "docs" (packed context), "prompt", "vector" (None on the keyword fast
+        path) and "cached" (the semantic cache entry on a hit, with no docs)
+    """
+    stores = _get_stores()
+    db, lexical, vectors, _ = stores
+    selection, docs = _match(question, options, trace, stores)
+    vector = None
+    if docs is None:
+        # Embed once: the vector serves both the cache lookup and the FAISS search
+        with trace.stage("embed"):
+            vector = get_embeddings().embed_query(question)
+        cached = _cached_answer(vector, options, trace)
+        if cached:
+            return {"docs": [], "prompt": None, "vector": vector, "cached": cached}
+        with trace.stage("search"):
+            docs = _retrieve(db, lexical, vectors, question, vector, options, selection)
+    return _packed(question, docs, vector, trace)
+
+
+async def _aprepare(question, options, trace):
+    """_prepare through the async interfaces of the embeddings and FAISS."""
+    stores = await _aget_stores()
+    db, lexical, vectors, _ = stores
+    selection, docs = _match(question, options, trace, stores)
+    vector = None
+    if docs is None:
+        with trace.stage("embed"):
+            vector = await get_embeddings().aembed_query(question)
+        cached = _cached_answer(vector, options, trace)
+        if cached:
+            return {"docs": [], "prompt": None, "vector": vector, "cached": cached}
+        with trace.stage("search"):
+            docs = await _aretrieve(db, lexical, vectors, question, vector, options, selection)
+    return _packed(question, docs, vector, trace)
+
+
+def _finish(question, options, trace, prepared, answer):
+    """
+    Cache a generated answer and count its tokens.
+
+    Returns:
+        list: Source references of the answer's context
+    """
+    sources = format_sources(prepared["docs"])
+    with trace.stage("cache_store"):
+        _store_cache(question, prepared["vector"], answer, sources, options)
+    trace.count_llm_tokens(prepared["prompt"], answer)
+    return sources
+
+
+def _fallback_answer(prepared, trace, error):
+    # A missed LLM deadline is answered from the retrieved passages, if allowed
+    if not LLM_FALLBACK_ENABLED:
+        raise error
+    print(f"{error}; answering from the retrieved passages")
+    trace.outcome = "fallback"
+    return _retrieval_only_answer(prepared["docs"])
+
+
+def ask_chatbot(question, retrieval=None):
     """
     Process a user question and return an answer with source references.
+
+    Concurrent calls with the same (normalized) question share one answer.
     
     Args:
         question (str): The user's query about farming
+        retrieval (dict, optional): Settings from retrieval_options(); defaults to the configured mode
         
     Returns:
         str: Response with an answer and cited sources.
     """
-    result = qa_chain({"query": question})
+    options = retrieval or retrieval_options()
+    with trace_request("ask", question) as trace:
+        if not COALESCE_ENABLED:
+            return _ask_chatbot(question, options, trace)
+        response = _ask_flight.run(_flight_key(question, options), lambda: _ask_chatbot(question, options, trace))
+        if not trace.stages:
+            trace.outcome = "coalesced"  # another caller's trace holds the stages
+        return response
 
-    answer = result.get("result", "Sorry, I couldn't find an answer.")
-    sources = result.get("source_documents", [])
 
-    # Add source attribution to the response
-    if sources:
-        answer += "\n\n**Sources:**"
-        seen_sources = set()
-        for doc in sources:
-            source = doc.metadata.get("source", "Unknown")
-            page = doc.metadata.get("page", "")
-            source_info = f"{source} (Page {page})" if page else source
-            
-            if source_info not in seen_sources:
-                seen_sources.add(source_info)
-                answer += f"\n- {source_info}"
-    
-    return answer
+def _ask_chatbot(question, options, trace):
+    prepared = _prepare(question, options, trace)
+    cached = prepared["cached"]
+    if cached:
+        return cached["answer"] + _sources_markdown(cached["sources"])
+    with trace.stage("llm"):
+        result = get_qa_chain().combine_documents_chain.invoke({"input_documents": prepared["docs"], "question": question})
+    answer = result.get("output_text", "Sorry, I couldn't find an answer.")
+    return answer + _sources_markdown(_finish(question, options, trace, prepared, answer))
+
+
+async def aask_chatbot(question, retrieval=None):
+    """
+    Async version of ask_chatbot.
+
+    Retrieval and generation go through the async interfaces of the
+    embeddings, FAISS and the chain, so the caller's event loop is never
+    blocked on FAISS or Gemini. Concurrent calls with the same (normalized)
+    question wait for the first one's answer instead of calling Gemini again.
+
+    Args:
+        question (str): The user's query about farming
+        retrieval (dict, optional): Settings from retrieval_options(); defaults to the configured mode
+
+    Returns:
+        str: Response with an answer and cited sources.
+    """
+    options = retrieval or retrieval_options()
+    with trace_request("ask", question) as trace:
+        if not COALESCE_ENABLED:
+            return await _aask_chatbot(question, options, trace)
+        response = await _aask_flight.run(_flight_key(question, options), lambda: _aask_chatbot(question, options, trace))
+        if not trace.stages:
+            trace.outcome = "coalesced"
+        return response
+
+
+async def _aask_chatbot(question, options, trace):
+    prepared = await _aprepare(question, options, trace)
+    cached = prepared["cached"]
+    if cached:
+        return cached["answer"] + _sources_markdown(cached["sources"])
+    try:
+        with trace.stage("llm"):
+            result = await with_deadline(
+                (await _aget_qa_chain()).combine_documents_chain.ainvoke(
+                    {"input_documents": prepared["docs"], "question": question}),
+                LLM_DEADLINE_SECONDS)
+    except DeadlineExceeded as e:
+        return _fallback_answer(prepared, trace, e) + _sources_markdown(format_sources(prepared["docs"]))
+    answer = result.get("output_text", "Sorry, I couldn't find an answer.")
+    return answer + _sources_markdown(_finish(question, options, trace, prepared, answer))
+
+
+def _search_batch(db, vectors, k, selection=None):
+    # One FAISS search for the whole query matrix instead of one call per question
+    _, rows = _search_rows(db, vectors, k, selection)
+    return [
+        [db.docstore.search(db.index_to_docstore_id[row]) for row in hits if row != -1]
+        for hits in rows
+    ]
+
+
+def _search_routed(db, queries, k, selections):
+    # One search per distinct shard selection; hits come back in query order
+    groups = {}
+    for i, selection in enumerate(selections):
+        groups.setdefault(selection.source_ids if selection is not None else None, []).append(i)
+    hits = [None] * len(queries)
+    for group in groups.values():
+        for i, docs in zip(group, _search_batch(db, [queries[i] for i in group], k, selections[group[0]])):
+            hits[i] = docs
+    return hits
+
+
+async def aask_chatbot_batch(questions, max_concurrency=None):
+    """
+    Answer a list of questions with one embedding request and one FAISS search.
+
+    Questions are embedded together and searched as a single query matrix
+    (one per distinct set of routed shards); answers are then generated with at most max_concurrency LLM calls in flight.
+    A failure affects only its own item.
+
+    Args:
+        questions (list): The users' queries about farming
+        max_concurrency (int, optional): Concurrent LLM calls; defaults to BATCH_LLM_CONCURRENCY
+
+    Returns:
+        list: One dict per question, in order: {"question", "answer"} or {"question", "error"}
+    """
+    with trace_request("ask_batch", f"{len(questions)} questions") as trace:
+        return await _aask_chatbot_batch(questions, max_concurrency, trace)
+
+
+async def _aask_chatbot_batch(questions, max_concurrency, trace):
+    results = [{"question": question} for question in questions]
+    stores = await _aget_stores()
+    db, lexical, _, _ = stores
+    options = retrieval_options()
+    docs = [None] * len(questions)
+    vectors = [None] * len(questions)
+    selections = [None] * len(questions)
+
+    pending = []
+    for i, question in enumerate(questions):
+        if not question.strip():
+            results[i]["error"] = "Question is empty."
+            continue
+        selections[i], docs[i] = _match(question, options, trace, stores)
+        if docs[i] is None:
+            pending.append(i)
+
+    if pending:
+        try:
+            with trace.stage("embed"):
+                embedded = await aembed_query_batch(get_embeddings(), [questions[i] for i in pending])
+        except Exception as e:
+            for i in pending:
+                results[i]["error"] = f"Embedding failed: {e}"
+            pending = []
+        else:
+            with trace.stage("cache_lookup"):
+                for i, vector in zip(pending, embedded):
+                    vectors[i] = vector
+                    cached = _lookup_cache(vector, options)
+                    if cached:
+                        results[i]["answer"] = cached["answer"] + _sources_markdown(cached["sources"])
+            pending = [i for i in pending if "answer" not in results[i]]
+
+    if pending:
+        with trace.stage("search"):
+            hits = await asyncio.to_thread(_search_routed, db, [vectors[i] for i in pending], _fetch_k(lexical),
+                                           [selections[i] for i in pending])
+            for i, vector_docs in zip(pending, hits):
+                docs[i] = _fuse(db, lexical, questions[i], vector_docs, selections[i])
+
+    chain = (await _aget_qa_chain()).combine_documents_chain
+    slots = asyncio.Semaphore(max_concurrency or BATCH_LLM_CONCURRENCY)
+
+    async def generate(i):
+        prepared = _packed(questions[i], docs[i], vectors[i], trace)
+        async with slots:
+            try:
+                # One observation per item; the breakdown shows their sum
+                with trace.stage("llm"):
+                    result = await with_deadline(
+                        chain.ainvoke({"input_documents": prepared["docs"], "question": questions[i]}),
+                        LLM_DEADLINE_SECONDS)
+            except DeadlineExceeded as e:
+                if LLM_FALLBACK_ENABLED:
+                    results[i]["answer"] = (_retrieval_only_answer(prepared["docs"])
+                                            + _sources_markdown(format_sources(prepared["docs"])))
+                else:
+                    results[i]["error"] = f"Generation failed: {e}"
+                return
+            except Exception as e:
+                results[i]["error"] = f"Generation failed: {e}"
+                return
+        answer = result.get("output_text", "Sorry, I couldn't find an answer.")
+        results[i]["answer"] = answer + _sources_markdown(_finish(questions[i], options, trace, prepared, answer))
+
+    await asyncio.gather(*(generate(i) for i, item in enumerate(results) if docs[i] is not None and not item.keys() & {"answer", "error"}))
+    return results
+
+
+async def astream_chatbot(question, retrieval=None):
+    """
+    Stream an answer token by token as the model produces it.
+
+    Args:
+        question (str): The user's query about farming
+        retrieval (dict, optional): Settings from retrieval_options(); defaults to the configured mode
+
+    Yields:
+        tuple: ("token", str) for each piece of generated text, then a final
+        ("sources", list) with the de-duplicated source references.
+    """
+    with trace_request("ask_stream", question) as trace:
+        options = retrieval or retrieval_options()
+        prepared = await _aprepare(question, options, trace)
+        cached = prepared["cached"]
+        if cached:
+            yield "token", cached["answer"]
+            yield "sources", cached["sources"]
+            return
+
+        tokens = []
+        started = time.perf_counter()
+        # The llm stage includes the time the client takes to read each token
+        with trace.stage("llm"):
+            stream = get_llm().astream(prepared["prompt"])
+            try:
+                # The deadline applies to the first token; after that the client sees progress
+                first = await with_deadline(anext(stream, None), LLM_DEADLINE_SECONDS)
+            except DeadlineExceeded as e:
+                await stream.aclose()
+                yield "token", _fallback_answer(prepared, trace, e)
+                yield "sources", format_sources(prepared["docs"])
+                return
+            if first is not None:
+                trace.record("llm_first_token", time.perf_counter() - started)
+                tokens.append(first)
+                yield "token", first
+                async for token in stream:
+                    tokens.append(token)
+                    yield "token", token
+        yield "sources", _finish(question, options, trace, prepared, "".join(tokens))
+
+
+def stream_chatbot(question, retrieval=None):
+    """
+    Synchronous streaming variant for Streamlit's st.write_stream.
+
+    Args:
+        question (str): The user's query about farming
+        retrieval (dict, optional): Settings from retrieval_options(); defaults to the configured mode
+
+    Yields:
+        str: Answer text as it is generated, followed by the sources block, so the
+        concatenated output matches ask_chatbot.
+    """
+    with trace_request("ask_stream", question) as trace:
+        options = retrieval or retrieval_options()
+        prepared = _prepare(question, options, trace)
+        cached = prepared["cached"]
+        if cached:
+            yield cached["answer"]
+            yield _sources_markdown(cached["sources"])
+            return
+
+        tokens = []
+        started = time.perf_counter()
+        with trace.stage("llm"):
+            for token in get_llm().stream(prepared["prompt"]):
+                if not tokens:
+                    trace.record("llm_first_token", time.perf_counter() - started)
+                tokens.append(token)
+                yield token
+        yield _sources_markdown(_finish(question, options, trace, prepared, "".join(tokens)))
 
 if __name__ == "__main__":
     while True:
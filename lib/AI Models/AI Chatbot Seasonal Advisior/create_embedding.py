@@ -1,38 +1,62 @@
 import os
-from langchain.embeddings import GoogleGenerativeAIEmbeddings
-from langchain.vectorstores import FAISS
-from scripts.load_data import load_and_split
+import sys
+from scripts.embedding_backends import EMBEDDING_BACKEND, TFIDF_MODEL_PATH, fit_tfidf_model, get_embedding_backend
+from scripts.load_data import iter_file_chunks, list_data_files
+from scripts.dedup import DEFAULT_THRESHOLD
+from scripts.index_builder import update_index, print_report
+from scripts.embedding_pipeline import EmbeddingCheckpoint, EmbeddingStage
 from dotenv import load_dotenv
 
 # Load API Key
 load_dotenv()
 api_key = os.getenv("GOOGLE_API_KEY")
 
-def create_embeddings():
+def create_embeddings(full=False):
     """
     Load documents, create embeddings, and store in FAISS index.
+
+    Only files that changed since the last run are parsed, and only chunks
+    that are not already in the index are embedded.
+
+    Args:
+        full (bool): Ignore the previous index and re-embed everything
+
+    Returns:
+        int: Number of document chunks in the index
     """
     # Ensure vector_store directory exists
     os.makedirs("vector_store", exist_ok=True)
     
-    # Load and embed documents
+    # Load, split and embed new or changed documents
     print("Loading and splitting documents...")
-    documents = load_and_split()
-    
-    print(f"Creating embeddings for {len(documents)} document chunks...")
-    embeddings = GoogleGenerativeAIEmbeddings(model="models/embedding-001")
+    def load_files(paths):
+        return iter_file_chunks(paths, chunk_size=1000, chunk_overlap=200)
 
-    # Store in FAISS
-    print("Storing embeddings in FAISS vector database...")
-    db = FAISS.from_documents(documents, embeddings)
-    
-    # Save to disk
-    print("Saving FAISS index to disk...")
-    db.save_local("vector_store/faiss_index")
+    if EMBEDDING_BACKEND == "tfidf" and not os.path.exists(TFIDF_MODEL_PATH):
+        # The local embedding model is fitted on the corpus itself
+        fit_tfidf_model([doc.page_content for _, chunks, _ in load_files(list_data_files("data")) for doc in chunks])
+    embeddings = get_embedding_backend()
+
+    # Store in FAISS and save to disk
+    report = update_index(
+        list_data_files("data"),
+        load_files,
+        embeddings,
+        "vector_store/faiss_index",
+        settings={"chunk_size": 1000, "chunk_overlap": 200, "dedup_threshold": DEFAULT_THRESHOLD},
+        full=full,
+        embedding_stage=EmbeddingStage(
+            embeddings,
+            checkpoint=EmbeddingCheckpoint("vector_store/embedding_checkpoint.sqlite3", namespace=embeddings.model),
+        ),
+        # Handbooks repeating the same passages get one vector listing every source
+        dedup_threshold=DEFAULT_THRESHOLD,
+    )
+    print_report(report)
 
     print("FAISS vector store updated successfully!")
-    return len(documents)
+    return report["total_chunks"]
 
 if __name__ == "__main__":
-    num_chunks = create_embeddings()
-    print(f"Process complete! {num_chunks} document chunks embedded and stored.")
\ No newline at end of file
+    num_chunks = create_embeddings(full="--full" in sys.argv)
+    print(f"Process complete! {num_chunks} document chunks embedded and stored.")
@@ -0,0 +1,108 @@
+import argparse
+import asyncio
+import datetime
+import json
+import sys
+import time
+
+from scripts.seasonal_advice import agenerate_seasonal_advice, get_advice_store, get_season_window
+
+# Warm the seasonal advice store for popular location x crop pairs.
+# Run it shortly before each season boundary (e.g. weekly from cron) with --season next;
+# pairs already in the store are skipped, so an interrupted run resumes where it stopped.
+# Usage: python pregenerate_advice.py --season next --concurrency 4
+
+
+def load_pairs(config_path):
+    """
+    Expand the popular-advice config into (location, crop_type, hemisphere) tuples.
+
+    Args:
+        config_path (str): JSON file with "locations" and "crops" lists
+
+    Returns:
+        list: Every location x crop combination
+    """
+    with open(config_path) as f:
+        config = json.load(f)
+    return [
+        (entry["location"], crop, entry.get("hemisphere", "northern").lower())
+        for entry in config["locations"]
+        for crop in config.get("crops", [""])
+    ]
+
+
+async def pregenerate(pairs, target_date, concurrency=4, retries=3):
+    """
+    Generate and store advice for every pair that is not in the store yet.
+
+    Args:
+        pairs (list): (location, crop_type, hemisphere) tuples
+        target_date (datetime.date): Any day inside the season to generate for
+        concurrency (int): Maximum number of LLM calls in flight
+        retries (int): Attempts per pair before giving up on it
+
+    Returns:
+        dict: Counts of "generated", "skipped" and "failed" pairs
+    """
+    store = get_advice_store()
+    if store is None:
+        raise RuntimeError("Advice store is disabled (ADVICE_STORE_ENABLED=0); nothing to warm.")
+
+    slots = asyncio.Semaphore(concurrency)
+    counts = {"generated": 0, "skipped": 0, "failed": 0}
+
+    async def warm(location, crop_type, hemisphere):
+        season, season_start, _ = get_season_window(hemisphere, target_date)
+        # contains() leaves the store's hit/miss counters alone
+        if store.contains(location, crop_type, hemisphere, season_start):
+            counts["skipped"] += 1
+            return
+
+        async with slots:
+            for attempt in range(1, retries + 1):
+                try:
+                    # Raises on empty advice, which is not stored and so counts as a failed attempt
+                    await agenerate_seasonal_advice(location, crop_type, hemisphere, date=target_date)
+                    counts["generated"] += 1
+                    print(f"✅ {season} advice for {location} / {crop_type or 'general'}")
+                    return
+                except Exception as e:
+                    print(f"⚠️ Attempt {attempt}/{retries} failed for {location} / {crop_type or 'general'}: {e}")
+                    if attempt < retries:
+                        await asyncio.sleep(2 ** attempt)
+        counts["failed"] += 1
+
+    await asyncio.gather(*(warm(*pair) for pair in pairs))
+    return counts
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Pre-generate seasonal advice for popular location x crop pairs.")
+    parser.add_argument("--config", default="popular_advice.json", help="JSON file listing locations and crops")
+    parser.add_argument("--season", choices=["current", "next"], default="next", help="Season to generate advice for")
+    parser.add_argument("--concurrency", type=int, default=4, help="Maximum concurrent LLM calls")
+    parser.add_argument("--retries", type=int, default=3, help="Attempts per pair before giving up")
+    args = parser.parse_args()
+
+    pairs = load_pairs(args.config)
+    today = datetime.date.today()
+    if args.season == "next":
+        # The next boundary is the same date in both hemispheres
+        _, _, target_date = get_season_window("northern", today)
+    else:
+        target_date = today
+    print(f"Warming advice for {len(pairs)} pairs, season starting on or before {target_date}")
+
+    started = time.perf_counter()
+    counts = asyncio.run(pregenerate(pairs, target_date, args.concurrency, args.retries))
+    print(f"Done in {time.perf_counter() - started:.1f}s: {counts['generated']} generated, "
+          f"{counts['skipped']} already stored, {counts['failed']} failed")
+
+    # Failed pairs are simply missing from the store; re-running retries only those
+    if counts["failed"]:
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
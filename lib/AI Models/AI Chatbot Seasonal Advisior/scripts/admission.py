@@ -0,0 +1,211 @@
+import asyncio
+import inspect
+import math
+import os
+import time
+from contextlib import asynccontextmanager
+
+from scripts.metrics import LLM_SLOTS_IN_USE, QUEUE_DEPTH, SHED_REQUESTS
+
+# Requests beyond MAX_CONCURRENT_REQUESTS wait in a queue of at most MAX_QUEUE_SIZE
+# for at most MAX_QUEUE_WAIT_SECONDS; anything more is shed with a 503 right away.
+# Once admitted, a request has REQUEST_DEADLINE_SECONDS to finish and each LLM
+# call LLM_DEADLINE_SECONDS (0 disables a limit).
+MAX_QUEUE_SIZE = int(os.getenv("MAX_QUEUE_SIZE", "64"))
+MAX_QUEUE_WAIT_SECONDS = float(os.getenv("MAX_QUEUE_WAIT_SECONDS", "10"))
+REQUEST_DEADLINE_SECONDS = float(os.getenv("REQUEST_DEADLINE_SECONDS", "60"))
+LLM_DEADLINE_SECONDS = float(os.getenv("LLM_DEADLINE_SECONDS", "30"))
+
+# Weight of the newest request in the moving average of service time behind Retry-After
+_SERVICE_TIME_WEIGHT = 0.2
+
+
+class Overloaded(Exception):
+    """The request was shed because the queue is full or it waited too long."""
+
+    def __init__(self, message, retry_after):
+        super().__init__(message)
+        self.retry_after = retry_after
+
+
+class DeadlineExceeded(TimeoutError):
+    """A request or LLM call ran past its deadline."""
+
+
+class ClientDisconnected(Exception):
+    """The client went away before the response was ready."""
+
+
+async def with_deadline(awaitable, seconds, what="LLM call"):
+    """
+    Await something, giving up after a number of seconds.
+
+    Args:
+        awaitable (Awaitable): Work to wait for; cancelled when the deadline passes
+        seconds (float): Deadline; 0 or None waits indefinitely
+        what (str): Name used in the error message
+
+    Returns:
+        object: The awaitable's result
+    """
+    if not seconds or seconds <= 0:
+        return await awaitable
+    try:
+        return await asyncio.wait_for(awaitable, seconds)
+    except asyncio.TimeoutError:
+        raise DeadlineExceeded(f"{what} took longer than {seconds:g}s") from None
+
+
+class AdmissionController:
+    """
+    Bounded queue in front of the LLM-backed endpoints.
+
+    At most max_concurrent requests run at a time; up to max_queue more wait
+    (first come, first served) for at most max_wait seconds. Requests beyond
+    that are rejected immediately with Overloaded, which carries a Retry-After
+    estimate from the recent service time, so a slow model turns into fast 503s
+    instead of an ever-growing pile of waiting requests.
+    """
+
+    def __init__(self, max_concurrent, max_queue=MAX_QUEUE_SIZE, max_wait=MAX_QUEUE_WAIT_SECONDS):
+        """
+        Args:
+            max_concurrent (int): Requests served at once
+            max_queue (int): Requests allowed to wait for a slot
+            max_wait (float): Longest wait for a slot in seconds (0 = no limit)
+        """
+        self.max_concurrent = max_concurrent
+        self.max_queue = max_queue
+        self.max_wait = max_wait
+        self.waiting = 0
+        self.active = 0
+        self.rejected = 0
+        self._slots = asyncio.Semaphore(max_concurrent)
+        self._service_seconds = None
+
+    def retry_after(self):
+        """
+        Returns:
+            int: Seconds until a retry is likely to be admitted (at least 1)
+        """
+        per_request = self._service_seconds or 1.0
+        return max(1, math.ceil(per_request * (self.waiting + 1) / self.max_concurrent))
+
+    def _reject(self, operation, reason, message):
+        self.rejected += 1
+        SHED_REQUESTS.labels(operation, reason).inc()
+        raise Overloaded(message, self.retry_after())
+
+    def check(self, operation):
+        """Reject right away (Overloaded) if a new request would find the queue full."""
+        # Counted here rather than read off the semaphore, whose acquisitions only
+        # register once the waiting tasks run
+        if self.active + self.waiting >= self.max_concurrent + self.max_queue:
+            self._reject(operation, "queue_full", "Server is busy; too many requests are waiting.")
+
+    @asynccontextmanager
+    async def admit(self, operation):
+        """
+        Hold a slot for the duration of a with block, queueing for it if needed.
+
+        Args:
+            operation (str): Metric label, e.g. "ask"
+
+        Raises:
+            Overloaded: The queue is full, or no slot freed up within max_wait
+        """
+        self.check(operation)
+        self.waiting += 1
+        QUEUE_DEPTH.inc()
+        try:
+            await asyncio.wait_for(self._slots.acquire(), self.max_wait if self.max_wait > 0 else None)
+        except asyncio.TimeoutError:
+            self._reject(operation, "queue_timeout", f"Server is busy; no slot freed up within {self.max_wait:g}s.")
+        finally:
+            self.waiting -= 1
+            QUEUE_DEPTH.dec()
+
+        self.active += 1
+        LLM_SLOTS_IN_USE.inc()
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            self._slots.release()
+            self.active -= 1
+            LLM_SLOTS_IN_USE.dec()
+            seconds = time.perf_counter() - started
+            if self._service_seconds is None:
+                self._service_seconds = seconds
+            else:
+                self._service_seconds += _SERVICE_TIME_WEIGHT * (seconds - self._service_seconds)
+
+    async def run(self, operation, coro, receive=None, deadline=REQUEST_DEADLINE_SECONDS):
+        """
+        Admit a request and run its work under a deadline, cancelling it if the
+        client disconnects first.
+
+        Args:
+            operation (str): Metric label, e.g. "ask"
+            coro (coroutine): The request's work
+            receive (callable, optional): ASGI receive of the request, used to notice a disconnect
+            deadline (float): Seconds the work may take once admitted (0 = no limit)
+
+        Returns:
+            object: The work's result
+
+        Raises:
+            Overloaded: Shed before it started
+            DeadlineExceeded: The work ran past the deadline and was cancelled
+            ClientDisconnected: The client went away and the work was cancelled
+        """
+        try:
+            async with self.admit(operation):
+                work = asyncio.ensure_future(coro)
+                watchers = {work}
+                disconnect = asyncio.ensure_future(_wait_for_disconnect(receive)) if receive is not None else None
+                if disconnect is not None:
+                    watchers.add(disconnect)
+                try:
+                    done, _ = await asyncio.wait(watchers, timeout=deadline if deadline > 0 else None,
+                                                 return_when=asyncio.FIRST_COMPLETED)
+                finally:
+                    if disconnect is not None:
+                        disconnect.cancel()
+                    if not work.done():
+                        # Wait for the cancellation so the slot is only freed once the work has stopped
+                        work.cancel()
+                        await asyncio.gather(work, return_exceptions=True)
+                if work in done:
+                    return work.result()
+                if disconnect is not None and disconnect in done:
+                    SHED_REQUESTS.labels(operation, "disconnected").inc()
+                    raise ClientDisconnected("Client disconnected before the response was ready.")
+                SHED_REQUESTS.labels(operation, "deadline").inc()
+                raise DeadlineExceeded(f"Request took longer than {deadline:g}s")
+        except BaseException:
+            # Work that was never started must still be closed to avoid "never awaited" warnings
+            if inspect.iscoroutine(coro) and inspect.getcoroutinestate(coro) == inspect.CORO_CREATED:
+                coro.close()
+            raise
+
+    def stats(self):
+        """
+        Returns:
+            dict: Requests waiting and being served, slots, queue size and requests rejected so far
+        """
+        return {
+            "waiting": self.waiting,
+            "active": self.active,
+            "max_concurrent": self.max_concurrent,
+            "max_queue": self.max_queue,
+            "rejected": self.rejected,
+        }
+
+
+async def _wait_for_disconnect(receive):
+    # The body has already been read, so the next ASGI message is the disconnect
+    while True:
+        message = await receive()
+        if message["type"] == "http.disconnect":
+            return
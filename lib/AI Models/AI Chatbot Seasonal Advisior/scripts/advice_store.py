@@ -0,0 +1,163 @@
+import os
+import re
+import sqlite3
+import threading
+import time
+
+
+def normalize_key(location, crop_type=None):
+    """
+    Normalize a location/crop pair so trivial spelling variants share one entry.
+
+    "United States  Midwest" / "united states midwest." and "Corn" / " corn "
+    map to the same key.
+
+    Args:
+        location (str): Geographic location
+        crop_type (str, optional): Crop name
+
+    Returns:
+        str: Key of the form "location|crop"
+    """
+    def clean(text):
+        text = re.sub(r"[^\w\s-]", " ", (text or "").lower())
+        return " ".join(text.split())
+
+    return f"{clean(location)}|{clean(crop_type)}"
+
+
+class AdviceStore:
+    """
+    SQLite-backed store of generated seasonal advice.
+
+    Entries are keyed on the normalized location/crop, hemisphere and season
+    start date. Once a season is over its entries no longer match and are
+    purged, so advice rolls over with get_current_season without any manual
+    invalidation. SQLite lets several API workers share one store.
+    """
+
+    def __init__(self, path):
+        """
+        Args:
+            path (str): SQLite database file
+        """
+        self.path = path
+        self.hits = 0
+        self.misses = 0
+        self._local = threading.local()
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        with self._connect() as conn:
+            conn.execute("""
+                CREATE TABLE IF NOT EXISTS advice (
+                    key TEXT NOT NULL,
+                    hemisphere TEXT NOT NULL,
+                    season_start TEXT NOT NULL,
+                    season TEXT NOT NULL,
+                    location TEXT NOT NULL,
+                    crop_type TEXT NOT NULL,
+                    advice TEXT NOT NULL,
+                    created_at REAL NOT NULL,
+                    PRIMARY KEY (key, hemisphere, season_start)
+                )
+            """)
+
+    def _connect(self):
+        # One connection per thread; sqlite3 connections are not thread-safe
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = sqlite3.connect(self.path, timeout=30)
+            conn.execute("PRAGMA journal_mode=WAL")
+            self._local.conn = conn
+        return conn
+
+    def get(self, location, crop_type, hemisphere, season_start):
+        """
+        Look up stored advice.
+
+        Args:
+            location (str): Geographic location
+            crop_type (str): Crop name ("" for general advice)
+            hemisphere (str): "northern" or "southern"
+            season_start (datetime.date): First day of the season
+
+        Returns:
+            str or None: Stored advice text
+        """
+        row = self._connect().execute(
+            "SELECT advice FROM advice WHERE key = ? AND hemisphere = ? AND season_start = ?",
+            (normalize_key(location, crop_type), hemisphere.lower(), season_start.isoformat()),
+        ).fetchone()
+        if row is None:
+            self.misses += 1
+            return None
+        self.hits += 1
+        return row[0]
+
+    def contains(self, location, crop_type, hemisphere, season_start):
+        """Check for stored advice without touching the hit/miss counters."""
+        row = self._connect().execute(
+            "SELECT 1 FROM advice WHERE key = ? AND hemisphere = ? AND season_start = ?",
+            (normalize_key(location, crop_type), hemisphere.lower(), season_start.isoformat()),
+        ).fetchone()
+        return row is not None
+
+    def put(self, location, crop_type, hemisphere, season, season_start, advice):
+        """
+        Store generated advice, replacing any previous entry for the same key.
+
+        Args:
+            location (str): Geographic location
+            crop_type (str): Crop name ("" for general advice)
+            hemisphere (str): "northern" or "southern"
+            season (str): Season name
+            season_start (datetime.date): First day of the season
+            advice (str): Generated advice text
+        """
+        with self._connect() as conn:
+            conn.execute(
+                "INSERT OR REPLACE INTO advice VALUES (?, ?, ?, ?, ?, ?, ?, ?)",
+                (
+                    normalize_key(location, crop_type),
+                    hemisphere.lower(),
+                    season_start.isoformat(),
+                    season,
+                    location,
+                    crop_type or "",
+                    advice,
+                    time.time(),
+                ),
+            )
+
+    def purge_expired(self, hemisphere, current_season_start):
+        """
+        Delete advice for seasons that have already ended.
+
+        Entries for the current season and any pre-generated upcoming season are kept.
+
+        Args:
+            hemisphere (str): "northern" or "southern"
+            current_season_start (datetime.date): First day of the current season
+
+        Returns:
+            int: Number of entries removed
+        """
+        with self._connect() as conn:
+            cursor = conn.execute(
+                "DELETE FROM advice WHERE hemisphere = ? AND season_start < ?",
+                (hemisphere.lower(), current_season_start.isoformat()),
+            )
+        return cursor.rowcount
+
+    def stats(self):
+        """
+        Returns:
+            dict: Hit/miss counters and number of stored entries
+        """
+        size = self._connect().execute("SELECT COUNT(*) FROM advice").fetchone()[0]
+        total = self.hits + self.misses
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": self.hits / total if total else 0.0,
+            "size": size,
+        }
@@ -0,0 +1,208 @@
+import json
+import mmap
+import os
+
+import numpy as np
+from langchain_community.docstore.base import Docstore
+from langchain_core.documents import Document
+
+# Files making up a chunk store (all inside the FAISS index folder)
+TEXTS_FILE = "chunks.bin"
+OFFSETS_FILE = "chunk_offsets.npy"
+IDS_FILE = "chunk_ids.npy"
+SOURCE_IDS_FILE = "chunk_sources.npy"
+PAGES_FILE = "chunk_pages.npy"
+SOURCES_FILE = "sources.json"
+EXTRA_FILE = "chunk_extra.bin"
+EXTRA_OFFSETS_FILE = "chunk_extra_offsets.npy"
+CHUNK_STORE_FILES = (TEXTS_FILE, OFFSETS_FILE, IDS_FILE, SOURCE_IDS_FILE, PAGES_FILE, SOURCES_FILE, EXTRA_FILE, EXTRA_OFFSETS_FILE)
+
+NO_PAGE = -1
+
+
+def _write_blobs(folder, data_file, offsets_file, blobs):
+    offsets = np.zeros(len(blobs) + 1, dtype=np.int64)
+    with open(os.path.join(folder, data_file), "wb") as f:
+        for i, blob in enumerate(blobs):
+            f.write(blob)
+            offsets[i + 1] = offsets[i] + len(blob)
+    np.save(os.path.join(folder, offsets_file), offsets)
+
+
+def write_chunk_store(folder, docs, ids):
+    """
+    Write chunks in FAISS row order as a compact, mmap-friendly docstore.
+
+    Texts go into one contiguous UTF-8 file addressed by an offsets array;
+    source and page are stored as columns (source names are interned in
+    sources.json, including the other "sources" of collapsed near-duplicates);
+    any other metadata is kept as per-chunk JSON in a side file.
+
+    Args:
+        folder (str): FAISS index folder
+        docs (list): Document objects, one per FAISS row
+        ids (list): Chunk ids, one per FAISS row
+    """
+    os.makedirs(folder, exist_ok=True)
+    sources = {}
+    source_ids = np.empty(len(docs), dtype=np.int32)
+    pages = np.empty(len(docs), dtype=np.int32)
+    extras = []
+    for i, doc in enumerate(docs):
+        metadata = dict(doc.metadata)
+        source = str(metadata.pop("source", ""))
+        source_ids[i] = sources.setdefault(source, len(sources))
+        for place in metadata.get("sources", []):
+            sources.setdefault(str(place.get("source", "")), len(sources))
+        page = metadata.pop("page", None)
+        if isinstance(page, (int, np.integer)):
+            pages[i] = page
+        else:
+            pages[i] = NO_PAGE
+            if page is not None:
+                metadata["page"] = page
+        extras.append(json.dumps(metadata, separators=(",", ":")).encode("utf-8") if metadata else b"")
+
+    _write_blobs(folder, TEXTS_FILE, OFFSETS_FILE, [doc.page_content.encode("utf-8") for doc in docs])
+    _write_blobs(folder, EXTRA_FILE, EXTRA_OFFSETS_FILE, extras)
+    np.save(os.path.join(folder, IDS_FILE), np.array(ids, dtype="S"))
+    np.save(os.path.join(folder, SOURCE_IDS_FILE), source_ids)
+    np.save(os.path.join(folder, PAGES_FILE), pages)
+    with open(os.path.join(folder, SOURCES_FILE), "w") as f:
+        json.dump(list(sources), f)
+
+
+def source_rows(folder):
+    """
+    Rows of every source in a chunk store, counting a chunk under each source
+    listed in its "sources" metadata (near-duplicates collapsed into it) as
+    well as under its own.
+
+    Args:
+        folder (str): FAISS index folder containing the chunk store
+
+    Returns:
+        dict: {source id: ascending np.ndarray of FAISS rows}
+    """
+    docstore = MmapDocstore(folder)
+    source_ids = np.asarray(docstore.source_ids)
+    rows = {source_id: [np.flatnonzero(source_ids == source_id)] for source_id in range(len(docstore.sources))}
+    source_index = {source: source_id for source_id, source in enumerate(docstore.sources)}
+    # Only chunks with extra metadata can list other sources
+    for row in np.flatnonzero(np.diff(docstore.extra_offsets) > 0):
+        for place in docstore.metadata(row).get("sources", []):
+            source_id = source_index[str(place.get("source", ""))]
+            if source_id != source_ids[row]:
+                rows[source_id].append(np.array([row]))
+    return {source_id: np.unique(np.concatenate(parts)).astype(np.int64) for source_id, parts in rows.items()}
+
+
+def has_chunk_store(folder):
+    return os.path.exists(os.path.join(folder, OFFSETS_FILE))
+
+
+def _open_mmap(path):
+    with open(path, "rb") as f:
+        if os.fstat(f.fileno()).st_size == 0:
+            return b""
+        return mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+
+
+class RowIdMap:
+    """
+    Stand-in for FAISS's index_to_docstore_id dict when docstore ids are row numbers.
+
+    Avoids materializing one Python string per chunk at load time.
+    """
+
+    def __init__(self, size):
+        self.size = size
+
+    def __getitem__(self, i):
+        i = int(i)
+        if not 0 <= i < self.size:
+            raise KeyError(i)
+        return str(i)
+
+    def get(self, i, default=None):
+        try:
+            return self[i]
+        except KeyError:
+            return default
+
+    def __len__(self):
+        return self.size
+
+    def __iter__(self):
+        return iter(range(self.size))
+
+    def keys(self):
+        return range(self.size)
+
+    def values(self):
+        return (str(i) for i in range(self.size))
+
+    def items(self):
+        return ((i, str(i)) for i in range(self.size))
+
+
+class MmapDocstore(Docstore):
+    """
+    Read-only docstore over a chunk store written by write_chunk_store.
+
+    Everything is memory-mapped: opening costs a few small reads regardless of
+    corpus size, and only the chunks FAISS actually returns are decoded.
+    Documents are looked up by FAISS row number (as a string).
+    """
+
+    def __init__(self, folder):
+        """
+        Args:
+            folder (str): FAISS index folder containing the chunk store
+        """
+        self.folder = folder
+        self.offsets = np.load(os.path.join(folder, OFFSETS_FILE), mmap_mode="r")
+        self.extra_offsets = np.load(os.path.join(folder, EXTRA_OFFSETS_FILE), mmap_mode="r")
+        self.ids = np.load(os.path.join(folder, IDS_FILE), mmap_mode="r")
+        self.source_ids = np.load(os.path.join(folder, SOURCE_IDS_FILE), mmap_mode="r")
+        self.pages = np.load(os.path.join(folder, PAGES_FILE), mmap_mode="r")
+        with open(os.path.join(folder, SOURCES_FILE)) as f:
+            self.sources = json.load(f)
+        self._texts = _open_mmap(os.path.join(folder, TEXTS_FILE))
+        self._extra = _open_mmap(os.path.join(folder, EXTRA_FILE))
+
+    def __len__(self):
+        return len(self.offsets) - 1
+
+    def chunk_id(self, row):
+        return self.ids[row].decode("ascii")
+
+    def metadata(self, row):
+        """
+        Returns:
+            dict: Metadata of the chunk at a FAISS row
+        """
+        start, end = int(self.extra_offsets[row]), int(self.extra_offsets[row + 1])
+        metadata = json.loads(self._extra[start:end]) if end > start else {}
+        metadata["source"] = self.sources[self.source_ids[row]]
+        if self.pages[row] != NO_PAGE:
+            metadata["page"] = int(self.pages[row])
+        return metadata
+
+    def get(self, row):
+        """
+        Returns:
+            Document: The chunk at a FAISS row
+        """
+        start, end = int(self.offsets[row]), int(self.offsets[row + 1])
+        return Document(
+            id=self.chunk_id(row),
+            page_content=self._texts[start:end].decode("utf-8"),
+            metadata=self.metadata(row),
+        )
+
+    def search(self, search):
+        row = int(search)
+        if not 0 <= row < len(self):
+            return f"ID {search} not found."
+        return self.get(row)
@@ -0,0 +1,155 @@
+import re
+
+from langchain_core.documents import Document
+
+# Chunks of the same page closer than this many characters are merged into one passage
+ADJACENT_GAP = 2
+# Shortest suffix/prefix overlap recognized when chunks carry no start_index
+MIN_TEXT_OVERLAP = 20
+# Word-trigram Jaccard similarity at which a passage counts as a near-duplicate
+NEAR_DUPLICATE_SIMILARITY = 0.9
+
+_encoding = None
+
+
+def count_tokens(text):
+    """
+    Count tokens with tiktoken's cl100k_base encoding.
+
+    Gemini uses its own tokenizer, so this is an estimate; it falls back to
+    four characters per token when the encoding cannot be loaded (e.g. offline).
+
+    Args:
+        text (str): Text to measure
+
+    Returns:
+        int: Approximate number of tokens
+    """
+    global _encoding
+    if _encoding is None:
+        try:
+            import tiktoken
+            _encoding = tiktoken.get_encoding("cl100k_base")
+        except Exception:
+            _encoding = False
+    if _encoding:
+        return len(_encoding.encode(text, disallowed_special=()))
+    return (len(text) + 3) // 4
+
+
+def _truncate(text, budget):
+    # Cut to roughly `budget` tokens, at a word boundary
+    if _encoding:
+        return _encoding.decode(_encoding.encode(text, disallowed_special=())[:budget]).rsplit(" ", 1)[0]
+    return text[:budget * 4].rsplit(" ", 1)[0]
+
+
+def _text_overlap(left, right):
+    # Length of the longest suffix of left that is a prefix of right
+    for size in range(min(len(left), len(right)), MIN_TEXT_OVERLAP - 1, -1):
+        if left.endswith(right[:size]):
+            return size
+    return 0
+
+
+def _try_merge(a, b):
+    """Merge two passages of the same page if they overlap or touch; None otherwise."""
+    start_a, start_b = a.metadata.get("start_index"), b.metadata.get("start_index")
+    if start_a is not None and start_b is not None:
+        if start_b < start_a:
+            a, b, start_a, start_b = b, a, start_b, start_a
+        end_a = start_a + len(a.page_content)
+        if start_b > end_a + ADJACENT_GAP:
+            return None
+        overlap = end_a - start_b
+        if overlap >= len(b.page_content):
+            return a
+        text = a.page_content + (b.page_content[overlap:] if overlap > 0 else " " + b.page_content)
+    else:
+        if b.page_content in a.page_content:
+            return a
+        if a.page_content in b.page_content:
+            return b
+        overlap = _text_overlap(a.page_content, b.page_content)
+        if not overlap:
+            overlap = _text_overlap(b.page_content, a.page_content)
+            if not overlap:
+                return None
+            a, b = b, a
+        text = a.page_content + b.page_content[overlap:]
+    return Document(page_content=text, metadata=dict(a.metadata), id=a.id)
+
+
+def _shingles(text):
+    words = re.findall(r"\w+", text.lower())
+    return {tuple(words[i:i + 3]) for i in range(max(len(words) - 2, 1))}
+
+
+def pack_context(docs, token_budget):
+    """
+    Turn retrieved chunks into a compact context for the LLM.
+
+    1. Chunks from the same source and page that overlap or touch (the splitter's
+       chunk_overlap) are merged into one passage.
+    2. Passages that are near-duplicates of a more relevant one are dropped.
+    3. Passages are added in relevance order while they fit in token_budget;
+       the most relevant one is truncated if it alone exceeds the budget.
+
+    Args:
+        docs (list): Retrieved Documents, most relevant first
+        token_budget (int): Maximum context tokens (0 or None = unlimited)
+
+    Returns:
+        tuple: (packed Documents in relevance order, report dict with chunk and token counts)
+    """
+    passages = []  # (relevance rank, Document)
+    merged = 0
+    for rank, doc in enumerate(docs):
+        key = (doc.metadata.get("source"), doc.metadata.get("page"))
+        for i, (best_rank, passage) in enumerate(passages):
+            if (passage.metadata.get("source"), passage.metadata.get("page")) != key:
+                continue
+            combined = _try_merge(passage, doc)
+            if combined is not None:
+                passages[i] = (best_rank, combined)
+                merged += 1
+                break
+        else:
+            passages.append((rank, doc))
+
+    kept, kept_shingles, duplicates = [], [], 0
+    for _, passage in sorted(passages, key=lambda item: item[0]):
+        shingles = _shingles(passage.page_content)
+        if any(len(shingles & other) / len(shingles | other) >= NEAR_DUPLICATE_SIMILARITY for other in kept_shingles):
+            duplicates += 1
+            continue
+        kept.append(passage)
+        kept_shingles.append(shingles)
+
+    packed, used, over_budget = [], 0, 0
+    for passage in kept:
+        tokens = count_tokens(passage.page_content)
+        if token_budget and used + tokens > token_budget:
+            if packed:
+                over_budget += 1
+                continue
+            passage = Document(page_content=_truncate(passage.page_content, token_budget),
+                               metadata=passage.metadata, id=passage.id)
+            tokens = count_tokens(passage.page_content)
+        packed.append(passage)
+        used += tokens
+
+    # What the "stuff" chain would have sent: every chunk joined by blank lines
+    tokens_in = count_tokens("\n\n".join(doc.page_content for doc in docs))
+    tokens_out = count_tokens("\n\n".join(doc.page_content for doc in packed))
+    report = {
+        "chunks_in": len(docs),
+        "chunks_out": len(packed),
+        "merged": merged,
+        "duplicates_dropped": duplicates,
+        "over_budget_dropped": over_budget,
+        "tokens_in": tokens_in,
+        "tokens_out": tokens_out,
+        "tokens_saved": tokens_in - tokens_out,
+    }
+    return packed, report
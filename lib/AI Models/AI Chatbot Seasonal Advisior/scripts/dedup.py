@@ -0,0 +1,181 @@
+import re
+import zlib
+
+import numpy as np
+
+# Estimated Jaccard similarity of word trigrams at which two chunks count as the same passage
+DEFAULT_THRESHOLD = 0.9
+NUM_PERM = 128
+
+# MinHash permutations h -> (a * h + b) mod p over 32-bit shingle hashes; p < 2^32
+# keeps a * h + b inside uint64. Fixed seed so signatures are comparable across runs.
+_PRIME = np.uint64(4294967291)
+_rng = np.random.default_rng(20240601)
+_A = _rng.integers(1, int(_PRIME), NUM_PERM, dtype=np.uint64)
+_B = _rng.integers(0, int(_PRIME), NUM_PERM, dtype=np.uint64)
+
+
+def minhash(text):
+    """
+    MinHash signature of a text's word trigrams (the same shingles context packing compares).
+
+    Args:
+        text (str): Chunk text
+
+    Returns:
+        np.ndarray or None: NUM_PERM uint64 values; None for text without words
+    """
+    words = re.findall(r"\w+", text.lower())
+    if not words:
+        return None
+    shingles = {" ".join(words[i:i + 3]) for i in range(max(len(words) - 2, 1))}
+    hashes = np.fromiter((zlib.crc32(s.encode("utf-8")) for s in shingles), dtype=np.uint64, count=len(shingles))
+    return ((hashes[:, None] * _A + _B) % _PRIME).min(axis=0)
+
+
+def lsh_bands(threshold, num_perm=NUM_PERM):
+    """
+    Choose the LSH banding for a similarity threshold.
+
+    Two signatures become candidates when all rows of any band agree, which
+    happens with probability 1 - (1 - s^rows)^bands. The S-curve's midpoint
+    (1 / bands)^(1 / rows) is put 0.1 below the threshold, so a pair right at
+    the threshold is still found over 99% of the time (at 0.9); candidates are
+    then checked against the full signature.
+
+    Returns:
+        tuple: (bands, rows)
+    """
+    options = [(num_perm // rows, rows) for rows in range(1, num_perm + 1)]
+    below = [(bands, rows) for bands, rows in options if (1 / bands) ** (1 / rows) <= threshold - 0.1]
+    return max(below or options[:1], key=lambda option: (1 / option[0]) ** (1 / option[1]))
+
+
+class NearDuplicateIndex:
+    """
+    MinHash/LSH index of chunk signatures for finding near-duplicate chunks.
+    """
+
+    def __init__(self, threshold=DEFAULT_THRESHOLD):
+        """
+        Args:
+            threshold (float): Minimum estimated Jaccard similarity of a near-duplicate
+        """
+        self.threshold = threshold
+        self.bands, self.rows = lsh_bands(threshold)
+        self._buckets = [{} for _ in range(self.bands)]
+        self._signatures = {}
+
+    def __len__(self):
+        return len(self._signatures)
+
+    def _band_keys(self, signature):
+        return [signature[i * self.rows:(i + 1) * self.rows].tobytes() for i in range(self.bands)]
+
+    def add(self, key, signature):
+        """
+        Args:
+            key (hashable): Chunk id
+            signature (np.ndarray): minhash() of the chunk text
+        """
+        if signature is None or key in self._signatures:
+            return
+        self._signatures[key] = signature
+        for bucket, band in zip(self._buckets, self._band_keys(signature)):
+            bucket.setdefault(band, []).append(key)
+
+    def query(self, signature):
+        """
+        Returns:
+            tuple: (key, estimated similarity) of the most similar chunk at or above
+            the threshold, or (None, 0.0)
+        """
+        if signature is None:
+            return None, 0.0
+        candidates = {key for bucket, band in zip(self._buckets, self._band_keys(signature)) for key in bucket.get(band, ())}
+        best, best_similarity = None, 0.0
+        for key in candidates:
+            similarity = float(np.mean(self._signatures[key] == signature))
+            if similarity >= self.threshold and similarity > best_similarity:
+                best, best_similarity = key, similarity
+        return best, best_similarity
+
+
+def location(metadata):
+    """Source file and page of a chunk, as stored in "sources" metadata."""
+    return {"source": metadata.get("source"), "page": metadata.get("page")}
+
+
+def set_locations(metadata, locations):
+    """
+    Point a chunk's metadata at every place its text occurs.
+
+    The first location becomes the chunk's "source"/"page"; when there is more
+    than one, all of them are listed under "sources".
+
+    Args:
+        metadata (dict): Chunk metadata, updated in place
+        locations (list): {"source", "page"} dicts, primary first
+
+    Returns:
+        bool: Whether the metadata changed
+    """
+    unique = []
+    for place in locations:
+        if place not in unique:
+            unique.append(place)
+    before = (metadata.get("source"), metadata.get("page"), metadata.get("sources"))
+    if unique:
+        metadata["source"] = unique[0]["source"]
+        if unique[0]["page"] is None:
+            metadata.pop("page", None)
+        else:
+            metadata["page"] = unique[0]["page"]
+    if len(unique) > 1:
+        metadata["sources"] = unique
+    else:
+        metadata.pop("sources", None)
+    return before != (metadata.get("source"), metadata.get("page"), metadata.get("sources"))
+
+
+def dedup_chunks(docs, threshold=DEFAULT_THRESHOLD):
+    """
+    Collapse near-duplicate chunks into the first occurrence.
+
+    The kept chunk's metadata lists the source and page of every copy under
+    "sources" (see set_locations).
+
+    Args:
+        docs (list): Chunk Documents
+        threshold (float): Minimum estimated Jaccard similarity of a near-duplicate
+
+    Returns:
+        tuple: (kept Documents in their original order, report dict)
+    """
+    index = NearDuplicateIndex(threshold)
+    kept, places = [], {}
+    for doc in docs:
+        signature = minhash(doc.page_content)
+        match, _ = index.query(signature)
+        if match is not None:
+            places[match].append(location(doc.metadata))
+            continue
+        places[len(kept)] = [location(doc.metadata)]
+        index.add(len(kept), signature)
+        kept.append(doc)
+    for i, doc in enumerate(kept):
+        set_locations(doc.metadata, places[i])
+    return kept, dedup_report(len(docs), len(kept))
+
+
+def dedup_report(chunks_in, chunks_out):
+    """
+    Returns:
+        dict: Chunk counts before and after de-duplication and the share of the index saved
+    """
+    return {
+        "chunks_in": chunks_in,
+        "chunks_out": chunks_out,
+        "duplicates": chunks_in - chunks_out,
+        "shrink": (chunks_in - chunks_out) / chunks_in if chunks_in else 0.0,
+    }
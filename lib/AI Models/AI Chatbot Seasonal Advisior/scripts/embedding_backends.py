@@ -0,0 +1,277 @@
+import hashlib
+import math
+import os
+from collections import Counter
+
+import numpy as np
+from langchain_core.embeddings import Embeddings
+
+from scripts.lexical_index import tokenize
+
+# Which embeddings build and query the index: "gemini" (remote API) or "tfidf"
+# (local TF-IDF + SVD projection fitted on our own corpus, no network needed)
+EMBEDDING_BACKENDS = ("gemini", "tfidf")
+EMBEDDING_BACKEND = os.getenv("EMBEDDING_BACKEND", "gemini")
+GEMINI_MODEL = "models/embedding-001"
+TFIDF_MODEL_PATH = os.getenv("TFIDF_MODEL_PATH", "vector_store/tfidf_embeddings.npz")
+TFIDF_DIMENSION = int(os.getenv("TFIDF_DIMENSION", "256"))
+TFIDF_MAX_VOCAB = 50000
+TFIDF_MIN_DF = 2
+
+# Non-zeros multiplied at once in sparse products; bounds temporary memory to ~64k x dimension floats
+_BLOCK_NNZ = 1 << 16
+
+
+def _count_matrix(token_lists, vocab_ids):
+    # Term counts as CSR arrays (indptr, indices, data); unknown terms are skipped
+    indptr = np.zeros(len(token_lists) + 1, dtype=np.int64)
+    indices, data = [], []
+    for row, tokens in enumerate(token_lists):
+        counts = Counter(vocab_ids[token] for token in tokens if token in vocab_ids)
+        indices.extend(counts)
+        data.extend(counts.values())
+        indptr[row + 1] = len(indices)
+    return indptr, np.array(indices, dtype=np.int64), np.array(data, dtype=np.float32)
+
+
+def _tfidf(indptr, indices, counts, idf):
+    # Sublinear tf times idf, each row scaled to unit length
+    data = (1 + np.log(counts)) * idf[indices]
+    lengths = np.diff(indptr)
+    norms = np.zeros(len(lengths), dtype=np.float32)
+    nonempty = lengths > 0
+    if data.size:
+        norms[nonempty] = np.sqrt(np.add.reduceat(data ** 2, indptr[:-1][nonempty]))
+    return data / np.repeat(np.where(norms > 0, norms, 1), lengths)
+
+
+def _sparse_dot(indptr, indices, data, matrix):
+    """
+    Multiply a CSR matrix by a dense one, a block of rows at a time.
+
+    Returns:
+        np.ndarray: (rows, matrix columns) float32 product
+    """
+    rows = len(indptr) - 1
+    out = np.zeros((rows, matrix.shape[1]), dtype=np.float32)
+    start = 0
+    while start < rows:
+        # At least one row per block, more while they fit in the non-zero budget
+        end = max(int(np.searchsorted(indptr, indptr[start] + _BLOCK_NNZ, side="right")) - 1, start + 1)
+        end = min(end, rows)
+        lo, hi = indptr[start], indptr[end]
+        if hi > lo:
+            products = data[lo:hi, None] * matrix[indices[lo:hi]]
+            lengths = np.diff(indptr[start:end + 1])
+            nonempty = lengths > 0
+            out[start:end][nonempty] = np.add.reduceat(products, (indptr[start:end] - lo)[nonempty], axis=0)
+        start = end
+    return out
+
+
+def _transpose(indptr, indices, data, columns):
+    # CSR of the transposed matrix (terms x chunks)
+    rows = np.repeat(np.arange(len(indptr) - 1), np.diff(indptr))
+    order = np.argsort(indices, kind="stable")
+    indptr_t = np.zeros(columns + 1, dtype=np.int64)
+    indptr_t[1:] = np.cumsum(np.bincount(indices, minlength=columns))
+    return indptr_t, rows[order], data[order]
+
+
+def _normalize_rows(matrix):
+    norms = np.linalg.norm(matrix, axis=1, keepdims=True)
+    return matrix / np.where(norms > 0, norms, 1)
+
+
+class TfidfSvdEmbeddings(Embeddings):
+    """
+    Local CPU embeddings: TF-IDF over the corpus vocabulary projected onto its
+    top singular vectors (latent semantic analysis).
+
+    Fitted once on our own chunks with fit(); embedding a batch is a sparse
+    matrix product with the stored projection, so queries need no network.
+    """
+
+    backend = "tfidf"
+
+    def __init__(self, vocab, idf, projection):
+        """
+        Args:
+            vocab (list): Terms, in column order
+            idf (np.ndarray): Inverse document frequency per term
+            projection (np.ndarray): (terms, dimension) SVD projection
+        """
+        self.vocab = list(vocab)
+        self.idf = np.asarray(idf, dtype=np.float32)
+        self.projection = np.ascontiguousarray(projection, dtype=np.float32)
+        self._ids = {term: i for i, term in enumerate(self.vocab)}
+        self.dimension = self.projection.shape[1]
+        digest = hashlib.sha1("\n".join(self.vocab).encode("utf-8"))
+        digest.update(self.projection.tobytes())
+        # Names this exact model: vectors from another fit are not comparable
+        self.model = f"tfidf-svd-{self.dimension}-{digest.hexdigest()[:12]}"
+
+    @classmethod
+    def fit(cls, texts, dimension=TFIDF_DIMENSION, max_vocab=TFIDF_MAX_VOCAB, min_df=TFIDF_MIN_DF, power_iterations=2, seed=0):
+        """
+        Fit the vocabulary, idf weights and SVD projection on a corpus.
+
+        The SVD is a randomized range finder (Halko et al.) with power iterations,
+        so the TF-IDF matrix is only ever multiplied, never densified.
+
+        Args:
+            texts (list): Chunk texts
+            dimension (int): Output dimension (capped by the corpus and vocabulary size)
+            max_vocab (int): Keep at most this many of the most frequent terms
+            min_df (int): Ignore terms found in fewer chunks than this
+            power_iterations (int): Extra passes that sharpen the singular vectors
+            seed (int): Random seed, so refitting the same corpus gives the same model
+
+        Returns:
+            TfidfSvdEmbeddings: Fitted model
+        """
+        token_lists = [tokenize(text) for text in texts]
+        df = Counter(term for tokens in token_lists for term in set(tokens))
+        frequent = sorted((term for term, count in df.items() if count >= min_df), key=lambda term: (-df[term], term))
+        vocab = sorted(frequent[:max_vocab])
+        if not vocab:
+            raise ValueError("No terms occur often enough to fit TF-IDF embeddings; add more documents.")
+        idf = np.array([math.log((1 + len(texts)) / (1 + df[term])) + 1 for term in vocab], dtype=np.float32)
+
+        indptr, indices, counts = _count_matrix(token_lists, {term: i for i, term in enumerate(vocab)})
+        data = _tfidf(indptr, indices, counts, idf)
+        indptr_t, indices_t, data_t = _transpose(indptr, indices, data, len(vocab))
+
+        dimension = min(dimension, len(vocab), len(texts))
+        width = min(dimension + 10, len(vocab), len(texts))
+        rng = np.random.default_rng(seed)
+        basis = np.linalg.qr(_sparse_dot(indptr, indices, data, rng.standard_normal((len(vocab), width)).astype(np.float32)))[0]
+        for _ in range(power_iterations):
+            terms = np.linalg.qr(_sparse_dot(indptr_t, indices_t, data_t, basis))[0]
+            basis = np.linalg.qr(_sparse_dot(indptr, indices, data, terms))[0]
+        # basis spans the top left singular vectors; the small SVD of basis^T X gives the right ones
+        _, _, right = np.linalg.svd(_sparse_dot(indptr_t, indices_t, data_t, basis).T, full_matrices=False)
+        return cls(vocab, idf, right[:dimension].T)
+
+    @classmethod
+    def load(cls, path=None):
+        """
+        Args:
+            path (str, optional): Model file written by save(); defaults to TFIDF_MODEL_PATH
+
+        Returns:
+            TfidfSvdEmbeddings: Model
+        """
+        path = path or TFIDF_MODEL_PATH
+        if not os.path.exists(path):
+            raise FileNotFoundError(f"TF-IDF embedding model not found at: {path}. "
+                                    "Fit it with: python build_faiss.py --embedding-backend tfidf")
+        with np.load(path) as model:
+            return cls(model["vocab"].tolist(), model["idf"], model["projection"])
+
+    def save(self, path=None):
+        path = path or TFIDF_MODEL_PATH
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        with open(f"{path}.tmp", "wb") as f:
+            np.savez(f, vocab=np.array(self.vocab), idf=self.idf, projection=self.projection)
+        os.replace(f"{path}.tmp", path)
+
+    def embed_matrix(self, texts):
+        """
+        Returns:
+            np.ndarray: (len(texts), dimension) unit-length float32 vectors; zeros
+            for texts without any known term
+        """
+        indptr, indices, counts = _count_matrix([tokenize(text) for text in texts], self._ids)
+        data = _tfidf(indptr, indices, counts, self.idf)
+        return _normalize_rows(_sparse_dot(indptr, indices, data, self.projection))
+
+    def embed_documents(self, texts):
+        return self.embed_matrix(texts).tolist()
+
+    def embed_query(self, text):
+        return self.embed_matrix([text])[0].tolist()
+
+    # A few microseconds of NumPy: cheaper inline than in the default executor thread
+    async def aembed_documents(self, texts):
+        return self.embed_documents(texts)
+
+    async def aembed_query(self, text):
+        return self.embed_query(text)
+
+
+def fit_tfidf_model(texts, path=None, dimension=TFIDF_DIMENSION):
+    """
+    Fit the local embedding model on the corpus chunks and save it.
+
+    Args:
+        texts (list): Chunk texts
+        path (str, optional): Model file; defaults to TFIDF_MODEL_PATH
+        dimension (int): Output dimension
+
+    Returns:
+        TfidfSvdEmbeddings: Fitted model
+    """
+    model = TfidfSvdEmbeddings.fit(texts, dimension)
+    model.save(path)
+    print(f"Fitted {model.model} on {len(texts)} chunks ({len(model.vocab)} terms) -> {path or TFIDF_MODEL_PATH}")
+    return model
+
+
+def get_embedding_backend(name=None, model_path=None):
+    """
+    Create the embeddings for a backend.
+
+    Args:
+        name (str, optional): "gemini" or "tfidf"; defaults to EMBEDDING_BACKEND
+        model_path (str, optional): tfidf model file; defaults to TFIDF_MODEL_PATH
+
+    Returns:
+        Embeddings: LangChain embeddings
+    """
+    name = name or EMBEDDING_BACKEND
+    if name == "gemini":
+        from langchain_google_genai import GoogleGenerativeAIEmbeddings
+        return GoogleGenerativeAIEmbeddings(model=GEMINI_MODEL)
+    if name == "tfidf":
+        return TfidfSvdEmbeddings.load(model_path)
+    raise ValueError(f"Unknown embedding backend '{name}'. Choose one of: {', '.join(EMBEDDING_BACKENDS)}")
+
+
+def embedding_info(embeddings):
+    """
+    Describe embeddings for the index metadata.
+
+    Args:
+        embeddings (Embeddings): Embeddings (cache wrappers are looked through)
+
+    Returns:
+        dict: {"backend", "model", "dimension"}; dimension is None when only known after a call
+    """
+    base = getattr(embeddings, "underlying", embeddings)
+    backend = getattr(base, "backend", None) or {"GoogleGenerativeAIEmbeddings": "gemini"}.get(type(base).__name__, type(base).__name__)
+    dimension = getattr(base, "dimension", None) or getattr(base, "size", None)
+    return {"backend": backend, "model": getattr(base, "model", None), "dimension": dimension}
+
+
+def embedding_mismatch(recorded, embeddings, index_dimension=None):
+    """
+    Compare the embeddings an index was built with to the ones about to query it.
+
+    Args:
+        recorded (dict or None): embedding_info() stored in the index metadata (None for old indexes)
+        embeddings (Embeddings): Embeddings that will be used
+        index_dimension (int, optional): Vector dimension of the index itself
+
+    Returns:
+        str or None: What differs, or None when they are compatible (or unknown)
+    """
+    current = embedding_info(embeddings)
+    recorded = recorded or {}
+    if recorded.get("model") and current["model"] and (recorded.get("backend"), recorded["model"]) != (current["backend"], current["model"]):
+        return (f"built with {recorded.get('backend')} embeddings ({recorded['model']}) "
+                f"but queried with {current['backend']} ({current['model']})")
+    dimension = recorded.get("dimension") or index_dimension
+    if dimension and current["dimension"] and dimension != current["dimension"]:
+        return f"built with {dimension}-dimensional vectors but the {current['backend']} embeddings produce {current['dimension']}"
+    return None
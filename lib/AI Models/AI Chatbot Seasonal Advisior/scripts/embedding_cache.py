@@ -0,0 +1,207 @@
+import asyncio
+import hashlib
+import inspect
+import os
+import sqlite3
+import threading
+from collections import OrderedDict
+
+import numpy as np
+from langchain_core.embeddings import Embeddings
+
+
+def normalize_query(text):
+    """
+    Normalize query text so trivially different spellings share one vector.
+
+    Args:
+        text (str): Raw query text
+
+    Returns:
+        str: Lower-cased text with collapsed whitespace
+    """
+    return " ".join(text.lower().split())
+
+
+def aembed_query_batch(embeddings, texts):
+    """
+    Embed several queries with as few requests as the backend allows.
+
+    Gemini embeds a whole list in one call when asked for query-type vectors
+    (identical to what embed_query returns); other backends fall back to one
+    embed_query per text, run concurrently.
+
+    Args:
+        embeddings (Embeddings): Embeddings to use
+        texts (list): Query texts
+
+    Returns:
+        list: One vector per text, in order
+    """
+    if isinstance(embeddings, CachedEmbeddings):
+        return embeddings.aembed_queries(texts)
+    return _aembed_uncached(embeddings, texts)
+
+
+_task_type_support = {}
+
+
+def _accepts_task_type(embeddings):
+    # Decided once per embeddings class from its signature (Gemini's takes task_type)
+    cls = type(embeddings)
+    if cls not in _task_type_support:
+        try:
+            _task_type_support[cls] = "task_type" in inspect.signature(embeddings.aembed_documents).parameters
+        except (TypeError, ValueError):
+            _task_type_support[cls] = False
+    return _task_type_support[cls]
+
+
+async def _aembed_uncached(embeddings, texts):
+    if not texts:
+        return []
+    if _accepts_task_type(embeddings):
+        return await embeddings.aembed_documents(texts, task_type="retrieval_query")
+    # Backend without query-type batch embedding
+    return await asyncio.gather(*(embeddings.aembed_query(text) for text in texts))
+
+
+class CachedEmbeddings(Embeddings):
+    """
+    Memoizing wrapper around a LangChain embeddings object.
+
+    Query vectors are looked up in an in-memory LRU first, then in a SQLite
+    table of float32 blobs that several uvicorn workers can share, and only
+    then requested from the underlying model. Document embeddings (index
+    builds) are passed straight through.
+    """
+
+    def __init__(self, underlying, path, max_memory_entries=10000, namespace=None):
+        """
+        Args:
+            underlying (Embeddings): Embeddings object that does the real work
+            path (str): SQLite database file shared between processes
+            max_memory_entries (int): Size of the in-process LRU
+            namespace (str, optional): Cache namespace; defaults to the model name
+        """
+        self.underlying = underlying
+        self.path = path
+        self.max_memory_entries = max_memory_entries
+        self.namespace = namespace or getattr(underlying, "model", type(underlying).__name__)
+        self.memory_hits = 0
+        self.disk_hits = 0
+        self.misses = 0
+        self._memory = OrderedDict()
+        self._lock = threading.Lock()
+        self._local = threading.local()
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        with self._connect() as conn:
+            conn.execute("CREATE TABLE IF NOT EXISTS query_embeddings (key TEXT PRIMARY KEY, vector BLOB NOT NULL)")
+
+    def _connect(self):
+        # One connection per thread; sqlite3 connections are not thread-safe
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = sqlite3.connect(self.path, timeout=30)
+            conn.execute("PRAGMA journal_mode=WAL")
+            self._local.conn = conn
+        return conn
+
+    def _key(self, text):
+        return hashlib.sha1(f"{self.namespace}\0{normalize_query(text)}".encode("utf-8")).hexdigest()
+
+    def _remember(self, key, vector):
+        with self._lock:
+            self._memory[key] = vector
+            self._memory.move_to_end(key)
+            if len(self._memory) > self.max_memory_entries:
+                self._memory.popitem(last=False)
+
+    def _lookup(self, key):
+        with self._lock:
+            vector = self._memory.get(key)
+            if vector is not None:
+                self._memory.move_to_end(key)
+                self.memory_hits += 1
+                return vector
+
+        row = self._connect().execute("SELECT vector FROM query_embeddings WHERE key = ?", (key,)).fetchone()
+        if row is None:
+            self.misses += 1
+            return None
+        vector = np.frombuffer(row[0], dtype=np.float32).tolist()
+        self.disk_hits += 1
+        self._remember(key, vector)
+        return vector
+
+    def _store(self, key, vector):
+        blob = np.asarray(vector, dtype=np.float32).tobytes()
+        with self._connect() as conn:
+            conn.execute("INSERT OR REPLACE INTO query_embeddings VALUES (?, ?)", (key, blob))
+        # Hand back the float32-rounded vector so hits and misses return identical values
+        vector = np.frombuffer(blob, dtype=np.float32).tolist()
+        self._remember(key, vector)
+        return vector
+
+    def embed_query(self, text):
+        key = self._key(text)
+        vector = self._lookup(key)
+        if vector is None:
+            vector = self._store(key, self.underlying.embed_query(text))
+        return vector
+
+    async def aembed_query(self, text):
+        key = self._key(text)
+        vector = self._lookup(key)
+        if vector is None:
+            vector = self._store(key, await self.underlying.aembed_query(text))
+        return vector
+
+    async def aembed_queries(self, texts):
+        """
+        Batch version of aembed_query: cached vectors are reused and all misses
+        go to the underlying model in one batch.
+
+        Args:
+            texts (list): Query texts
+
+        Returns:
+            list: One vector per text, in order
+        """
+        keys = [self._key(text) for text in texts]
+        vectors = {}
+        missing = {}
+        for key, text in zip(keys, texts):
+            if key in vectors or key in missing:
+                continue
+            vector = self._lookup(key)
+            if vector is None:
+                missing[key] = text
+            else:
+                vectors[key] = vector
+        if missing:
+            fresh = await _aembed_uncached(self.underlying, list(missing.values()))
+            for key, vector in zip(missing, fresh):
+                vectors[key] = self._store(key, vector)
+        return [vectors[key] for key in keys]
+
+    def embed_documents(self, texts):
+        return self.underlying.embed_documents(texts)
+
+    async def aembed_documents(self, texts):
+        return await self.underlying.aembed_documents(texts)
+
+    def stats(self):
+        """
+        Returns:
+            dict: Memory/disk hit and miss counters plus the overall hit rate
+        """
+        hits = self.memory_hits + self.disk_hits
+        total = hits + self.misses
+        return {
+            "memory_hits": self.memory_hits,
+            "disk_hits": self.disk_hits,
+            "misses": self.misses,
+            "hit_rate": hits / total if total else 0.0,
+            "memory_size": len(self._memory),
+        }
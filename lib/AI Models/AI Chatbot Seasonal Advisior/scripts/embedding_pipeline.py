@@ -0,0 +1,218 @@
+import os
+import random
+import sqlite3
+import threading
+import time
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+
+import numpy as np
+
+from scripts.load_data import batched
+
+
+def is_rate_limit_error(error):
+    """
+    Recognize quota / rate-limit errors from the embedding API.
+
+    Args:
+        error (Exception): Error raised by an embeddings call
+
+    Returns:
+        bool: True for HTTP 429 / ResourceExhausted style errors
+    """
+    text = f"{type(error).__name__} {error}".lower()
+    return any(marker in text for marker in ("429", "resourceexhausted", "resource exhausted", "quota", "rate limit"))
+
+
+class EmbeddingCheckpoint:
+    """
+    On-disk record of chunk vectors that have already been embedded.
+
+    Every finished batch is committed to SQLite, so a build that dies halfway
+    (quota, network, Ctrl-C) picks up where it stopped on the next run.
+    """
+
+    def __init__(self, path, namespace=""):
+        """
+        Args:
+            path (str): SQLite database file
+            namespace (str): Embedding model name; vectors from other models are ignored
+        """
+        self.path = path
+        self.namespace = namespace
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        self._conn = sqlite3.connect(path, timeout=30, check_same_thread=False)
+        self._lock = threading.Lock()
+        with self._conn:
+            self._conn.execute(
+                "CREATE TABLE IF NOT EXISTS vectors (namespace TEXT, chunk_id TEXT, vector BLOB, PRIMARY KEY (namespace, chunk_id))"
+            )
+
+    def get_many(self, chunk_ids):
+        """
+        Returns:
+            dict: chunk id -> vector (list of floats) for the ids already embedded
+        """
+        found = {}
+        with self._lock:
+            for ids in batched(chunk_ids, 500):
+                placeholders = ",".join("?" * len(ids))
+                rows = self._conn.execute(
+                    f"SELECT chunk_id, vector FROM vectors WHERE namespace = ? AND chunk_id IN ({placeholders})",
+                    [self.namespace, *ids],
+                )
+                found.update((cid, np.frombuffer(blob, dtype=np.float32).tolist()) for cid, blob in rows)
+        return found
+
+    def put_many(self, chunk_ids, vectors):
+        with self._lock, self._conn:
+            self._conn.executemany(
+                "INSERT OR REPLACE INTO vectors VALUES (?, ?, ?)",
+                [(self.namespace, cid, np.asarray(vector, dtype=np.float32).tobytes()) for cid, vector in zip(chunk_ids, vectors)],
+            )
+
+    def clear(self):
+        """Forget all checkpointed vectors (once they are safely in a saved index)."""
+        with self._lock, self._conn:
+            self._conn.execute("DELETE FROM vectors WHERE namespace = ?", (self.namespace,))
+
+
+class EmbeddingStage:
+    """
+    Embed a stream of chunks in fixed-size batches with bounded concurrency.
+
+    Rate-limit errors trigger a shared, jittered exponential cooldown and halve
+    the number of concurrent requests; each run of successes adds one slot back
+    (additive increase / multiplicative decrease). Other errors are retried
+    with backoff on their own. Finished batches go to the checkpoint first.
+    """
+
+    def __init__(self, embeddings, checkpoint=None, batch_size=100, max_concurrency=4,
+                 max_retries=8, base_delay=2.0, max_delay=120.0):
+        """
+        Args:
+            embeddings (Embeddings): Embeddings used for the chunks
+            checkpoint (EmbeddingCheckpoint, optional): Store of finished vectors
+            batch_size (int): Chunks per embedding request
+            max_concurrency (int): Upper bound on requests in flight
+            max_retries (int): Retries per batch before the build fails
+            base_delay (float): First backoff delay in seconds
+            max_delay (float): Cap on a single backoff delay
+        """
+        self.embeddings = embeddings
+        self.checkpoint = checkpoint
+        self.batch_size = batch_size
+        self.max_concurrency = max_concurrency
+        self.max_retries = max_retries
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+        self.rate_limited = 0
+        self._limit = max_concurrency
+        self._active = 0
+        self._successes = 0
+        self._cooldown_until = 0.0
+        self._cond = threading.Condition()
+
+    def _acquire(self):
+        with self._cond:
+            while True:
+                delay = self._cooldown_until - time.monotonic()
+                if delay > 0:
+                    self._cond.wait(delay)
+                elif self._active >= self._limit:
+                    self._cond.wait()
+                else:
+                    self._active += 1
+                    return
+
+    def _release(self, rate_limited_delay=None):
+        with self._cond:
+            self._active -= 1
+            if rate_limited_delay is not None:
+                self.rate_limited += 1
+                self._cooldown_until = max(self._cooldown_until, time.monotonic() + rate_limited_delay)
+                self._limit = max(1, self._limit // 2)
+                self._successes = 0
+            else:
+                self._successes += 1
+                if self._limit < self.max_concurrency and self._successes >= self._limit * 2:
+                    self._limit += 1
+                    self._successes = 0
+            self._cond.notify_all()
+
+    def _backoff(self, attempt):
+        return min(self.max_delay, self.base_delay * 2 ** attempt) * random.uniform(0.5, 1.5)
+
+    def _embed_batch(self, chunk_ids, texts):
+        done = self.checkpoint.get_many(chunk_ids) if self.checkpoint else {}
+        missing = [i for i, cid in enumerate(chunk_ids) if cid not in done]
+        if missing:
+            for attempt in range(self.max_retries + 1):
+                self._acquire()
+                try:
+                    vectors = self.embeddings.embed_documents([texts[i] for i in missing])
+                except Exception as e:
+                    if attempt == self.max_retries:
+                        self._release()
+                        raise
+                    delay = self._backoff(attempt)
+                    if is_rate_limit_error(e):
+                        print(f"Rate limited; backing off {delay:.1f}s and reducing concurrency")
+                        self._release(rate_limited_delay=delay)
+                    else:
+                        print(f"Embedding batch failed ({e}); retrying in {delay:.1f}s")
+                        self._release()
+                        time.sleep(delay)
+                    continue
+                self._release()
+                break
+
+            new_ids = [chunk_ids[i] for i in missing]
+            if self.checkpoint:
+                self.checkpoint.put_many(new_ids, vectors)
+            done.update(zip(new_ids, vectors))
+        return [done[cid] for cid in chunk_ids], len(missing)
+
+    def run(self, items, total_hint=None):
+        """
+        Embed (chunk id, Document) pairs.
+
+        Args:
+            items (iterable): (chunk id, Document) pairs, possibly a lazy stream
+            total_hint (callable, optional): Returns the estimated total number of
+                chunks so far, used for the time-left projection
+
+        Yields:
+            tuple: (chunk ids, Documents, vectors) per finished batch, in completion order
+        """
+        started = time.perf_counter()
+        embedded = reused = 0
+        batches = batched(items, self.batch_size)
+        with ThreadPoolExecutor(max_workers=self.max_concurrency) as pool:
+            in_flight = {}
+
+            def submit(count):
+                for batch in [b for b in (next(batches, None) for _ in range(count)) if b]:
+                    ids = [cid for cid, _ in batch]
+                    docs = [doc for _, doc in batch]
+                    in_flight[pool.submit(self._embed_batch, ids, [d.page_content for d in docs])] = (ids, docs)
+
+            submit(self.max_concurrency * 2)
+            while in_flight:
+                done, _ = wait(in_flight, return_when=FIRST_COMPLETED)
+                for future in done:
+                    ids, docs = in_flight.pop(future)
+                    vectors, fresh = future.result()
+                    embedded += fresh
+                    reused += len(ids) - fresh
+                    yield ids, docs, vectors
+
+                    elapsed = max(time.perf_counter() - started, 1e-9)
+                    rate = (embedded + reused) / elapsed
+                    line = f"Embedded {embedded} chunks ({reused} from checkpoint), {rate:.1f} chunks/s"
+                    total = total_hint() if total_hint else None
+                    if total and rate:
+                        remaining = max(total - embedded - reused, 0)
+                        line += f", ~{remaining / rate:.0f}s left for ~{remaining} chunks"
+                    print(line)
+                submit(len(done))
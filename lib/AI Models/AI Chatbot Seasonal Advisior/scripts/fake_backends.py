@@ -0,0 +1,278 @@
+import asyncio
+import hashlib
+import json
+import os
+import random
+import socket
+import sys
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import numpy as np
+from langchain_core.embeddings import Embeddings
+from langchain_core.language_models.llms import LLM
+from langchain_core.outputs import GenerationChunk
+
+
+def _fake_words(prompt, count):
+    digest = hashlib.sha1(prompt.encode("utf-8")).hexdigest()
+    return [f"word{digest[i % 40]}{i}" for i in range(count)]
+
+
+def isolate_state(workdir):
+    """
+    Point every cache and store the chatbot and seasonal advice persist at a
+    scratch directory and turn the semantic answer cache off, so offline runs
+    never read or overwrite production state.
+
+    Must be called before chatbot, scripts.seasonal_advice, scripts.load_data,
+    scripts.page_cache or scripts.metrics is imported: they read these settings
+    (and the semantic cache loads its file) at import time.
+
+    Args:
+        workdir (str): Scratch directory, e.g. a TemporaryDirectory
+
+    Returns:
+        dict: The environment variables that were set
+    """
+    loaded = [name for name in ("chatbot", "api", "scripts.seasonal_advice", "scripts.load_data", "scripts.page_cache",
+                                "scripts.metrics") if name in sys.modules]
+    if loaded:
+        raise RuntimeError(f"isolate_state() must run before importing {', '.join(loaded)}")
+    settings = {
+        "SEMANTIC_CACHE_ENABLED": "0",
+        "SEMANTIC_CACHE_PATH": os.path.join(workdir, "semantic_cache.npz"),
+        "EMBEDDING_CACHE_PATH": os.path.join(workdir, "query_embeddings.sqlite3"),
+        "ADVICE_STORE_PATH": os.path.join(workdir, "seasonal_advice.sqlite3"),
+        "PAGE_CACHE_PATH": os.path.join(workdir, "parsed_pages.sqlite3"),
+        "SLOW_REQUEST_LOG_PATH": os.path.join(workdir, "slow_requests.jsonl"),
+    }
+    os.environ.update(settings)
+    return settings
+
+
+class FakeEmbeddings(Embeddings):
+    """
+    Deterministic offline stand-in for the Gemini embeddings.
+
+    The same text always gets the same unit vector, and every request sleeps
+    for a fixed latency (plus a per-text cost for document batches) to mimic
+    the network round trip.
+    """
+
+    def __init__(self, size=768, latency=0.0, per_text_latency=0.0):
+        """
+        Args:
+            size (int): Vector dimension (Gemini's embedding-001 uses 768)
+            latency (float): Seconds per request
+            per_text_latency (float): Extra seconds per text in embed_documents
+        """
+        self.size = size
+        self.latency = latency
+        self.per_text_latency = per_text_latency
+        self.model = f"fake-{size}"
+
+    def _vector(self, text):
+        seed = int.from_bytes(hashlib.sha1(text.encode("utf-8")).digest()[:8], "little")
+        vector = np.random.default_rng(seed).standard_normal(self.size).astype(np.float32)
+        return (vector / np.linalg.norm(vector)).tolist()
+
+    def embed_documents(self, texts):
+        time.sleep(self.latency + self.per_text_latency * len(texts))
+        return [self._vector(text) for text in texts]
+
+    def embed_query(self, text):
+        time.sleep(self.latency)
+        return self._vector(text)
+
+    async def aembed_documents(self, texts):
+        await asyncio.sleep(self.latency + self.per_text_latency * len(texts))
+        return [self._vector(text) for text in texts]
+
+    async def aembed_query(self, text):
+        await asyncio.sleep(self.latency)
+        return self._vector(text)
+
+
+class FakeLLM(LLM):
+    """
+    Offline stand-in for Gemini that answers after a configurable delay.
+
+    The answer is a fixed number of words derived from the prompt, streamed
+    word by word with time_to_first_token before the first word and the rest
+    of latency spread over the others.
+    """
+
+    latency: float = 0.0
+    time_to_first_token: float = 0.0
+    answer_words: int = 120
+
+    @property
+    def _llm_type(self):
+        return "fake"
+
+    def _words(self, prompt):
+        return _fake_words(prompt, self.answer_words)
+
+    def _word_delay(self):
+        return max(self.latency - self.time_to_first_token, 0) / max(self.answer_words, 1)
+
+    def _call(self, prompt, stop=None, run_manager=None, **kwargs):
+        time.sleep(self.latency)
+        return " ".join(self._words(prompt))
+
+    async def _acall(self, prompt, stop=None, run_manager=None, **kwargs):
+        await asyncio.sleep(self.latency)
+        return " ".join(self._words(prompt))
+
+    def _stream(self, prompt, stop=None, run_manager=None, **kwargs):
+        time.sleep(self.time_to_first_token)
+        for i, word in enumerate(self._words(prompt)):
+            if i:
+                time.sleep(self._word_delay())
+            yield GenerationChunk(text=(" " if i else "") + word)
+
+    async def _astream(self, prompt, stop=None, run_manager=None, **kwargs):
+        await asyncio.sleep(self.time_to_first_token)
+        for i, word in enumerate(self._words(prompt)):
+            if i:
+                await asyncio.sleep(self._word_delay())
+            yield GenerationChunk(text=(" " if i else "") + word)
+
+
+class _FakeGeminiHandler(BaseHTTPRequestHandler):
+    # HTTP/1.1 so that clients can keep connections alive between requests
+    protocol_version = "HTTP/1.1"
+
+    def setup(self):
+        super().setup()
+        # Headers and body go out as separate writes; don't let Nagle hold the body back
+        self.connection.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+        self.server.stand_in._count("connections")
+
+    def log_message(self, format, *args):
+        pass
+
+    def do_POST(self):
+        stand_in = self.server.stand_in
+        body = json.loads(self.rfile.read(int(self.headers.get("Content-Length", 0))) or b"{}")
+        prompt = "".join(part.get("text", "") for content in body.get("contents", []) for part in content.get("parts", []))
+        stand_in._count("requests")
+        delay, fail = stand_in._draw()
+        try:
+            time.sleep(delay)
+            if fail:
+                stand_in._count("errors")
+                headers = {"Retry-After": str(stand_in.retry_after)} if stand_in.retry_after is not None else {}
+                self._send_json(503, {"error": {"code": 503, "message": "Injected failure", "status": "UNAVAILABLE"}},
+                                headers)
+            elif ":streamGenerateContent" in self.path:
+                self._send_stream(_fake_words(prompt, stand_in.answer_words))
+            elif ":generateContent" in self.path:
+                self._send_json(200, _candidate(" ".join(_fake_words(prompt, stand_in.answer_words))))
+            else:
+                self._send_json(404, {"error": {"code": 404, "message": f"Unknown method {self.path}"}})
+        except (BrokenPipeError, ConnectionResetError):
+            # The client gave up, e.g. a hedged request that lost the race
+            stand_in._count("abandoned")
+            self.close_connection = True
+
+    def _send_json(self, status, payload, headers=None):
+        data = json.dumps(payload).encode("utf-8")
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(data)))
+        for name, value in (headers or {}).items():
+            self.send_header(name, value)
+        self.end_headers()
+        self.wfile.write(data)
+
+    def _send_stream(self, words, words_per_event=10):
+        self.send_response(200)
+        self.send_header("Content-Type", "text/event-stream")
+        self.send_header("Transfer-Encoding", "chunked")
+        self.end_headers()
+        for start in range(0, len(words), words_per_event):
+            text = (" " if start else "") + " ".join(words[start:start + words_per_event])
+            event = f"data: {json.dumps(_candidate(text))}\r\n\r\n".encode("utf-8")
+            self.wfile.write(b"%x\r\n%s\r\n" % (len(event), event))
+            self.wfile.flush()
+        self.wfile.write(b"0\r\n\r\n")
+
+
+def _candidate(text):
+    return {"candidates": [{"content": {"role": "model", "parts": [{"text": text}]}, "finishReason": "STOP"}]}
+
+
+class FakeGeminiServer:
+    """
+    Local HTTP stand-in for the Gemini REST API (generateContent and
+    streamGenerateContent), for testing the LLM client against real sockets.
+
+    Each request waits latency seconds, or slow_latency for a slow_fraction of
+    requests to give the latency a long tail, and fails with a 503 for an
+    error_fraction of them (and for the first fail_first requests). Point
+    llm_client at it with base_url=server.url.
+    """
+
+    def __init__(self, latency=0.0, slow_fraction=0.0, slow_latency=0.0, error_fraction=0.0, answer_words=120, seed=0,
+                 fail_first=0, retry_after=None):
+        """
+        Args:
+            latency (float): Seconds before a normal response
+            slow_fraction (float): Share of requests that take slow_latency instead
+            slow_latency (float): Seconds before a slow response
+            error_fraction (float): Share of requests answered with 503
+            answer_words (int): Words in every answer
+            seed (int): Seed of the random draws, for reproducible runs
+            fail_first (int): Requests answered with 503 before any other
+            retry_after (float, optional): Retry-After header sent with every 503
+        """
+        self.latency = latency
+        self.slow_fraction = slow_fraction
+        self.slow_latency = slow_latency
+        self.error_fraction = error_fraction
+        self.fail_first = fail_first
+        self.retry_after = retry_after
+        self.answer_words = answer_words
+        self.counts = {"connections": 0, "requests": 0, "errors": 0, "abandoned": 0}
+        self._random = random.Random(seed)
+        self._lock = threading.Lock()
+        self._server = None
+        self._thread = None
+
+    def _count(self, name):
+        with self._lock:
+            self.counts[name] += 1
+
+    def _draw(self):
+        with self._lock:
+            slow = self._random.random() < self.slow_fraction
+            fail = self._random.random() < self.error_fraction or self.counts["requests"] <= self.fail_first
+        return (self.slow_latency if slow else self.latency), fail
+
+    @property
+    def url(self):
+        host, port = self._server.server_address[:2]
+        return f"http://{host}:{port}/v1beta"
+
+    def start(self):
+        self._server = ThreadingHTTPServer(("127.0.0.1", 0), _FakeGeminiHandler)
+        self._server.daemon_threads = True
+        self._server.stand_in = self
+        self._thread = threading.Thread(target=self._server.serve_forever, daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        if self._server is not None:
+            self._server.shutdown()
+            self._server.server_close()
+            self._server = None
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, *exc):
+        self.stop()
@@ -0,0 +1,283 @@
+import hashlib
+import json
+import os
+import time
+
+from langchain_community.vectorstores import FAISS
+
+from scripts.dedup import NearDuplicateIndex, dedup_report, location, minhash, set_locations
+from scripts.embedding_backends import embedding_info, embedding_mismatch
+from scripts.embedding_pipeline import EmbeddingStage
+from scripts.page_cache import file_sha256
+from scripts.vector_index import index_exists, load_index, read_index_config, save_index
+
+MANIFEST_NAME = "manifest.json"
+
+
+def chunk_id(doc):
+    """
+    Content-addressed id of a chunk: identical text from the same source page
+    always gets the same id, so unchanged chunks are never embedded twice.
+
+    Args:
+        doc (Document): Chunk Document
+
+    Returns:
+        str: Hex SHA-256 digest of source, page and text
+    """
+    key = f"{doc.metadata.get('source', '')}\0{doc.metadata.get('page', '')}\0{doc.page_content}"
+    return hashlib.sha256(key.encode("utf-8")).hexdigest()
+
+
+def load_manifest(index_path):
+    """
+    Read the build manifest stored next to a FAISS index.
+
+    Args:
+        index_path (str): FAISS index folder
+
+    Returns:
+        dict or None: {"settings": {...}, "files": {path: {"sha256", "chunks"}}}
+    """
+    path = os.path.join(index_path, MANIFEST_NAME)
+    if not os.path.exists(path):
+        return None
+    with open(path) as f:
+        return json.load(f)
+
+
+def save_manifest(index_path, manifest):
+    path = os.path.join(index_path, MANIFEST_NAME)
+    with open(f"{path}.tmp", "w") as f:
+        json.dump(manifest, f, indent=2)
+    os.replace(f"{path}.tmp", path)
+
+
+def update_index(files, load_files, embeddings, index_path, settings=None, full=False, batch_size=100,
+                 embedding_stage=None, index_config=None, dedup_threshold=None):
+    """
+    Build or incrementally update a FAISS index from a set of files.
+
+    Files whose hash matches the manifest are not even parsed. For new or
+    changed files only chunks that are not already in the index are embedded,
+    and chunks of changed or deleted files that no longer exist are removed
+    from the index and docstore. A full rebuild happens when there is no
+    previous index, when the build settings (e.g. chunk size) changed, or when
+    full=True.
+
+    With dedup_threshold, a new chunk that is a near-duplicate (MinHash/LSH over
+    word trigrams) of a chunk already indexed is not embedded; the manifest
+    records it against that chunk, whose "sources" metadata then lists every
+    source and page the passage appears on. Include the threshold in settings
+    so changing it triggers a rebuild.
+
+    Args:
+        files (list): Paths of the documents that make up the corpus
+        load_files (callable): Takes a list of paths and yields (path, chunks, error)
+            per file, like scripts.load_data.iter_file_chunks
+        embeddings (Embeddings): Embeddings used for new chunks
+        index_path (str): FAISS index folder to read and write
+        settings (dict, optional): Build settings recorded in the manifest
+        full (bool): Ignore the previous index and rebuild everything
+        batch_size (int): New chunks are embedded and added in batches of this size
+        embedding_stage (EmbeddingStage, optional): Batching/backoff/checkpoint policy
+            for embedding; defaults to a plain EmbeddingStage with batch_size
+        index_config (dict, optional): ANN index type and parameters written to disk
+            (see scripts.vector_index); defaults to an exact flat index
+        dedup_threshold (float, optional): Minimum estimated Jaccard similarity for two
+            chunks to be collapsed into one vector; None or 0 keeps every chunk
+
+    Returns:
+        dict: Report of files and chunks added, removed and kept
+    """
+    started = time.perf_counter()
+    settings = settings or {}
+    manifest = load_manifest(index_path)
+    if manifest is not None and manifest.get("settings") != settings:
+        print("Build settings changed since the last build; rebuilding from scratch.")
+        manifest = None
+    if manifest is not None and index_exists(index_path):
+        config = read_index_config(index_path)
+        mismatch = embedding_mismatch(config.get("embedding"), embeddings, config.get("dimension"))
+        if mismatch:
+            # Old vectors cannot be mixed with new ones
+            print(f"The index was {mismatch}; rebuilding from scratch.")
+            manifest = None
+    if manifest is None or full or not index_exists(index_path):
+        manifest = {"settings": settings, "files": {}}
+        db = None
+    else:
+        db = load_index(index_path, embeddings, mutable=True)
+
+    old_files = manifest["files"]
+    new_files = {}
+    report = {
+        "files_added": [], "files_changed": [], "files_removed": [], "files_failed": [], "files_unchanged": 0,
+        "chunks_added": 0, "chunks_removed": 0, "chunks_kept": 0, "chunks_deduplicated": 0,
+    }
+
+    existing_ids = set(db.index_to_docstore_id.values()) if db is not None else set()
+    hashes = {}
+    for path in files:
+        sha = file_sha256(path)
+        previous = old_files.get(path)
+        if previous and previous["sha256"] == sha:
+            new_files[path] = previous
+            report["files_unchanged"] += 1
+            report["chunks_kept"] += len(previous["chunks"])
+        else:
+            hashes[path] = sha
+
+    parsed = {"files": 0, "chunks": 0}
+    duplicates = NearDuplicateIndex(dedup_threshold) if dedup_threshold else None
+    # Chunks of unchanged files stay in the index, so new chunks may collapse into them.
+    # Chunks of changed files are only added as they are seen again (they may be going away).
+    unchanged_ids = [cid for entry in new_files.values() for cid in entry["chunks"]]
+    previous_db = db
+
+    def seed_duplicates():
+        for cid in unchanged_ids:
+            duplicates.add(cid, minhash(previous_db.docstore.search(cid).page_content))
+
+    def new_chunks():
+        # Stream chunks of new/changed files, yielding only the ones that need embedding
+        for path, chunks, error in load_files(list(hashes)):
+            parsed["files"] += 1
+            previous = old_files.get(path)
+            if error is not None:
+                # Keep whatever the index already has for this file and carry on
+                report["files_failed"].append(path)
+                if previous:
+                    new_files[path] = previous
+                continue
+
+            report["files_changed" if previous else "files_added"].append(path)
+            if duplicates is not None and unchanged_ids and not parsed.get("seeded"):
+                parsed["seeded"] = True
+                seed_duplicates()
+            ids, pages, collapsed, seen = [], [], [], set()
+            for doc in chunks:
+                cid = chunk_id(doc)
+                if cid in seen:
+                    continue  # identical chunk repeated on the same page
+                seen.add(cid)
+                if duplicates is not None:
+                    signature = minhash(doc.page_content)
+                    match = duplicates.query(signature)[0] if cid not in existing_ids else None
+                    if match is not None:
+                        # Same passage as a chunk already indexed (or queued): keep a pointer, not a vector
+                        collapsed.append([match, doc.metadata.get("page")])
+                        report["chunks_deduplicated"] += 1
+                        continue
+                    duplicates.add(cid, signature)
+                ids.append(cid)
+                pages.append(doc.metadata.get("page"))
+                if cid in existing_ids:
+                    report["chunks_kept"] += 1
+                else:
+                    parsed["chunks"] += 1
+                    yield cid, doc
+            new_files[path] = {"sha256": hashes[path], "chunks": ids}
+            if duplicates is not None:
+                new_files[path].update(pages=pages, duplicates=collapsed)
+
+    def estimated_total():
+        # Files are still being parsed while we embed, so extrapolate from those seen so far
+        if not parsed["files"]:
+            return None
+        return round(parsed["chunks"] / parsed["files"] * len(hashes))
+
+    stage = embedding_stage or EmbeddingStage(embeddings, batch_size=batch_size)
+    for ids, docs, vectors in stage.run(new_chunks(), total_hint=estimated_total):
+        text_embeddings = list(zip([doc.page_content for doc in docs], vectors))
+        metadatas = [doc.metadata for doc in docs]
+        if db is None:
+            db = FAISS.from_embeddings(text_embeddings, embeddings, metadatas=metadatas, ids=ids)
+        else:
+            db.add_embeddings(text_embeddings, metadatas=metadatas, ids=ids)
+        report["chunks_added"] += len(ids)
+
+    report["files_removed"] = [path for path in old_files if path not in new_files]
+
+    # Vectors of changed or deleted files whose chunks disappeared; a chunk that
+    # other files' near-duplicates point to stays while any of them is left
+    live_ids = {cid for entry in new_files.values() for cid in entry["chunks"]}
+    live_ids.update(cid for entry in new_files.values() for cid, _ in entry.get("duplicates", []))
+    stale_ids = [cid for cid in existing_ids if cid not in live_ids]
+    if stale_ids:
+        db.delete(stale_ids)
+    report["chunks_removed"] = len(stale_ids)
+
+    if db is None or not db.index_to_docstore_id:
+        raise ValueError("No document chunks to index. Check your data directory and file formats.")
+
+    relabeled = relabel_duplicates(db, new_files) if dedup_threshold else 0
+
+    os.makedirs(index_path, exist_ok=True)
+    index_config = index_config or {"type": "flat"}
+    # Indexes saved before the embedding was recorded are re-saved once (no re-embedding)
+    if (report["chunks_added"] or stale_ids or relabeled or not index_exists(index_path)
+            or manifest.get("index_config") != index_config or "embedding" not in read_index_config(index_path)):
+        save_index(db, index_path, index_config, embedding_info(embeddings))
+    manifest["index_config"] = index_config
+    manifest["files"] = new_files
+    save_manifest(index_path, manifest)
+
+    # The vectors are in the saved index now; the checkpoint is only needed until this point
+    if stage.checkpoint is not None:
+        stage.checkpoint.clear()
+
+    report["total_chunks"] = len(db.index_to_docstore_id)
+    collapsed = sum(len(entry.get("duplicates", [])) for entry in new_files.values())
+    report["dedup"] = dedup_report(report["total_chunks"] + collapsed, report["total_chunks"])
+    report["seconds"] = round(time.perf_counter() - started, 2)
+    return report
+
+
+def relabel_duplicates(db, files):
+    """
+    Recompute the "sources" metadata of collapsed chunks from the manifest.
+
+    Each chunk is listed under every source and page it (or a near-duplicate
+    of it) appears on; a chunk whose own file is gone is relabeled to the
+    first remaining copy.
+
+    Args:
+        db (FAISS): Mutable vector store
+        files (dict): Manifest file entries with "chunks", "pages" and "duplicates"
+
+    Returns:
+        int: Number of chunks whose metadata changed
+    """
+    places = {}
+    for path, entry in files.items():
+        for cid, page in zip(entry["chunks"], entry.get("pages", [])):
+            places.setdefault(cid, []).append({"source": os.path.basename(path), "page": page})
+    for path, entry in files.items():
+        for cid, page in entry.get("duplicates", []):
+            places.setdefault(cid, []).append({"source": os.path.basename(path), "page": page})
+
+    changed = 0
+    for cid in db.index_to_docstore_id.values():
+        doc = db.docstore.search(cid)
+        own = location(doc.metadata)
+        locations = places.get(cid, [own])
+        if own in locations:
+            locations = [own] + [place for place in locations if place != own]
+        changed += set_locations(doc.metadata, locations)
+    return changed
+
+
+def print_report(report):
+    """Print a human-readable summary of an update_index() report."""
+    print(f"Files: {len(report['files_added'])} added, {len(report['files_changed'])} changed, "
+          f"{len(report['files_removed'])} removed, {len(report['files_failed'])} failed, "
+          f"{report['files_unchanged']} unchanged")
+    for label in ("files_added", "files_changed", "files_removed", "files_failed"):
+        for path in report[label]:
+            print(f"  {label.split('_')[1]}: {path}")
+    print(f"Chunks: {report['chunks_added']} embedded, {report['chunks_removed']} removed, "
+          f"{report['chunks_kept']} reused ({report['total_chunks']} in index) in {report['seconds']}s")
+    if report["dedup"]["duplicates"]:
+        print(f"Near-duplicates: {report['chunks_deduplicated']} new chunks collapsed, "
+              f"{report['dedup']['duplicates']} in total ({report['dedup']['shrink']:.1%} smaller index)")
@@ -0,0 +1,177 @@
+import json
+import math
+import os
+import re
+from collections import Counter
+
+import numpy as np
+
+# Files of the keyword index (stored next to index.faiss)
+VOCAB_FILE = "bm25_vocab.json"
+INDPTR_FILE = "bm25_indptr.npy"
+POSTINGS_FILE = "bm25_postings.npy"
+TERM_FREQS_FILE = "bm25_tf.npy"
+DOC_LENGTHS_FILE = "bm25_doc_len.npy"
+LEXICAL_INDEX_FILES = (VOCAB_FILE, INDPTR_FILE, POSTINGS_FILE, TERM_FREQS_FILE, DOC_LENGTHS_FILE)
+
+TOKEN_PATTERN = re.compile(r"[a-z0-9]+")
+STOPWORDS = frozenset(
+    "a an and are as at be best by can do does for from how i in is it my of on or should "
+    "that the their this to we what when where which who why will with you your".split()
+)
+
+
+def tokenize(text):
+    """
+    Split text into lower-cased alphanumeric terms, dropping common stopwords.
+
+    Args:
+        text (str): Chunk text or query
+
+    Returns:
+        list: Terms in order of appearance
+    """
+    return [term for term in TOKEN_PATTERN.findall(text.lower()) if term not in STOPWORDS]
+
+
+def write_lexical_index(folder, texts):
+    """
+    Build a BM25 inverted index over chunk texts, in FAISS row order.
+
+    Posting lists are stored CSR-style: the postings of term t are
+    postings[indptr[t]:indptr[t + 1]] (row numbers, ascending) with matching
+    term frequencies in tf, so the index loads as a handful of mmap'd arrays.
+
+    Args:
+        folder (str): FAISS index folder
+        texts (list): Chunk texts, one per FAISS row
+    """
+    postings = {}
+    doc_lengths = np.empty(len(texts), dtype=np.int32)
+    for row, text in enumerate(texts):
+        terms = tokenize(text)
+        doc_lengths[row] = len(terms)
+        for term, count in Counter(terms).items():
+            postings.setdefault(term, []).append((row, count))
+
+    vocab = sorted(postings)
+    indptr = np.zeros(len(vocab) + 1, dtype=np.int64)
+    for i, term in enumerate(vocab):
+        indptr[i + 1] = indptr[i] + len(postings[term])
+    rows = np.empty(indptr[-1], dtype=np.int32)
+    freqs = np.empty(indptr[-1], dtype=np.float32)
+    for i, term in enumerate(vocab):
+        entries = np.array(postings[term], dtype=np.int64).reshape(-1, 2)
+        rows[indptr[i]:indptr[i + 1]] = entries[:, 0]
+        freqs[indptr[i]:indptr[i + 1]] = entries[:, 1]
+
+    with open(os.path.join(folder, VOCAB_FILE), "w") as f:
+        json.dump(vocab, f)
+    np.save(os.path.join(folder, INDPTR_FILE), indptr)
+    np.save(os.path.join(folder, POSTINGS_FILE), rows)
+    np.save(os.path.join(folder, TERM_FREQS_FILE), freqs)
+    np.save(os.path.join(folder, DOC_LENGTHS_FILE), doc_lengths)
+
+
+def has_lexical_index(folder):
+    return os.path.exists(os.path.join(folder, INDPTR_FILE))
+
+
+class BM25Index:
+    """
+    Read-only BM25 keyword index written by write_lexical_index.
+
+    Scoring touches only the posting lists of the query terms, so a search
+    costs a few vectorized array operations regardless of corpus size.
+    """
+
+    def __init__(self, folder, k1=1.5, b=0.75):
+        """
+        Args:
+            folder (str): FAISS index folder containing the keyword index
+            k1 (float): Term-frequency saturation
+            b (float): Document-length normalization
+        """
+        self.k1 = k1
+        self.b = b
+        with open(os.path.join(folder, VOCAB_FILE)) as f:
+            self.term_ids = {term: i for i, term in enumerate(json.load(f))}
+        self.indptr = np.load(os.path.join(folder, INDPTR_FILE), mmap_mode="r")
+        self.postings = np.load(os.path.join(folder, POSTINGS_FILE), mmap_mode="r")
+        self.term_freqs = np.load(os.path.join(folder, TERM_FREQS_FILE), mmap_mode="r")
+        self.doc_lengths = np.load(os.path.join(folder, DOC_LENGTHS_FILE))
+        self.num_docs = len(self.doc_lengths)
+        self.avg_doc_length = float(self.doc_lengths.mean()) if self.num_docs else 0.0
+
+    def _postings(self, term):
+        i = self.term_ids[term]
+        start, end = int(self.indptr[i]), int(self.indptr[i + 1])
+        return self.postings[start:end], self.term_freqs[start:end]
+
+    def search(self, query, k=5, allowed=None):
+        """
+        Rank chunks for a query with BM25.
+
+        Args:
+            query (str): User question or keywords
+            k (int): Number of hits to return
+            allowed (np.ndarray, optional): Boolean mask over rows; only these chunks are returned
+
+        Returns:
+            list: (row, score, matched terms) tuples, best first; matched terms is the
+            number of distinct query terms the chunk contains
+        """
+        terms = [term for term in dict.fromkeys(tokenize(query)) if term in self.term_ids]
+        if not terms or not self.num_docs:
+            return []
+
+        scores = np.zeros(self.num_docs, dtype=np.float32)
+        matched = np.zeros(self.num_docs, dtype=np.int32)
+        length_norm = self.k1 * (1 - self.b + self.b * self.doc_lengths / max(self.avg_doc_length, 1e-9))
+        for term in terms:
+            rows, tf = self._postings(term)
+            idf = math.log(1 + (self.num_docs - len(rows) + 0.5) / (len(rows) + 0.5))
+            scores[rows] += idf * tf * (self.k1 + 1) / (tf + length_norm[rows])
+            matched[rows] += 1
+        if allowed is not None:
+            matched[~allowed] = 0
+            scores[~allowed] = 0
+
+        k = min(k, int(np.count_nonzero(matched)))
+        top = np.argpartition(-scores, k - 1)[:k] if k else []
+        top = sorted(top, key=lambda row: -scores[row])
+        return [(int(row), float(scores[row]), int(matched[row])) for row in top]
+
+    def query_terms(self, query):
+        """
+        Returns:
+            tuple: (distinct query terms, how many of them occur in the corpus)
+        """
+        terms = list(dict.fromkeys(tokenize(query)))
+        return terms, sum(term in self.term_ids for term in terms)
+
+
+def load_lexical_index(folder):
+    """
+    Returns:
+        BM25Index or None: The keyword index of an index folder, if it has one
+    """
+    return BM25Index(folder) if has_lexical_index(folder) else None
+
+
+def reciprocal_rank_fusion(rankings, k=60):
+    """
+    Merge several rankings of the same items with reciprocal rank fusion.
+
+    Args:
+        rankings (list): Lists of item keys, best first
+        k (int): RRF damping constant; larger values flatten the rank weights
+
+    Returns:
+        list: Item keys ordered by fused score, best first
+    """
+    scores = {}
+    for ranking in rankings:
+        for rank, key in enumerate(ranking):
+            scores[key] = scores.get(key, 0.0) + 1.0 / (k + rank + 1)
+    return sorted(scores, key=scores.get, reverse=True)
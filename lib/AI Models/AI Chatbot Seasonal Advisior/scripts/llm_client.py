@@ -0,0 +1,550 @@
+import asyncio
+import json
+import os
+import random
+import threading
+import time
+from collections import deque
+
+import httpx
+from dotenv import load_dotenv
+from langchain_core.language_models.llms import LLM
+from langchain_core.outputs import GenerationChunk
+
+from scripts.metrics import LLM_HTTP_REQUESTS, register_stats
+
+load_dotenv()
+api_key = os.getenv("GOOGLE_API_KEY")
+
+# The chatbot and the seasonal advice share one pooled HTTP client for the Gemini
+# REST API. Point LLM_BASE_URL at a local stand-in (fake_backends.FakeGeminiServer)
+# to try latency and failures offline.
+DEFAULT_BASE_URL = "https://generativelanguage.googleapis.com/v1beta"
+LLM_BASE_URL = os.getenv("LLM_BASE_URL", DEFAULT_BASE_URL)
+LLM_MODEL = os.getenv("LLM_MODEL", "gemini-1.5-flash")
+LLM_TEMPERATURE = float(os.getenv("LLM_TEMPERATURE", "0.7"))
+
+# Idle connections stay open for LLM_KEEPALIVE_SECONDS, so most calls skip the
+# TCP and TLS handshakes. LLM_READ_TIMEOUT is the longest silence between bytes.
+LLM_MAX_CONNECTIONS = int(os.getenv("LLM_MAX_CONNECTIONS", "32"))
+LLM_MAX_KEEPALIVE = int(os.getenv("LLM_MAX_KEEPALIVE", "32"))
+LLM_KEEPALIVE_SECONDS = float(os.getenv("LLM_KEEPALIVE_SECONDS", "60"))
+LLM_CONNECT_TIMEOUT = float(os.getenv("LLM_CONNECT_TIMEOUT", "5"))
+LLM_READ_TIMEOUT = float(os.getenv("LLM_READ_TIMEOUT", "60"))
+
+# Connection errors, timeouts, 429 and 5xx are retried with full-jitter exponential
+# backoff (a server's Retry-After is honoured up to LLM_RETRY_MAX_SECONDS)
+LLM_MAX_RETRIES = int(os.getenv("LLM_MAX_RETRIES", "2"))
+LLM_RETRY_BASE_SECONDS = float(os.getenv("LLM_RETRY_BASE_SECONDS", "0.5"))
+LLM_RETRY_MAX_SECONDS = float(os.getenv("LLM_RETRY_MAX_SECONDS", "8"))
+RETRYABLE_STATUS = (408, 429, 500, 502, 503, 504)
+
+# Hedged requests (async calls only): a call still running after the
+# LLM_HEDGE_QUANTILE of recent latencies gets a duplicate, and whichever answers
+# first wins. Hedging waits for LLM_HEDGE_MIN_SAMPLES latencies and hedges at
+# most LLM_HEDGE_MAX_FRACTION of calls, so a slow API doesn't double its load.
+LLM_HEDGE_ENABLED = os.getenv("LLM_HEDGE_ENABLED", "0") == "1"
+LLM_HEDGE_QUANTILE = float(os.getenv("LLM_HEDGE_QUANTILE", "0.95"))
+LLM_HEDGE_MIN_SAMPLES = int(os.getenv("LLM_HEDGE_MIN_SAMPLES", "20"))
+LLM_HEDGE_MIN_DELAY = float(os.getenv("LLM_HEDGE_MIN_DELAY", "0.05"))
+LLM_HEDGE_MAX_FRACTION = float(os.getenv("LLM_HEDGE_MAX_FRACTION", "0.1"))
+
+# Recent latencies the hedge delay is computed from
+_LATENCY_WINDOW = 512
+
+_client = None
+_llm = None
+_lock = threading.Lock()
+
+
+class LLMError(Exception):
+    """The LLM API answered with an error, a blocked prompt or no text."""
+
+    def __init__(self, message, status_code=None, retry_after=None):
+        super().__init__(message)
+        self.status_code = status_code
+        self.retry_after = retry_after
+
+
+def _http_error(response):
+    try:
+        message = response.json()["error"]["message"]
+    except (ValueError, KeyError, TypeError):
+        message = response.text[:200]
+    try:
+        retry_after = float(response.headers.get("retry-after", ""))
+    except ValueError:
+        retry_after = None
+    return LLMError(f"LLM API returned {response.status_code}: {message}", response.status_code, retry_after)
+
+
+def _retryable(error):
+    if isinstance(error, LLMError):
+        return error.status_code in RETRYABLE_STATUS
+    return isinstance(error, httpx.TransportError)
+
+
+def _response_text(payload):
+    # generateContent and each streamGenerateContent event carry candidates[0].content.parts
+    candidates = payload.get("candidates") or []
+    if not candidates:
+        reason = (payload.get("promptFeedback") or {}).get("blockReason")
+        if reason:
+            raise LLMError(f"Prompt was blocked by the LLM API: {reason}")
+        return ""
+    parts = (candidates[0].get("content") or {}).get("parts") or []
+    text = "".join(part.get("text", "") for part in parts)
+    # SAFETY, RECITATION, MAX_TOKENS, ... without any text is a failed call, not an empty answer
+    # (stream events before the last have no finishReason)
+    reason = candidates[0].get("finishReason")
+    if not text and reason not in (None, "STOP"):
+        raise LLMError(f"LLM API returned no text (finishReason {reason})")
+    return text
+
+
+class LatencyTracker:
+    """
+    Sliding window of recent call latencies, for the hedge delay.
+    """
+
+    def __init__(self, window=_LATENCY_WINDOW):
+        self._samples = deque(maxlen=window)
+        self._lock = threading.Lock()
+
+    def add(self, seconds):
+        with self._lock:
+            self._samples.append(seconds)
+
+    def __len__(self):
+        return len(self._samples)
+
+    def quantile(self, q):
+        """
+        Returns:
+            float or None: The q-quantile of the window in seconds, None while it is empty
+        """
+        with self._lock:
+            samples = sorted(self._samples)
+        if not samples:
+            return None
+        return samples[min(int(q * len(samples)), len(samples) - 1)]
+
+
+class GeminiClient:
+    """
+    Gemini REST client with a keep-alive connection pool, timeouts, jittered
+    retries and, for async calls, hedged requests.
+
+    Streams are retried and hedged until their first chunk arrives; after that
+    a failure is passed on, since part of the answer has been sent already.
+    """
+
+    def __init__(self, model=LLM_MODEL, base_url=LLM_BASE_URL, api_key=api_key, temperature=LLM_TEMPERATURE,
+                 max_retries=LLM_MAX_RETRIES, hedge=LLM_HEDGE_ENABLED, hedge_quantile=LLM_HEDGE_QUANTILE,
+                 hedge_min_samples=LLM_HEDGE_MIN_SAMPLES, hedge_max_fraction=LLM_HEDGE_MAX_FRACTION):
+        """
+        Args:
+            model (str): Gemini model name
+            base_url (str): API root, e.g. DEFAULT_BASE_URL or a local stand-in
+            api_key (str): Google API key (a local stand-in doesn't need one)
+            temperature (float): Sampling temperature
+            max_retries (int): Retries after the first attempt of a call
+            hedge (bool): Send hedged duplicates of slow async calls
+            hedge_quantile (float): Latency quantile after which a call is hedged
+            hedge_min_samples (int): Latencies needed before hedging starts
+            hedge_max_fraction (float): Largest share of calls that may be hedged
+        """
+        self.model = model
+        self.base_url = base_url.rstrip("/")
+        self.api_key = api_key
+        self.temperature = temperature
+        self.max_retries = max_retries
+        self.hedge = hedge
+        self.hedge_quantile = hedge_quantile
+        self.hedge_min_samples = hedge_min_samples
+        self.hedge_max_fraction = hedge_max_fraction
+        self.latency = LatencyTracker()
+        self.first_chunk_latency = LatencyTracker()
+        self._counts = {"calls": 0, "retries": 0, "hedges": 0, "hedge_wins": 0, "errors": 0}
+        self._lock = threading.Lock()
+        self._client = None
+        self._async_clients = {}
+
+    def _client_options(self):
+        return {
+            "timeout": httpx.Timeout(LLM_READ_TIMEOUT, connect=LLM_CONNECT_TIMEOUT),
+            "limits": httpx.Limits(max_connections=LLM_MAX_CONNECTIONS, max_keepalive_connections=LLM_MAX_KEEPALIVE,
+                                   keepalive_expiry=LLM_KEEPALIVE_SECONDS),
+            "headers": {"x-goog-api-key": self.api_key} if self.api_key else {},
+        }
+
+    def _sync_client(self):
+        with self._lock:
+            if self._client is None:
+                self._client = httpx.Client(**self._client_options())
+            return self._client
+
+    def _async_client(self):
+        # An AsyncClient's connections belong to the event loop that opened them;
+        # scripts that call asyncio.run() repeatedly get one client per loop
+        loop = asyncio.get_running_loop()
+        with self._lock:
+            # Clients of loops closed without asyncio.run() can no longer be closed; let them go
+            for other in [other for other in self._async_clients if other.is_closed()]:
+                del self._async_clients[other]
+            if loop not in self._async_clients:
+                client = httpx.AsyncClient(**self._client_options())
+                self._async_clients[loop] = (client, loop.create_task(_close_on_shutdown(client)))
+            return self._async_clients[loop][0]
+
+    def _url(self, method):
+        if method == "streamGenerateContent":
+            return f"{self.base_url}/models/{self.model}:{method}?alt=sse"
+        return f"{self.base_url}/models/{self.model}:{method}"
+
+    def _body(self, prompt, stop=None):
+        config = {"temperature": self.temperature}
+        if stop:
+            config["stopSequences"] = list(stop)
+        return {"contents": [{"role": "user", "parts": [{"text": prompt}]}], "generationConfig": config}
+
+    def _count(self, name):
+        with self._lock:
+            self._counts[name] += 1
+
+    def _backoff(self, attempt, error):
+        # Full jitter keeps retries from many requests from arriving in lockstep
+        delay = random.uniform(0, min(LLM_RETRY_MAX_SECONDS, LLM_RETRY_BASE_SECONDS * 2 ** attempt))
+        retry_after = getattr(error, "retry_after", None)
+        if retry_after:
+            delay = max(delay, min(retry_after, LLM_RETRY_MAX_SECONDS))
+        return delay
+
+    def hedge_delay(self, tracker):
+        """
+        Returns:
+            float or None: Seconds to wait before hedging a call, None to not hedge it
+        """
+        if not self.hedge or len(tracker) < self.hedge_min_samples:
+            return None
+        return max(tracker.quantile(self.hedge_quantile), LLM_HEDGE_MIN_DELAY)
+
+    def _take_hedge(self):
+        with self._lock:
+            if self._counts["hedges"] >= self.hedge_max_fraction * self._counts["calls"]:
+                return False
+            self._counts["hedges"] += 1
+            return True
+
+    # Single attempts -------------------------------------------------------
+
+    def _post(self, body):
+        response = self._sync_client().post(self._url("generateContent"), json=body)
+        if response.status_code != 200:
+            raise _http_error(response)
+        return _response_text(response.json())
+
+    async def _apost(self, body):
+        response = await self._async_client().post(self._url("generateContent"), json=body)
+        if response.status_code != 200:
+            raise _http_error(response)
+        return _response_text(response.json())
+
+    def _stream_events(self, body):
+        with self._sync_client().stream("POST", self._url("streamGenerateContent"), json=body) as response:
+            if response.status_code != 200:
+                response.read()
+                raise _http_error(response)
+            for line in response.iter_lines():
+                if line.startswith("data:"):
+                    text = _response_text(json.loads(line[5:]))
+                    if text:
+                        yield text
+
+    async def _astream_events(self, body):
+        async with self._async_client().stream("POST", self._url("streamGenerateContent"), json=body) as response:
+            if response.status_code != 200:
+                await response.aread()
+                raise _http_error(response)
+            async for line in response.aiter_lines():
+                if line.startswith("data:"):
+                    text = _response_text(json.loads(line[5:]))
+                    if text:
+                        yield text
+
+    # Retries ---------------------------------------------------------------
+
+    def _retrying(self, attempt_fn, first_attempt="first"):
+        for attempt in range(self.max_retries + 1):
+            label = first_attempt if attempt == 0 else "retry"
+            try:
+                result = attempt_fn()
+            except (LLMError, httpx.TransportError) as e:
+                LLM_HTTP_REQUESTS.labels(label, "error").inc()
+                if not _retryable(e) or attempt == self.max_retries:
+                    raise
+                self._count("retries")
+                delay = self._backoff(attempt, e)
+                print(f"LLM request failed ({type(e).__name__}: {e}); retrying in {delay:.2f}s")
+                time.sleep(delay)
+            else:
+                LLM_HTTP_REQUESTS.labels(label, "ok").inc()
+                return result
+
+    async def _aretrying(self, attempt_fn, first_attempt="first"):
+        for attempt in range(self.max_retries + 1):
+            label = first_attempt if attempt == 0 else "retry"
+            try:
+                result = await attempt_fn()
+            except (LLMError, httpx.TransportError) as e:
+                LLM_HTTP_REQUESTS.labels(label, "error").inc()
+                if not _retryable(e) or attempt == self.max_retries:
+                    raise
+                self._count("retries")
+                delay = self._backoff(attempt, e)
+                print(f"LLM request failed ({type(e).__name__}: {e}); retrying in {delay:.2f}s")
+                await asyncio.sleep(delay)
+            except asyncio.CancelledError:
+                LLM_HTTP_REQUESTS.labels(label, "cancelled").inc()
+                raise
+            else:
+                LLM_HTTP_REQUESTS.labels(label, "ok").inc()
+                return result
+
+    def _open_stream(self, body):
+        # Pull the first chunk so that failures before it can still be retried
+        stream = self._stream_events(body)
+        try:
+            return next(stream, ""), stream
+        except BaseException:
+            stream.close()
+            raise
+
+    async def _aopen_stream(self, body):
+        stream = self._astream_events(body)
+        try:
+            return await anext(stream, ""), stream
+        except BaseException:
+            await stream.aclose()
+            raise
+
+    # Hedging ---------------------------------------------------------------
+
+    async def _timed(self, call, tracker, first_attempt):
+        started = time.perf_counter()
+        try:
+            result = await self._aretrying(call, first_attempt)
+        except asyncio.CancelledError:
+            # A cancelled call took at least this long; leaving it out would bias the quantile low
+            tracker.add(time.perf_counter() - started)
+            raise
+        tracker.add(time.perf_counter() - started)
+        return result
+
+    async def _hedged(self, call, tracker, discard=None):
+        """
+        Run a call, and a duplicate of it once it is slower than the hedge delay.
+
+        Args:
+            call (callable): Returns a new coroutine for one attempt
+            tracker (LatencyTracker): Latencies the hedge delay comes from
+            discard (callable, optional): Async cleanup for a result that lost the race
+
+        Returns:
+            object: The first successful result
+        """
+        self._count("calls")
+        delay = self.hedge_delay(tracker)
+        tasks = [asyncio.ensure_future(self._timed(call, tracker, "first"))]
+        winner = None
+        try:
+            if delay is not None:
+                done, _ = await asyncio.wait(tasks, timeout=delay)
+                if not done and self._take_hedge():
+                    tasks.append(asyncio.ensure_future(self._timed(call, tracker, "hedge")))
+            pending, error = set(tasks), None
+            while pending:
+                done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+                for task in done:
+                    if task.exception() is None:
+                        winner = task
+                        if task is not tasks[0]:
+                            self._count("hedge_wins")
+                        return task.result()
+                    error = error or task.exception()
+            self._count("errors")
+            raise error
+        finally:
+            for task in tasks:
+                task.cancel()
+            await asyncio.gather(*tasks, return_exceptions=True)
+            # Both may have finished in the same step; close the loser's stream
+            for task in tasks:
+                if task is not winner and discard is not None and not task.cancelled() and task.exception() is None:
+                    await discard(task.result())
+
+    # Public API ------------------------------------------------------------
+
+    def generate(self, prompt, stop=None):
+        """
+        Returns:
+            str: The model's answer to a prompt
+        """
+        self._count("calls")
+        started = time.perf_counter()
+        try:
+            text = self._retrying(lambda: self._post(self._body(prompt, stop)))
+        except Exception:
+            self._count("errors")
+            raise
+        self.latency.add(time.perf_counter() - started)
+        return text
+
+    async def agenerate(self, prompt, stop=None):
+        body = self._body(prompt, stop)
+        return await self._hedged(lambda: self._apost(body), self.latency)
+
+    def stream(self, prompt, stop=None):
+        """
+        Yields:
+            str: Chunks of the model's answer as they arrive
+        """
+        self._count("calls")
+        started = time.perf_counter()
+        try:
+            first, stream = self._retrying(lambda: self._open_stream(self._body(prompt, stop)))
+        except Exception:
+            self._count("errors")
+            raise
+        self.first_chunk_latency.add(time.perf_counter() - started)
+        try:
+            if first:
+                yield first
+            yield from stream
+        finally:
+            stream.close()
+
+    async def astream(self, prompt, stop=None):
+        body = self._body(prompt, stop)
+        first, stream = await self._hedged(lambda: self._aopen_stream(body), self.first_chunk_latency,
+                                           discard=lambda opened: opened[1].aclose())
+        try:
+            if first:
+                yield first
+            async for text in stream:
+                yield text
+        finally:
+            await stream.aclose()
+
+    async def aclose(self):
+        """
+        Close the pooled connections of the sync client and of every event loop's
+        async client. Clients of other loops that are still running are closed on
+        their own loop, without waiting for it.
+        """
+        current = asyncio.get_running_loop()
+        with self._lock:
+            async_clients, self._async_clients = self._async_clients, {}
+            client, self._client = self._client, None
+        for loop, (_, closer) in async_clients.items():
+            if loop is current:
+                closer.cancel()
+                await asyncio.wait([closer])
+            elif not loop.is_closed():
+                loop.call_soon_threadsafe(closer.cancel)
+        if client is not None:
+            client.close()
+
+    def stats(self):
+        """
+        Returns:
+            dict: Calls, retries, hedges sent and won, failed calls, and recent
+            latency quantiles in milliseconds
+        """
+        def quantiles(tracker):
+            return {f"p{round(q * 100)}_ms": round(value * 1000, 1) for q in (0.5, 0.95, 0.99)
+                    if (value := tracker.quantile(q)) is not None}
+
+        hedge_delay = self.hedge_delay(self.latency)
+        with self._lock:
+            counts = dict(self._counts)
+        return {**counts, "latency": quantiles(self.latency), "first_chunk": quantiles(self.first_chunk_latency),
+                "hedge_delay_ms": round(hedge_delay * 1000, 1) if hedge_delay is not None else 0}
+
+
+class PooledGeminiLLM(LLM):
+    """
+    LangChain LLM backed by a GeminiClient, so chains get pooling, retries
+    and hedging.
+    """
+
+    client: GeminiClient
+
+    model_config = {"arbitrary_types_allowed": True}
+
+    @property
+    def _llm_type(self):
+        return "gemini-pooled"
+
+    @property
+    def _identifying_params(self):
+        return {"model": self.client.model, "base_url": self.client.base_url}
+
+    def _call(self, prompt, stop=None, run_manager=None, **kwargs):
+        return self.client.generate(prompt, stop)
+
+    async def _acall(self, prompt, stop=None, run_manager=None, **kwargs):
+        return await self.client.agenerate(prompt, stop)
+
+    def _stream(self, prompt, stop=None, run_manager=None, **kwargs):
+        for text in self.client.stream(prompt, stop):
+            chunk = GenerationChunk(text=text)
+            if run_manager:
+                run_manager.on_llm_new_token(text, chunk=chunk)
+            yield chunk
+
+    async def _astream(self, prompt, stop=None, run_manager=None, **kwargs):
+        async for text in self.client.astream(prompt, stop):
+            chunk = GenerationChunk(text=text)
+            if run_manager:
+                await run_manager.on_llm_new_token(text, chunk=chunk)
+            yield chunk
+
+
+async def _close_on_shutdown(client):
+    # Runs until cancelled by aclose() or by asyncio.run(), which cancels leftover
+    # tasks before closing its loop, so the pool is closed while the loop still runs
+    try:
+        await asyncio.Future()
+    finally:
+        await client.aclose()
+
+
+def get_client():
+    """Return the process-wide GeminiClient, creating it on first use."""
+    global _client
+    with _lock:
+        if _client is None:
+            if not api_key and LLM_BASE_URL == DEFAULT_BASE_URL:
+                raise ValueError("Google API Key not found. Please set it in your .env file.")
+            _client = GeminiClient()
+        return _client
+
+
+def get_llm():
+    """Return the LangChain LLM shared by the chatbot and the seasonal advice."""
+    global _llm
+    client = get_client()
+    with _lock:
+        if _llm is None:
+            _llm = PooledGeminiLLM(client=client)
+        return _llm
+
+
+async def aclose():
+    """Close the shared client's connections, if it was ever created."""
+    if _client is not None:
+        await _client.aclose()
+
+
+register_stats("llm_client", "Pooled LLM client", lambda: _client.stats() if _client is not None else None)
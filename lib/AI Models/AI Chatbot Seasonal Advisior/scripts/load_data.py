@@ -1,64 +1,226 @@
-from langchain.document_loaders import PyPDFLoader, TextLoader, CSVLoader
+from langchain_community.document_loaders import PyPDFLoader, TextLoader, CSVLoader
 from langchain.text_splitter import RecursiveCharacterTextSplitter
+from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor, wait
+from itertools import islice
 import os
 import glob
+import time
 
-def load_and_split():
+from scripts.dedup import dedup_chunks
+from scripts.page_cache import PAGE_CACHE_PATH, open_page_cache
+
+# Loader used for each supported file extension
+LOADERS = {
+    ".pdf": PyPDFLoader,
+    ".txt": TextLoader,
+    ".csv": CSVLoader,
+}
+
+# Parsing is the slow step for PDFs; their pages are kept in the page cache
+CACHED_EXTENSIONS = {".pdf"}
+
+def list_data_files(data_path="data"):
     """
-    Load documents from various sources and split into chunks with metadata preservation.
-    
+    List the supported documents in the data folder.
+
+    Args:
+        data_path (str): Folder holding the source documents
+
     Returns:
-        list: List of Document objects with text and metadata
+        list: Paths of PDF, TXT and CSV files, sorted
+    """
+    return sorted(
+        path
+        for ext in LOADERS
+        for path in glob.glob(os.path.join(data_path, f"*{ext}"))
+    )
+
+def load_file(path, page_cache=PAGE_CACHE_PATH):
+    """
+    Load one document file into page/row Documents.
+
+    Args:
+        path (str): PDF, TXT or CSV file
+        page_cache (str, optional): Parsed-page cache database; PDFs whose contents
+            are already in it are not parsed again. None or "" always parses.
+
+    Returns:
+        list: Document objects with the file name as "source" metadata
+    """
+    ext = os.path.splitext(path)[1].lower()
+    cache = open_page_cache(page_cache) if ext in CACHED_EXTENSIONS else None
+    docs = cache.load(path, LOADERS[ext]) if cache is not None else LOADERS[ext](path).load()
+    # Add file source to metadata
+    for doc in docs:
+        doc.metadata["source"] = os.path.basename(path)
+    return docs
+
+def split_documents(documents, chunk_size=1000, chunk_overlap=200):
+    """
+    Split Documents into overlapping chunks, keeping their metadata.
+
+    Args:
+        documents (list): Document objects
+        chunk_size (int): Maximum characters per chunk
+        chunk_overlap (int): Characters shared by neighbouring chunks
+
+    Returns:
+        list: Chunk Document objects
     """
-    documents = []
-    
-    # Load all PDFs in data folder
-    pdf_files = glob.glob("data/*.pdf")
-    for file in pdf_files:
-        loader = PyPDFLoader(file)
-        docs = loader.load()
-        # Add file source to metadata
-        for doc in docs:
-            doc.metadata["source"] = os.path.basename(file)
-        documents.extend(docs)
-    
-    # Load all text files
-    txt_files = glob.glob("data/*.txt")
-    for file in txt_files:
-        loader = TextLoader(file)
-        docs = loader.load()
-        # Add metadata
-        for doc in docs:
-            doc.metadata["source"] = os.path.basename(file)
-        documents.extend(docs)
-    
-    # Load all CSV files
-    csv_files = glob.glob("data/*.csv")
-    for file in csv_files:
-        try:
-            loader = CSVLoader(file)
-            docs = loader.load()
-            # Add metadata
-            for doc in docs:
-                doc.metadata["source"] = os.path.basename(file)
-            documents.extend(docs)
-        except Exception as e:
-            print(f"Error loading CSV file {file}: {e}")
-    
-    print(f"Loaded {len(documents)} documents from {len(pdf_files)} PDFs, {len(txt_files)} TXTs, and {len(csv_files)} CSVs")
-    
-    # Split documents into manageable chunks
     text_splitter = RecursiveCharacterTextSplitter(
-        chunk_size=1000,  # Increased chunk size for better context
-        chunk_overlap=200,  # Increased overlap
-        separators=["\n\n", "\n", " ", ""]
+        chunk_size=chunk_size,
+        chunk_overlap=chunk_overlap,
+        separators=["\n\n", "\n", " ", ""],
+        # Offsets let the chatbot merge overlapping neighbours back into one passage
+        add_start_index=True
     )
+    return text_splitter.split_documents(documents)
+
+def load_and_split_file(path, chunk_size=1000, chunk_overlap=200, page_cache=PAGE_CACHE_PATH):
+    """
+    Load and split a single file. Runs inside the ingestion worker processes.
+
+    Args:
+        path (str): PDF, TXT or CSV file
+        chunk_size (int): Maximum characters per chunk
+        chunk_overlap (int): Characters shared by neighbouring chunks
+        page_cache (str, optional): Parsed-page cache database (None to always parse)
+
+    Returns:
+        tuple: (chunk Documents, number of pages/rows loaded)
+    """
+    pages = load_file(path, page_cache)
+    return split_documents(pages, chunk_size, chunk_overlap), len(pages)
+
+def iter_file_chunks(files, chunk_size=1000, chunk_overlap=200, workers=None, progress=True, page_cache=PAGE_CACHE_PATH):
+    """
+    Parse and split files across a process pool, yielding each file's chunks as soon as it is done.
+
+    Only a small window of files is in flight at a time, so memory stays
+    bounded by the largest few files rather than the whole corpus. A file that
+    fails to load is reported and skipped without stopping the others.
+
+    Args:
+        files (list): Paths of the documents to ingest
+        chunk_size (int): Maximum characters per chunk
+        chunk_overlap (int): Characters shared by neighbouring chunks
+        workers (int, optional): Worker processes (default: CPU count; 1 runs in-process)
+        progress (bool): Print per-file progress and a throughput summary
+        page_cache (str, optional): Parsed-page cache database; only PDFs that are new or
+            modified since they were cached are parsed (None to always parse)
+
+    Yields:
+        tuple: (path, list of chunk Documents, None) or (path, [], exception) for failed files
+    """
+    workers = workers or os.cpu_count() or 1
+    started = time.perf_counter()
+    totals = {"files": 0, "failed": 0, "pages": 0, "chunks": 0}
+
+    def report(path, chunks, pages, error):
+        totals["files"] += 1
+        if error is not None:
+            totals["failed"] += 1
+            if progress:
+                print(f"[{totals['files']}/{len(files)}] Error loading {path}: {error}")
+            return
+        totals["pages"] += pages
+        totals["chunks"] += len(chunks)
+        if progress:
+            print(f"[{totals['files']}/{len(files)}] {os.path.basename(path)}: {pages} pages -> {len(chunks)} chunks")
+
+    if workers == 1:
+        for path in files:
+            try:
+                chunks, pages = load_and_split_file(path, chunk_size, chunk_overlap, page_cache)
+            except Exception as e:
+                report(path, [], 0, e)
+                yield path, [], e
+                continue
+            report(path, chunks, pages, None)
+            yield path, chunks, None
+    else:
+        pending_files = iter(files)
+        with ProcessPoolExecutor(max_workers=workers) as pool:
+            in_flight = {}
+
+            def submit(count):
+                for path in islice(pending_files, count):
+                    in_flight[pool.submit(load_and_split_file, path, chunk_size, chunk_overlap, page_cache)] = path
+
+            submit(workers * 2)
+            while in_flight:
+                done, _ = wait(in_flight, return_when=FIRST_COMPLETED)
+                for future in done:
+                    path = in_flight.pop(future)
+                    try:
+                        chunks, pages = future.result()
+                    except Exception as e:
+                        report(path, [], 0, e)
+                        yield path, [], e
+                        continue
+                    report(path, chunks, pages, None)
+                    yield path, chunks, None
+                submit(len(done))
+
+    if progress:
+        elapsed = max(time.perf_counter() - started, 1e-9)
+        print(f"Ingested {totals['files'] - totals['failed']}/{len(files)} files ({totals['failed']} failed), "
+              f"{totals['pages']} pages, {totals['chunks']} chunks in {elapsed:.1f}s "
+              f"({totals['pages'] / elapsed:.1f} pages/s, {totals['chunks'] / elapsed:.1f} chunks/s, {workers} workers)")
+
+def iter_chunks(data_path="data", chunk_size=1000, chunk_overlap=200, workers=None, page_cache=PAGE_CACHE_PATH):
+    """
+    Stream the chunks of every supported document in the data folder.
+
+    Args:
+        data_path (str): Folder holding the source documents
+        chunk_size (int): Maximum characters per chunk
+        chunk_overlap (int): Characters shared by neighbouring chunks
+        workers (int, optional): Worker processes
+        page_cache (str, optional): Parsed-page cache database (None to always parse)
+
+    Yields:
+        Document: Chunks, file by file in completion order
+    """
+    files = list_data_files(data_path)
+    for _, chunks, _ in iter_file_chunks(files, chunk_size, chunk_overlap, workers, page_cache=page_cache):
+        yield from chunks
+
+def batched(iterable, size):
+    """
+    Group an iterable into lists of at most size items.
+
+    Args:
+        iterable (iterable): Items to group
+        size (int): Batch size
+
+    Yields:
+        list: Consecutive batches
+    """
+    iterator = iter(iterable)
+    while batch := list(islice(iterator, size)):
+        yield batch
+
+def load_and_split(dedup_threshold=None):
+    """
+    Load documents from various sources and split into chunks with metadata preservation.
+
+    Args:
+        dedup_threshold (float, optional): Collapse near-duplicate chunks (estimated
+            Jaccard similarity of word trigrams at least this) into one chunk whose
+            "sources" metadata lists every copy; None keeps all chunks
     
-    split_docs = text_splitter.split_documents(documents)
-    print(f"Split into {len(split_docs)} chunks")
-    
-    return split_docs
+    Returns:
+        list: List of Document objects with text and metadata
+    """
+    # Chunks of 1000 characters for better context, with 200 characters of overlap
+    chunks = list(iter_chunks("data", chunk_size=1000, chunk_overlap=200))
+    if not dedup_threshold:
+        return chunks
+    chunks, report = dedup_chunks(chunks, dedup_threshold)
+    print(f"Near-duplicates: {report['chunks_in']} -> {report['chunks_out']} chunks ({report['shrink']:.1%} fewer)")
+    return chunks
 
 if __name__ == "__main__":
     documents = load_and_split()
-    print(f"Loaded and split {len(documents)} text chunks from all documents!")
\ No newline at end of file
+    print(f"Loaded and split {len(documents)} text chunks from all documents!")
@@ -0,0 +1,179 @@
+import datetime
+import json
+import os
+import threading
+import time
+from contextlib import contextmanager
+
+from prometheus_client import REGISTRY, Counter, Gauge, Histogram
+from prometheus_client.core import GaugeMetricFamily
+
+from scripts.context_packing import count_tokens
+
+# Requests slower than this many seconds are written to SLOW_REQUEST_LOG_PATH with
+# their per-stage breakdown (0 disables the log)
+SLOW_REQUEST_SECONDS = float(os.getenv("SLOW_REQUEST_SECONDS", "0"))
+SLOW_REQUEST_LOG_PATH = os.getenv("SLOW_REQUEST_LOG_PATH", "logs/slow_requests.jsonl")
+
+# From cache hits and FAISS searches (about a millisecond) up to long Gemini answers
+LATENCY_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60)
+
+# Metrics live in the process; with several uvicorn workers each one reports its own
+REQUEST_SECONDS = Histogram("farm_advisor_request_seconds", "End-to-end latency of chatbot and advice requests",
+                            ["operation", "outcome"], buckets=LATENCY_BUCKETS)
+STAGE_SECONDS = Histogram("farm_advisor_stage_seconds", "Latency of each stage of a request",
+                          ["operation", "stage"], buckets=LATENCY_BUCKETS)
+IN_FLIGHT = Gauge("farm_advisor_in_flight_requests", "Requests currently being processed", ["operation"])
+QUEUE_DEPTH = Gauge("farm_advisor_queue_depth", "Requests waiting for an LLM slot")
+LLM_SLOTS_IN_USE = Gauge("farm_advisor_llm_slots_in_use", "Requests holding an LLM slot")
+SHED_REQUESTS = Counter("farm_advisor_shed_requests", "Requests rejected or cancelled instead of answered",
+                        ["operation", "reason"])
+LLM_HTTP_REQUESTS = Counter("farm_advisor_llm_http_requests", "HTTP requests sent to the LLM API",
+                            ["attempt", "outcome"])
+LLM_TOKENS = Counter("farm_advisor_llm_tokens", "LLM tokens sent and received (cl100k_base estimate)",
+                     ["operation", "direction"])
+
+_slow_log_lock = threading.Lock()
+
+
+class RequestTrace:
+    """
+    Timings of one request: each stage is observed in STAGE_SECONDS as it ends
+    and kept for the slow-request log; finish() records the total.
+    """
+
+    def __init__(self, operation, detail=None):
+        """
+        Args:
+            operation (str): Metric label, e.g. "ask" or "seasonal_advice"
+            detail (str, optional): What was asked, written to the slow-request log
+        """
+        self.operation = operation
+        self.detail = detail
+        self.outcome = "answered"
+        self.stages = {}
+        self.started = time.perf_counter()
+        self.finished = False
+        IN_FLIGHT.labels(operation).inc()
+
+    @contextmanager
+    def stage(self, name):
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.record(name, time.perf_counter() - started)
+
+    def record(self, name, seconds):
+        # Repeated stages (e.g. one LLM call per batch item) add up in the breakdown
+        self.stages[name] = self.stages.get(name, 0.0) + seconds
+        STAGE_SECONDS.labels(self.operation, name).observe(seconds)
+
+    def count_llm_tokens(self, prompt, completion):
+        LLM_TOKENS.labels(self.operation, "prompt").inc(count_tokens(prompt))
+        LLM_TOKENS.labels(self.operation, "completion").inc(count_tokens(completion))
+
+    def finish(self):
+        if self.finished:
+            return
+        self.finished = True
+        seconds = time.perf_counter() - self.started
+        IN_FLIGHT.labels(self.operation).dec()
+        REQUEST_SECONDS.labels(self.operation, self.outcome).observe(seconds)
+        # Coalesced callers only waited; the caller that did the work logs the breakdown
+        if SLOW_REQUEST_SECONDS > 0 and seconds >= SLOW_REQUEST_SECONDS and self.outcome != "coalesced":
+            self._log_slow(seconds)
+
+    def _log_slow(self, seconds):
+        entry = {
+            "time": datetime.datetime.now().isoformat(timespec="seconds"),
+            "operation": self.operation,
+            "outcome": self.outcome,
+            "total_ms": round(seconds * 1000, 1),
+            "stages_ms": {name: round(value * 1000, 1) for name, value in self.stages.items()},
+            "detail": (self.detail or "")[:200],
+        }
+        print(f"Slow {self.operation} request ({entry['total_ms']} ms): {entry['stages_ms']}")
+        try:
+            with _slow_log_lock:
+                os.makedirs(os.path.dirname(SLOW_REQUEST_LOG_PATH) or ".", exist_ok=True)
+                with open(SLOW_REQUEST_LOG_PATH, "a", encoding="utf-8") as f:
+                    f.write(json.dumps(entry) + "\n")
+        except OSError as e:
+            print(f"Could not write slow request log: {e}")
+
+
+@contextmanager
+def trace_request(operation, detail=None):
+    """
+    Trace a request for the duration of a with block.
+
+    The outcome is "error" if the block raises, "timeout" if it raises a
+    TimeoutError (e.g. a missed deadline) and "cancelled" if it is cancelled
+    (or a stream is closed early); the block may set trace.outcome to anything
+    more specific, e.g. "cache_hit".
+
+    Args:
+        operation (str): Metric label, e.g. "ask" or "seasonal_advice"
+        detail (str, optional): What was asked, written to the slow-request log
+
+    Yields:
+        RequestTrace: The running trace
+    """
+    trace = RequestTrace(operation, detail)
+    try:
+        yield trace
+    except TimeoutError:
+        trace.outcome = "timeout"
+        raise
+    except Exception:
+        trace.outcome = "error"
+        raise
+    except BaseException:
+        trace.outcome = "cancelled"
+        raise
+    finally:
+        trace.finish()
+
+
+class _StatsCollector:
+    # Exposes a stats() dict as gauges, read at scrape time
+    def __init__(self, name, description, stats):
+        self.name = name
+        self.description = description
+        self.stats = stats
+
+    def describe(self):
+        # Names depend on the stats at scrape time; don't call stats() on registration
+        return []
+
+    def collect(self):
+        try:
+            values = self.stats() or {}
+        except Exception as e:
+            print(f"Could not collect {self.name} metrics: {e}")
+            return
+        for key, value in _flatten(values):
+            if isinstance(value, (int, float)) and not isinstance(value, bool):
+                yield GaugeMetricFamily(f"farm_advisor_{self.name}_{key}", f"{self.description}: {key}", value=value)
+
+
+def _flatten(values, prefix=""):
+    for key, value in values.items():
+        if isinstance(value, dict):
+            yield from _flatten(value, f"{prefix}{key}_")
+        else:
+            yield f"{prefix}{key}", value
+
+
+def register_stats(name, description, stats):
+    """
+    Publish the numbers of a stats() function (cache hit rates, index size, ...)
+    as farm_advisor_<name>_<key> gauges. Nested dicts become <outer>_<inner> keys.
+
+    Args:
+        name (str): Metric name prefix, e.g. "semantic_cache"
+        description (str): Help text
+        stats (callable): Returns a dict of numbers, or None when there is nothing to report
+    """
+    REGISTRY.register(_StatsCollector(name, description, stats))
@@ -0,0 +1,153 @@
+import hashlib
+import json
+import os
+import sqlite3
+import threading
+import zlib
+from importlib import metadata
+
+from langchain_core.documents import Document
+
+# Extracted page text of every parsed PDF, keyed by file content, so re-chunking
+# or rebuilding the index only parses new or modified files. An empty
+# PAGE_CACHE_PATH turns the cache off.
+PAGE_CACHE_PATH = os.getenv("PAGE_CACHE_PATH", "cache/parsed_pages.sqlite3")
+
+# Bump when a change to loading (not splitting) makes cached pages stale
+PAGE_CACHE_FORMAT = 1
+
+_caches = {}
+_caches_lock = threading.Lock()
+
+
+def file_sha256(path):
+    """
+    Hash a file's contents.
+
+    Args:
+        path (str): File to hash
+
+    Returns:
+        str: Hex SHA-256 digest
+    """
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        for block in iter(lambda: f.read(1 << 20), b""):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+def _package_version(name):
+    try:
+        return metadata.version(name)
+    except metadata.PackageNotFoundError:
+        return ""
+
+
+def parser_tag(loader):
+    """
+    Name the parser behind a loader class: another parser, or another version
+    of pypdf, may extract different text from the same file.
+
+    Returns:
+        str: e.g. "PyPDFLoader/pypdf-5.1.0/1"
+    """
+    return f"{loader.__name__}/pypdf-{_package_version('pypdf')}/{PAGE_CACHE_FORMAT}"
+
+
+class PageCache:
+    """
+    SQLite table of parsed pages, one row per file version.
+
+    Each row holds a file's pages as zlib-compressed JSON ([text, metadata]
+    pairs). The database is shared by the ingestion worker processes; when a
+    file changes, its new pages replace the old row of the same file name.
+    """
+
+    def __init__(self, path=PAGE_CACHE_PATH):
+        """
+        Args:
+            path (str): SQLite database file
+        """
+        self.path = path
+        self.hits = 0
+        self.misses = 0
+        self._local = threading.local()
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        with self._connect() as conn:
+            conn.execute("CREATE TABLE IF NOT EXISTS pages "
+                         "(key TEXT PRIMARY KEY, source TEXT NOT NULL, pages INTEGER NOT NULL, data BLOB NOT NULL)")
+
+    def _connect(self):
+        # One connection per thread, and never one inherited from a forked parent
+        conn = getattr(self._local, "conn", None)
+        if conn is None or self._local.pid != os.getpid():
+            conn = sqlite3.connect(self.path, timeout=30)
+            conn.execute("PRAGMA journal_mode=WAL")
+            self._local.conn, self._local.pid = conn, os.getpid()
+        return conn
+
+    def get(self, key):
+        """
+        Returns:
+            list or None: Cached page Documents (without "source" metadata), or None on a miss
+        """
+        row = self._connect().execute("SELECT data FROM pages WHERE key = ?", (key,)).fetchone()
+        if row is None:
+            self.misses += 1
+            return None
+        self.hits += 1
+        return [Document(page_content=text, metadata=page_metadata)
+                for text, page_metadata in json.loads(zlib.decompress(row[0]))]
+
+    def put(self, key, source, docs):
+        """
+        Args:
+            key (str): Cache key of the file version
+            source (str): File name; older versions of the same file are dropped
+            docs (list): Parsed page Documents
+        """
+        pages = [[doc.page_content, {k: v for k, v in doc.metadata.items() if k != "source"}] for doc in docs]
+        data = zlib.compress(json.dumps(pages, separators=(",", ":"), default=str).encode("utf-8"))
+        with self._connect() as conn:
+            conn.execute("DELETE FROM pages WHERE source = ? AND key != ?", (source, key))
+            conn.execute("INSERT OR REPLACE INTO pages VALUES (?, ?, ?, ?)", (key, source, len(docs), data))
+
+    def load(self, path, loader):
+        """
+        Parse a file with a LangChain loader class, or return its cached pages.
+
+        Args:
+            path (str): Document file
+            loader (type): Loader class, e.g. PyPDFLoader
+
+        Returns:
+            list: Page Documents
+        """
+        key = f"{file_sha256(path)}:{parser_tag(loader)}"
+        docs = self.get(key)
+        if docs is None:
+            docs = loader(path).load()
+            self.put(key, os.path.basename(path), docs)
+        return docs
+
+    def stats(self):
+        """
+        Returns:
+            dict: Hits and misses in this process, plus the files and pages stored
+        """
+        files, pages = self._connect().execute("SELECT COUNT(*), COALESCE(SUM(pages), 0) FROM pages").fetchone()
+        return {"hits": self.hits, "misses": self.misses, "files": files, "pages": pages}
+
+
+def open_page_cache(path=PAGE_CACHE_PATH):
+    """
+    Returns:
+        PageCache or None: This process's cache for a database file; None when path is empty
+    """
+    if not path:
+        return None
+    with _caches_lock:
+        if path not in _caches:
+            _caches[path] = PageCache(path)
+        return _caches[path]
@@ -0,0 +1,51 @@
+import numpy as np
+
+
+def _normalize_rows(matrix):
+    norms = np.linalg.norm(matrix, axis=-1, keepdims=True)
+    return matrix / np.where(norms == 0, 1, norms)
+
+
+def mmr_select(query, candidates, k, lambda_mult=0.5, groups=None, max_per_group=None):
+    """
+    Pick k candidates by maximal marginal relevance.
+
+    Each step takes the candidate maximizing
+    lambda_mult * sim(query, c) - (1 - lambda_mult) * max sim(c, already picked),
+    so near-copies of chunks already chosen are pushed down. All similarities
+    are cosine and come from one matrix product over the candidate vectors.
+
+    Args:
+        query (array-like): Query embedding
+        candidates (np.ndarray): Candidate vectors, one row per candidate
+        k (int): Number of candidates to pick
+        lambda_mult (float): 1 = pure relevance, 0 = pure diversity
+        groups (array-like, optional): Group of each candidate (e.g. source id)
+        max_per_group (int, optional): Pick at most this many candidates per group
+
+    Returns:
+        list: Indices into candidates, in pick order
+    """
+    if not len(candidates):
+        return []
+    vectors = _normalize_rows(np.asarray(candidates, dtype=np.float32))
+    relevance = vectors @ _normalize_rows(np.asarray(query, dtype=np.float32).ravel())
+    similarity = vectors @ vectors.T
+
+    available = np.ones(len(vectors), dtype=bool)
+    redundancy = np.full(len(vectors), -np.inf, dtype=np.float32)
+    group_counts = {}
+    picked = []
+    while len(picked) < k and available.any():
+        penalty = np.where(np.isinf(redundancy), 0, redundancy)  # nothing picked yet: no penalty
+        scores = np.where(available, lambda_mult * relevance - (1 - lambda_mult) * penalty, -np.inf)
+        best = int(np.argmax(scores))
+        available[best] = False
+        if groups is not None and max_per_group:
+            group = groups[best]
+            if group_counts.get(group, 0) >= max_per_group:
+                continue
+            group_counts[group] = group_counts.get(group, 0) + 1
+        picked.append(best)
+        redundancy = np.maximum(redundancy, similarity[best])
+    return picked
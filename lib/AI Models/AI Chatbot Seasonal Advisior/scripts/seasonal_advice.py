@@ -1,14 +1,30 @@
 import datetime
-from langchain_google_genai import GoogleGenerativeAI
 from dotenv import load_dotenv
 import os
 
+from scripts.admission import LLM_DEADLINE_SECONDS, with_deadline
+from scripts.advice_store import AdviceStore, normalize_key
+from scripts.llm_client import get_llm as get_shared_llm
+from scripts.metrics import register_stats, trace_request
+from scripts.single_flight import AsyncSingleFlight, SingleFlight
+
 # Load API key
 load_dotenv()
 api_key = os.getenv("GOOGLE_API_KEY")
 
-# Initialize Gemini Model
-llm = GoogleGenerativeAI(model="gemini-1.5-flash")
+# Gemini Model, the shared pooled client unless injected with configure()
+_llm = None
+
+# Generated advice only depends on (location, crop, season), so it is stored and reused
+ADVICE_STORE_ENABLED = os.getenv("ADVICE_STORE_ENABLED", "1") == "1"
+ADVICE_STORE_PATH = os.getenv("ADVICE_STORE_PATH", "cache/seasonal_advice.sqlite3")
+_advice_store = None
+_purged_seasons = {}
+
+# Concurrent requests for the same advice share one LLM call
+COALESCE_ENABLED = os.getenv("COALESCE_ENABLED", "1") == "1"
+_advice_flight = SingleFlight()
+_aadvice_flight = AsyncSingleFlight()
 
 # Define seasons for Northern and Southern hemispheres
 NORTHERN_SEASONS = {
@@ -25,17 +41,42 @@ SOUTHERN_SEASONS = {
     (12, 21): "Summer"
 }
 
-def get_current_season(hemisphere="northern"):
+def configure(llm=None):
+    """
+    Replace the LLM used for seasonal advice (e.g. with a local fake for offline testing).
+
+    Args:
+        llm (BaseLLM): LangChain LLM used to generate advice
+    """
+    global _llm
+    _llm = llm
+
+def get_llm():
+    """Return the configured LLM, defaulting to the pooled Gemini client shared with the chatbot."""
+    global _llm
+    if _llm is None:
+        _llm = get_shared_llm()
+    return _llm
+
+def get_advice_store():
+    """Return the shared advice store, opening it on first use (None if disabled)."""
+    global _advice_store
+    if ADVICE_STORE_ENABLED and _advice_store is None:
+        _advice_store = AdviceStore(ADVICE_STORE_PATH)
+    return _advice_store
+
+def get_current_season(hemisphere="northern", date=None):
     """
     Determine the current season based on date and hemisphere.
     
     Args:
         hemisphere (str): "northern" or "southern"
+        date (datetime.date, optional): Day to evaluate; defaults to today
     
     Returns:
         str: Current season name
     """
-    today = datetime.datetime.now()
+    today = date or datetime.datetime.now()
     current_month, current_day = today.month, today.day
     
     seasons = NORTHERN_SEASONS if hemisphere.lower() == "northern" else SOUTHERN_SEASONS
@@ -61,22 +102,44 @@ def get_current_season(hemisphere="northern"):
     # Default to winter if something goes wrong
     return seasons[(12, 21)]
 
-def get_seasonal_advice(location, crop_type=None, hemisphere="northern"):
+def get_season_window(hemisphere="northern", date=None):
     """
-    Generate seasonal farming advice based on location, crop type, and current season.
-    
+    Find the season containing a date together with its boundaries.
+
+    Args:
+        hemisphere (str): "northern" or "southern"
+        date (datetime.date, optional): Day to evaluate; defaults to today
+
+    Returns:
+        tuple: (season name, start date, start date of the next season)
+    """
+    date = date or datetime.date.today()
+    if isinstance(date, datetime.datetime):
+        date = date.date()
+    seasons = NORTHERN_SEASONS if hemisphere.lower() == "northern" else SOUTHERN_SEASONS
+
+    boundaries = sorted(
+        datetime.date(year, month, day)
+        for year in (date.year - 1, date.year, date.year + 1)
+        for month, day in seasons
+    )
+    i = max(i for i, boundary in enumerate(boundaries) if boundary <= date)
+    start = boundaries[i]
+    return seasons[(start.month, start.day)], start, boundaries[i + 1]
+
+def build_advice_prompt(location, crop_type, season):
+    """
+    Construct the seasonal advice prompt for the LLM.
+
     Args:
         location (str): Geographic location (country, region, etc.)
         crop_type (str, optional): Specific crop for targeted advice
-        hemisphere (str): "northern" or "southern"
-    
+        season (str): Season name, as returned by get_current_season
+
     Returns:
-        str: Seasonal farming advice
+        str: Prompt text
     """
-    season = get_current_season(hemisphere)
-    
-    # Construct prompt for LLM
-    prompt = f"""
+    return f"""
     As an agricultural expert, provide practical seasonal farming advice for {location} 
     during {season} season. 
     
@@ -91,12 +154,226 @@ def get_seasonal_advice(location, crop_type=None, hemisphere="northern"):
     
     Format the response with clear headings and bullet points for easy reading.
     """
+
+def _stored_advice(location, crop_type, hemisphere, season_start):
+    store = get_advice_store()
+    if store is None:
+        return None
+    # Drop ended seasons' entries the first time today's season is seen (i.e. at each rollover)
+    _, current_start, _ = get_season_window(hemisphere)
+    if _purged_seasons.get(hemisphere.lower()) != current_start:
+        store.purge_expired(hemisphere, current_start)
+        _purged_seasons[hemisphere.lower()] = current_start
+    # Blank advice stored before empty completions were rejected counts as a miss
+    return store.get(location, crop_type or "", hemisphere, season_start) or None
+
+def _save_advice(location, crop_type, hemisphere, season, season_start, advice):
+    # An empty completion (blocked, aborted or failed stream) would be served for the rest of the season
+    if not advice or not advice.strip():
+        print(f"Not storing empty seasonal advice for {location} / {crop_type or 'any crop'}")
+        return
+    store = get_advice_store()
+    if store is not None:
+        store.put(location, crop_type or "", hemisphere, season, season_start, advice)
+
+def _flight_key(location, crop_type, hemisphere, season_start):
+    return normalize_key(location, crop_type or ""), hemisphere.lower(), season_start
+
+def coalescing_stats():
+    """
+    Returns:
+        dict: Single-flight counters for sync and async advice; "coalesced" is the number of saved calls
+    """
+    return {"sync": _advice_flight.stats(), "async": _aadvice_flight.stats()}
+
+# Exported on /metrics next to the request and stage latency histograms
+register_stats("advice_store", "Seasonal advice store", lambda: _advice_store.stats() if _advice_store is not None else None)
+register_stats("advice_coalescing", "Seasonal advice coalescing", coalescing_stats)
+
+def _trace_detail(location, crop_type, hemisphere):
+    return f"{location} / {crop_type or 'any crop'} / {hemisphere}"
+
+def get_seasonal_advice(location, crop_type=None, hemisphere="northern", date=None):
+    """
+    Generate seasonal farming advice based on location, crop type, and current season.
+
+    Advice already generated for the same location, crop and season is served
+    from the advice store without calling the LLM, and concurrent requests for
+    the same advice share one LLM call.
     
-    # Get response from Gemini
-    response = llm.invoke(prompt)
+    Args:
+        location (str): Geographic location (country, region, etc.)
+        crop_type (str, optional): Specific crop for targeted advice
+        hemisphere (str): "northern" or "southern"
+        date (datetime.date, optional): Day whose season to advise on; defaults to today
     
-    # The response itself is the generated text, not response.content
-    return response
+    Returns:
+        str: Seasonal farming advice
+    """
+    with trace_request("seasonal_advice", _trace_detail(location, crop_type, hemisphere)) as trace:
+        season, season_start, _ = get_season_window(hemisphere, date)
+        with trace.stage("store_lookup"):
+            advice = _stored_advice(location, crop_type, hemisphere, season_start)
+        if advice is not None:
+            trace.outcome = "cache_hit"
+            return advice
+
+        def generate():
+            prompt = build_advice_prompt(location, crop_type, season)
+
+            # Get response from Gemini
+            with trace.stage("llm"):
+                response = get_llm().invoke(prompt)
+
+            # The response itself is the generated text, not response.content
+            with trace.stage("store_save"):
+                _save_advice(location, crop_type, hemisphere, season, season_start, response)
+            trace.count_llm_tokens(prompt, response)
+            return response
+
+        if not COALESCE_ENABLED:
+            return generate()
+        advice = _advice_flight.run(_flight_key(location, crop_type, hemisphere, season_start), generate)
+        if "llm" not in trace.stages:
+            trace.outcome = "coalesced"  # another caller's trace holds the LLM call
+        return advice
+
+async def aget_seasonal_advice(location, crop_type=None, hemisphere="northern", date=None):
+    """
+    Async version of get_seasonal_advice, using the LLM's async interface.
+
+    Args:
+        location (str): Geographic location (country, region, etc.)
+        crop_type (str, optional): Specific crop for targeted advice
+        hemisphere (str): "northern" or "southern"
+        date (datetime.date, optional): Day whose season to advise on; defaults to today
+
+    Returns:
+        str: Seasonal farming advice
+    """
+    with trace_request("seasonal_advice", _trace_detail(location, crop_type, hemisphere)) as trace:
+        season, season_start, _ = get_season_window(hemisphere, date)
+        with trace.stage("store_lookup"):
+            advice = _stored_advice(location, crop_type, hemisphere, season_start)
+        if advice is not None:
+            trace.outcome = "cache_hit"
+            return advice
+        return await _agenerate(trace, location, crop_type, hemisphere, season, season_start)
+
+async def agenerate_seasonal_advice(location, crop_type=None, hemisphere="northern", date=None):
+    """
+    Generate and store advice without looking in the advice store first
+    (pre-generation checks the store itself), so the store's hit/miss
+    counters only reflect user requests.
+
+    Args:
+        location (str): Geographic location (country, region, etc.)
+        crop_type (str, optional): Specific crop for targeted advice
+        hemisphere (str): "northern" or "southern"
+        date (datetime.date, optional): Day whose season to generate advice for; defaults to today
+
+    Returns:
+        str: Generated advice, now in the store
+
+    Raises:
+        ValueError: The model returned empty advice, which is not stored
+    """
+    with trace_request("pregenerate_advice", _trace_detail(location, crop_type, hemisphere)) as trace:
+        season, season_start, _ = get_season_window(hemisphere, date)
+        advice = await _agenerate(trace, location, crop_type, hemisphere, season, season_start)
+        if not advice or not advice.strip():
+            raise ValueError("the model returned empty advice")
+        return advice
+
+async def _agenerate(trace, location, crop_type, hemisphere, season, season_start):
+    # One LLM call per location/crop/season at a time, shared by every caller that needs it
+    async def generate():
+        prompt = build_advice_prompt(location, crop_type, season)
+        with trace.stage("llm"):
+            response = await with_deadline(get_llm().ainvoke(prompt), LLM_DEADLINE_SECONDS)
+        with trace.stage("store_save"):
+            _save_advice(location, crop_type, hemisphere, season, season_start, response)
+        trace.count_llm_tokens(prompt, response)
+        return response
+
+    if not COALESCE_ENABLED:
+        return await generate()
+    advice = await _aadvice_flight.run(_flight_key(location, crop_type, hemisphere, season_start), generate)
+    if "llm" not in trace.stages:
+        trace.outcome = "coalesced"
+    return advice
+
+async def astream_seasonal_advice(location, crop_type=None, hemisphere="northern"):
+    """
+    Stream seasonal advice token by token as the model produces it.
+
+    Args:
+        location (str): Geographic location (country, region, etc.)
+        crop_type (str, optional): Specific crop for targeted advice
+        hemisphere (str): "northern" or "southern"
+
+    Yields:
+        str: Pieces of generated advice text (stored advice comes as a single piece)
+    """
+    with trace_request("seasonal_advice_stream", _trace_detail(location, crop_type, hemisphere)) as trace:
+        season, season_start, _ = get_season_window(hemisphere)
+        with trace.stage("store_lookup"):
+            advice = _stored_advice(location, crop_type, hemisphere, season_start)
+        if advice is not None:
+            trace.outcome = "cache_hit"
+            yield advice
+            return
+
+        prompt = build_advice_prompt(location, crop_type, season)
+        tokens = []
+        with trace.stage("llm"):
+            stream = get_llm().astream(prompt)
+            try:
+                # The deadline applies to the first token; after that the client sees progress
+                first = await with_deadline(anext(stream, None), LLM_DEADLINE_SECONDS)
+            except BaseException:
+                await stream.aclose()
+                raise
+            if first is not None:
+                tokens.append(first)
+                yield first
+                async for token in stream:
+                    tokens.append(token)
+                    yield token
+        with trace.stage("store_save"):
+            _save_advice(location, crop_type, hemisphere, season, season_start, "".join(tokens))
+        trace.count_llm_tokens(prompt, "".join(tokens))
+
+def stream_seasonal_advice(location, crop_type=None, hemisphere="northern"):
+    """
+    Synchronous streaming variant of get_seasonal_advice (for st.write_stream).
+
+    Args:
+        location (str): Geographic location (country, region, etc.)
+        crop_type (str, optional): Specific crop for targeted advice
+        hemisphere (str): "northern" or "southern"
+
+    Yields:
+        str: Pieces of generated advice text (stored advice comes as a single piece)
+    """
+    with trace_request("seasonal_advice_stream", _trace_detail(location, crop_type, hemisphere)) as trace:
+        season, season_start, _ = get_season_window(hemisphere)
+        with trace.stage("store_lookup"):
+            advice = _stored_advice(location, crop_type, hemisphere, season_start)
+        if advice is not None:
+            trace.outcome = "cache_hit"
+            yield advice
+            return
+
+        prompt = build_advice_prompt(location, crop_type, season)
+        tokens = []
+        with trace.stage("llm"):
+            for token in get_llm().stream(prompt):
+                tokens.append(token)
+                yield token
+        with trace.stage("store_save"):
+            _save_advice(location, crop_type, hemisphere, season, season_start, "".join(tokens))
+        trace.count_llm_tokens(prompt, "".join(tokens))
 
 if __name__ == "__main__":
     advice = get_seasonal_advice("United States Midwest", "corn", "northern")
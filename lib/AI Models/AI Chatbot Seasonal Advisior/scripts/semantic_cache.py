@@ -0,0 +1,219 @@
+import json
+import os
+import tempfile
+import threading
+import time
+from collections import OrderedDict
+
+import numpy as np
+
+
+class SemanticCache:
+    """
+    Answer cache keyed on query embeddings.
+
+    A lookup is a hit when a cached question's embedding has cosine similarity
+    at or above the threshold with the new query. Entries are evicted least
+    recently used first once max_entries is reached, and expire after
+    ttl_seconds. Vectors live in one preallocated matrix so a lookup is a
+    single matrix-vector product.
+    """
+
+    def __init__(self, threshold=0.95, max_entries=1000, ttl_seconds=86400, path=None, save_every=20):
+        """
+        Args:
+            threshold (float): Minimum cosine similarity for a hit
+            max_entries (int): Maximum number of cached answers
+            ttl_seconds (float): Entry lifetime; 0 disables expiry
+            path (str, optional): .npz file used by save()/load()
+            save_every (int): Save to path in the background after this many new entries (0 = only on save())
+        """
+        self.threshold = threshold
+        self.max_entries = max_entries
+        self.ttl_seconds = ttl_seconds
+        self.path = path
+        self.save_every = save_every
+        self.index_version = None
+        self.hits = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+        self._saving = False
+        self._clear()
+
+    def _clear(self):
+        self._entries = OrderedDict()  # slot -> entry dict, in LRU order
+        self._vectors = None
+        self._unsaved = 0
+
+    @staticmethod
+    def _normalize(vector):
+        vector = np.asarray(vector, dtype=np.float32).ravel()
+        norm = np.linalg.norm(vector)
+        return vector / norm if norm else vector
+
+    def _expired(self, entry, now):
+        return self.ttl_seconds and now - entry["created_at"] > self.ttl_seconds
+
+    def _free_slot(self):
+        if len(self._entries) < self.max_entries:
+            used = set(self._entries)
+            return next(slot for slot in range(self.max_entries) if slot not in used)
+        # Evict the least recently used entry
+        slot, _ = self._entries.popitem(last=False)
+        return slot
+
+    def lookup(self, vector):
+        """
+        Find a cached answer for a query embedding.
+
+        Args:
+            vector (list): Query embedding
+
+        Returns:
+            dict or None: Entry with "question", "answer", "sources" and "similarity" on a hit
+        """
+        query = self._normalize(vector)
+        with self._lock:
+            now = time.time()
+            for slot in [slot for slot, entry in self._entries.items() if self._expired(entry, now)]:
+                del self._entries[slot]
+
+            if self._entries and self._vectors is not None and self._vectors.shape[1] == query.shape[0]:
+                slots = np.fromiter(self._entries, dtype=np.int64, count=len(self._entries))
+                similarities = self._vectors[slots] @ query
+                best = int(np.argmax(similarities))
+                if similarities[best] >= self.threshold:
+                    slot = int(slots[best])
+                    self._entries.move_to_end(slot)
+                    self.hits += 1
+                    return dict(self._entries[slot], similarity=float(similarities[best]))
+
+            self.misses += 1
+            return None
+
+    def store(self, question, vector, answer, sources):
+        """
+        Add an answer to the cache.
+
+        Args:
+            question (str): The question that was answered
+            vector (list): Its query embedding
+            answer (str): Generated answer text, without the sources block
+            sources (list): Source references for the answer
+        """
+        vector = self._normalize(vector)
+        with self._lock:
+            if self._vectors is None or self._vectors.shape[1] != vector.shape[0]:
+                self._clear()
+                self._vectors = np.zeros((self.max_entries, vector.shape[0]), dtype=np.float32)
+            slot = self._free_slot()
+            self._vectors[slot] = vector
+            self._entries[slot] = {
+                "question": question,
+                "answer": answer,
+                "sources": list(sources),
+                "created_at": time.time(),
+            }
+            self._unsaved += 1
+            should_save = self.path and self.save_every and self._unsaved >= self.save_every
+
+        if should_save:
+            self._save_in_background()
+
+    def _save_in_background(self):
+        # Writing the whole matrix takes a while; keep it off the request path
+        with self._lock:
+            if self._saving:
+                return
+            self._saving = True
+        threading.Thread(target=self._background_save, name="semantic-cache-save", daemon=True).start()
+
+    def _background_save(self):
+        try:
+            self.save()
+        except Exception as e:
+            print(f"Could not save the semantic cache to {self.path}: {type(e).__name__}: {e}")
+        finally:
+            with self._lock:
+                self._saving = False
+
+    def invalidate(self):
+        """Drop every cached answer (e.g. after the FAISS index is rebuilt)."""
+        with self._lock:
+            self._clear()
+            self._unsaved = 1  # make the next save() overwrite the file on disk
+
+    def set_index_version(self, version):
+        """
+        Tie the cache to a FAISS index build; a different version invalidates it.
+
+        Args:
+            version (str): Fingerprint of the index the answers were generated from
+        """
+        if self.index_version is not None and version != self.index_version:
+            self.invalidate()
+        self.index_version = version
+
+    def stats(self):
+        """
+        Returns:
+            dict: Hit/miss counters, hit rate and current size
+        """
+        total = self.hits + self.misses
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": self.hits / total if total else 0.0,
+            "size": len(self._entries),
+            "max_entries": self.max_entries,
+        }
+
+    def save(self, path=None):
+        """Write the cache to an .npz file (atomically)."""
+        path = path or self.path
+        if not path:
+            return
+        with self._lock:
+            slots = list(self._entries)
+            vectors = self._vectors[slots] if slots else np.zeros((0, 0), dtype=np.float32)
+            meta = {"index_version": self.index_version, "entries": list(self._entries.values())}
+            self._unsaved = 0
+
+        # A temporary file of its own, so that saves from several workers can't collide
+        folder = os.path.dirname(path) or "."
+        os.makedirs(folder, exist_ok=True)
+        fd, tmp_path = tempfile.mkstemp(dir=folder, prefix=f"{os.path.basename(path)}.", suffix=".tmp")
+        try:
+            with os.fdopen(fd, "wb") as f:
+                np.savez(f, vectors=vectors, meta=np.array(json.dumps(meta)))
+            os.replace(tmp_path, path)
+        except BaseException:
+            os.unlink(tmp_path)
+            raise
+
+    def load(self, path=None):
+        """
+        Restore entries saved by save(). Expired entries are dropped.
+
+        Returns:
+            int: Number of entries loaded
+        """
+        path = path or self.path
+        if not path or not os.path.exists(path):
+            return 0
+        with np.load(path) as data:
+            vectors = data["vectors"]
+            meta = json.loads(str(data["meta"]))
+
+        with self._lock:
+            self._clear()
+            self.index_version = meta.get("index_version")
+            now = time.time()
+            entries = [(vector, entry) for vector, entry in zip(vectors, meta["entries"]) if not self._expired(entry, now)]
+            entries = entries[-self.max_entries:]
+            if entries:
+                self._vectors = np.zeros((self.max_entries, vectors.shape[1]), dtype=np.float32)
+                for slot, (vector, entry) in enumerate(entries):
+                    self._vectors[slot] = vector
+                    self._entries[slot] = entry
+            return len(self._entries)
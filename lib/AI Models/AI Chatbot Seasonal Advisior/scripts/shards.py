@@ -0,0 +1,254 @@
+import json
+import os
+import threading
+
+import numpy as np
+
+from scripts.lexical_index import tokenize
+from scripts.vector_index import SHARDS_DIR, SHARDS_FILE, apply_search_params, read_faiss_index
+
+# Topics group source documents and list the query words that route a question
+# to them: {"topics": {"<name>": {"sources": [file name parts], "keywords": [...]}}}
+TOPICS_PATH = os.getenv("TOPICS_PATH", "topics.json")
+
+# Distinct topic/source combinations whose row masks are kept for keyword filtering
+_MAX_CACHED_MASKS = 64
+
+_topics = {}
+_topics_lock = threading.Lock()
+
+
+def load_topics(path=None):
+    """
+    Read the topic definitions (cached after the first read).
+
+    Args:
+        path (str, optional): Topics file; defaults to TOPICS_PATH
+
+    Returns:
+        dict: {topic name: {"sources": [...], "keywords": set of terms}}; empty when there is no file
+    """
+    path = path or TOPICS_PATH
+    with _topics_lock:
+        if path not in _topics:
+            try:
+                with open(path, "r", encoding="utf-8") as f:
+                    topics = json.load(f).get("topics", {})
+            except FileNotFoundError:
+                topics = {}
+            # Keywords go through the same tokenizer as the question
+            _topics[path] = {
+                name: {"sources": list(topic.get("sources", [])),
+                       "keywords": {term for keyword in topic.get("keywords", []) for term in tokenize(keyword)}}
+                for name, topic in topics.items()
+            }
+        return _topics[path]
+
+
+class ShardSelection:
+    """
+    The shards one question is searched in.
+    """
+
+    def __init__(self, router, source_ids, reason):
+        """
+        Args:
+            router (ShardRouter): Router that owns the shards
+            source_ids (tuple): Source ids of the selected shards, ascending
+            reason (str): "sources", "topic" or "keywords", for logging
+        """
+        self.router = router
+        self.source_ids = source_ids
+        self.reason = reason
+
+    @property
+    def names(self):
+        return [self.router.sources[source_id] for source_id in self.source_ids]
+
+    @property
+    def mask(self):
+        """Boolean mask over FAISS rows: True for chunks of the selected sources."""
+        return self.router.mask(self.source_ids)
+
+    def search(self, queries, k):
+        return self.router.search(queries, k, self.source_ids)
+
+
+class ShardRouter:
+    """
+    Per-source FAISS shards written by write_shards, plus the routing that
+    picks which of them a question is searched in.
+
+    Shards are read (memory-mapped) the first time they are searched. Their
+    hits are merged by distance, which is comparable across shards because
+    every shard holds vectors from the same embeddings. A chunk can be in
+    several shards (see write_shards); it is returned once.
+    """
+
+    def __init__(self, folder, row_sources, mmap=True, topics=None):
+        """
+        Args:
+            folder (str): Index version folder containing shards.json
+            row_sources (np.ndarray): Source id of every FAISS row (the chunk store's column);
+                only its length is used, as the size of row masks
+            mmap (bool): Memory-map the shard indexes read-only
+            topics (dict, optional): load_topics() result; defaults to TOPICS_PATH
+        """
+        self.folder = folder
+        self.row_sources = row_sources
+        self.mmap = mmap
+        self.topics = load_topics() if topics is None else topics
+        with open(os.path.join(folder, SHARDS_FILE)) as f:
+            self.shards = {shard["source_id"]: shard for shard in json.load(f)["shards"]}
+        self.sources = {source_id: shard["source"] for source_id, shard in self.shards.items()}
+        self._indexes = {}
+        self._masks = {}
+        self._lock = threading.Lock()
+        self._counts = {"sources": 0, "topic": 0, "keywords": 0, "unrouted": 0}
+
+    def _rows(self, source_id):
+        return np.load(os.path.join(self.folder, SHARDS_DIR, f"{source_id}_rows.npy"), mmap_mode="r")
+
+    def _shard(self, source_id):
+        with self._lock:
+            if source_id not in self._indexes:
+                shard = self.shards[source_id]
+                index = read_faiss_index(os.path.join(self.folder, SHARDS_DIR, f"{source_id}.faiss"), mmap=self.mmap)
+                apply_search_params(index, shard.get("config", {}))
+                self._indexes[source_id] = (index, self._rows(source_id))
+            return self._indexes[source_id]
+
+    def search(self, queries, k, source_ids):
+        """
+        Search a set of shards and merge their hits by distance.
+
+        Args:
+            queries (np.ndarray): (n, dimension) float32 query matrix
+            k (int): Hits per query
+            source_ids (iterable): Shards to search
+
+        Returns:
+            tuple: (distances, rows) like faiss.Index.search, with global FAISS rows;
+            missing hits are -1 with an infinite distance
+        """
+        queries = np.asarray(queries, dtype=np.float32)
+        all_distances, all_rows = [], []
+        for source_id in source_ids:
+            index, shard_rows = self._shard(source_id)
+            distances, hits = index.search(queries, min(k, index.ntotal))
+            found = hits != -1
+            all_distances.append(np.where(found, distances, np.inf))
+            all_rows.append(np.where(found, shard_rows[np.where(found, hits, 0)], -1))
+        if not all_rows:
+            return np.full((len(queries), k), np.inf, dtype=np.float32), np.full((len(queries), k), -1, dtype=np.int64)
+        distances, rows = np.hstack(all_distances), np.hstack(all_rows)
+        order = np.argsort(distances, axis=1, kind="stable")
+        distances, rows = np.take_along_axis(distances, order, axis=1), np.take_along_axis(rows, order, axis=1)
+        if len(all_rows) == 1:
+            return distances[:, :k], rows[:, :k]
+
+        # A chunk found in several shards keeps its best (first) hit
+        merged_distances = np.full((len(queries), k), np.inf, dtype=np.float32)
+        merged_rows = np.full((len(queries), k), -1, dtype=np.int64)
+        for i in range(len(queries)):
+            _, first = np.unique(rows[i], return_index=True)
+            keep = np.sort(first)
+            keep = keep[rows[i][keep] != -1][:k]
+            merged_distances[i, :len(keep)] = distances[i, keep]
+            merged_rows[i, :len(keep)] = rows[i, keep]
+        return merged_distances, merged_rows
+
+    def mask(self, source_ids):
+        """
+        Returns:
+            np.ndarray: Boolean mask over FAISS rows selecting the chunks of these sources
+        """
+        with self._lock:
+            mask = self._masks.get(source_ids)
+        if mask is None:
+            # From the shards' rows, which include chunks collapsed from other sources
+            mask = np.zeros(len(self.row_sources), dtype=bool)
+            for source_id in source_ids:
+                mask[self._rows(source_id)] = True
+            with self._lock:
+                if len(self._masks) >= _MAX_CACHED_MASKS:
+                    self._masks.pop(next(iter(self._masks)))
+                self._masks[source_ids] = mask
+        return mask
+
+    def matching(self, patterns, strict=True):
+        """
+        Source ids whose file name contains any of the patterns (case-insensitive).
+
+        Args:
+            patterns (list): File name parts, e.g. "Farming Schemes"
+            strict (bool): Raise ValueError for a pattern that matches no indexed source
+
+        Returns:
+            set: Matching source ids
+        """
+        matched = set()
+        for pattern in patterns:
+            hits = {source_id for source_id, source in self.sources.items()
+                    if pattern.lower() in os.path.basename(source).lower()}
+            if strict and not hits:
+                raise ValueError(f"No indexed source matches '{pattern}'.")
+            matched |= hits
+        return matched
+
+    def select(self, question=None, topic=None, sources=None):
+        """
+        Pick the shards to search.
+
+        Explicit sources win over a topic; without either, the question's words
+        are matched against every topic's keywords and all matching topics'
+        sources are searched.
+
+        Args:
+            question (str, optional): User question, for keyword routing
+            topic (str, optional): Name of a topic in the topics file
+            sources (list, optional): Source file name parts
+
+        Returns:
+            ShardSelection or None: None means search the whole index (nothing
+            matched, or everything did)
+        """
+        if sources:
+            source_ids, reason = self.matching(sources), "sources"
+        elif topic:
+            if topic not in self.topics:
+                raise ValueError(f"Unknown topic '{topic}'. Choose one of: {', '.join(self.topics)}")
+            source_ids, reason = self.matching(self.topics[topic]["sources"], strict=False), "topic"
+            if not source_ids:
+                raise ValueError(f"No indexed source belongs to topic '{topic}'.")
+        else:
+            terms = set(tokenize(question or ""))
+            routed = [name for name, definition in self.topics.items() if terms & definition["keywords"]]
+            source_ids, reason = set(), "keywords"
+            for name in routed:
+                source_ids |= self.matching(self.topics[name]["sources"], strict=False)
+
+        with self._lock:
+            if not source_ids or len(source_ids) == len(self.shards):
+                self._counts["unrouted"] += 1
+                return None
+            self._counts[reason] += 1
+        return ShardSelection(self, tuple(sorted(source_ids)), reason)
+
+    def stats(self):
+        """
+        Returns:
+            dict: Shard count, shards loaded so far and how many searches each kind of routing chose
+        """
+        with self._lock:
+            return {"shards": len(self.shards), "loaded": len(self._indexes), "routed": dict(self._counts)}
+
+
+def load_shards(folder, row_sources, mmap=True):
+    """
+    Returns:
+        ShardRouter or None: The shards of an index version folder, if it has them
+    """
+    if not os.path.exists(os.path.join(folder, SHARDS_FILE)):
+        return None
+    return ShardRouter(folder, row_sources, mmap=mmap)
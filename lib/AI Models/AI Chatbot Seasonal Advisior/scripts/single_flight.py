@@ -0,0 +1,130 @@
+import asyncio
+import threading
+
+
+class SingleFlight:
+    """
+    Coalesce identical concurrent calls: while a call for a key is running,
+    further calls with the same key wait for its result instead of doing the
+    work again. Nothing is cached once the call finishes.
+
+    Thread-based counterpart of AsyncSingleFlight for synchronous callers
+    (Streamlit, scripts).
+    """
+
+    def __init__(self):
+        self.leaders = 0
+        self.coalesced = 0
+        self.errors = 0
+        self._calls = {}
+        self._lock = threading.Lock()
+
+    def run(self, key, fn):
+        """
+        Args:
+            key (hashable): Normalized request identity
+            fn (callable): Does the work; called only by the first caller for a key
+
+        Returns:
+            object: fn's result, shared by all callers that arrived while it ran
+        """
+        with self._lock:
+            call = self._calls.get(key)
+            leader = call is None
+            if leader:
+                call = self._calls[key] = {"done": threading.Event(), "result": None, "error": None}
+                self.leaders += 1
+            else:
+                self.coalesced += 1
+
+        if not leader:
+            call["done"].wait()
+            if call["error"] is not None:
+                raise call["error"]
+            return call["result"]
+
+        try:
+            call["result"] = fn()
+            return call["result"]
+        except BaseException as e:
+            call["error"] = e
+            self.errors += 1
+            raise
+        finally:
+            with self._lock:
+                del self._calls[key]
+            call["done"].set()
+
+    def stats(self):
+        """
+        Returns:
+            dict: Calls executed, calls saved by coalescing, failed calls and calls in flight
+        """
+        return {"leaders": self.leaders, "coalesced": self.coalesced, "errors": self.errors, "in_flight": len(self._calls)}
+
+
+class AsyncSingleFlight:
+    """
+    Coalesce identical concurrent coroutine calls on an event loop.
+
+    The work runs in its own task, so cancelling the caller that started it
+    does not cancel it for the others; it is only cancelled once every waiting
+    caller is gone. Errors are passed to every waiter.
+    """
+
+    def __init__(self):
+        self.leaders = 0
+        self.coalesced = 0
+        self.errors = 0
+        self.cancelled = 0
+        self._calls = {}
+
+    def _finished(self, key, call, task):
+        if self._calls.get(key) is call:
+            del self._calls[key]
+        if task.cancelled():
+            self.cancelled += 1
+        elif task.exception() is not None:
+            self.errors += 1
+
+    async def run(self, key, factory):
+        """
+        Args:
+            key (hashable): Normalized request identity
+            factory (callable): Returns the coroutine doing the work; called only by
+                the first caller for a key
+
+        Returns:
+            object: The coroutine's result, shared by all callers that arrived while it ran
+        """
+        # Tasks belong to one event loop, so calls are only shared within a loop
+        key = (id(asyncio.get_running_loop()), key)
+        call = self._calls.get(key)
+        if call is None:
+            call = self._calls[key] = {"task": asyncio.ensure_future(factory()), "waiters": 0}
+            call["task"].add_done_callback(lambda task, key=key, call=call: self._finished(key, call, task))
+            self.leaders += 1
+        else:
+            self.coalesced += 1
+
+        call["waiters"] += 1
+        try:
+            return await asyncio.shield(call["task"])
+        finally:
+            call["waiters"] -= 1
+            if not call["waiters"] and not call["task"].done():
+                # Every caller gave up; no one is left to use the result
+                call["task"].cancel()
+
+    def stats(self):
+        """
+        Returns:
+            dict: Calls executed, calls saved by coalescing, failed and cancelled calls, calls in flight
+        """
+        return {
+            "leaders": self.leaders,
+            "coalesced": self.coalesced,
+            "errors": self.errors,
+            "cancelled": self.cancelled,
+            "in_flight": len(self._calls),
+        }
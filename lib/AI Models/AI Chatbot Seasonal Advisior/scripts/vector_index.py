@@ -0,0 +1,403 @@
+import json
+import math
+import os
+import shutil
+import sys
+import time
+import uuid
+
+import faiss
+import numpy as np
+from langchain_community.docstore.in_memory import InMemoryDocstore
+from langchain_community.vectorstores import FAISS
+
+from scripts.chunk_store import (CHUNK_STORE_FILES, SOURCES_FILE, MmapDocstore, RowIdMap, has_chunk_store,
+                                 source_rows, write_chunk_store)
+from scripts.embedding_backends import embedding_mismatch
+from scripts.lexical_index import write_lexical_index
+
+INDEX_FILE = "index.faiss"
+VECTORS_FILE = "vectors.npy"
+CONFIG_FILE = "index_config.json"
+LEGACY_DOCSTORE_FILE = "index.pkl"
+
+# One small index per source document, so a query about e.g. livestock only
+# searches the shards it is routed to (see scripts/shards.py)
+SHARDS_DIR = "shards"
+SHARDS_FILE = "shards.json"
+
+# Each save goes into a new version folder inside the index folder; the CURRENT
+# file names the live one and is replaced atomically, so readers never see a
+# half-written index. Older versions are kept a while for workers still using them.
+CURRENT_FILE = "CURRENT"
+VERSIONS_DIR = "versions"
+KEEP_VERSIONS = 3
+
+INDEX_TYPES = ("flat", "ivf", "hnsw", "ivfpq")
+
+# Defaults for each index type; anything passed in the config overrides these
+DEFAULT_INDEX_PARAMS = {
+    "flat": {},
+    "ivf": {"nlist": None, "nprobe": 8},
+    "hnsw": {"M": 32, "ef_construction": 200, "ef_search": 64},
+    "ivfpq": {"nlist": None, "nprobe": 8, "pq_m": 16, "pq_bits": 8},
+}
+
+
+def current_version(folder):
+    """
+    Returns:
+        str or None: Name of the live index version, or None for a folder that
+        holds a single unversioned index (or nothing)
+    """
+    try:
+        with open(os.path.join(folder, CURRENT_FILE)) as f:
+            return f.read().strip() or None
+    except FileNotFoundError:
+        return None
+
+
+def resolve_index_folder(folder):
+    """
+    Returns:
+        str: Folder holding the files of the live index version
+    """
+    version = current_version(folder)
+    return os.path.join(folder, VERSIONS_DIR, version) if version else folder
+
+
+def index_version(folder):
+    """
+    Cheap fingerprint of the live index; changes whenever a new index is saved.
+
+    Returns:
+        str: Version name, or modification time and size of the files of an unversioned index
+    """
+    version = current_version(folder)
+    if version:
+        return version
+    parts = []
+    for name in (INDEX_FILE, "chunks.bin"):
+        stat = os.stat(os.path.join(folder, name))
+        parts.append(f"{stat.st_mtime_ns}:{stat.st_size}")
+    return "-".join(parts)
+
+
+def index_exists(folder):
+    folder = resolve_index_folder(folder)
+    return os.path.exists(os.path.join(folder, INDEX_FILE)) and has_chunk_store(folder)
+
+
+def resolve_index_config(config, num_vectors):
+    """
+    Fill in defaults for an index configuration and clamp them to the corpus size.
+
+    Args:
+        config (dict): At least {"type": ...}; other keys override the defaults
+        num_vectors (int): Number of vectors the index will hold
+
+    Returns:
+        dict: Complete configuration
+    """
+    config = dict(config or {"type": "flat"})
+    index_type = config.setdefault("type", "flat")
+    if index_type not in INDEX_TYPES:
+        raise ValueError(f"Unknown index type '{index_type}'. Choose one of: {', '.join(INDEX_TYPES)}")
+    resolved = {"type": index_type, **DEFAULT_INDEX_PARAMS[index_type]}
+    # Parameters that do not apply to this index type are ignored
+    resolved.update({k: v for k, v in config.items() if v is not None and k in resolved})
+
+    if "nlist" in resolved:
+        # FAISS wants ~39 training points per list; default to 4 * sqrt(n)
+        nlist = resolved["nlist"] or int(4 * math.sqrt(num_vectors))
+        resolved["nlist"] = max(1, min(nlist, num_vectors // 39 or 1))
+        resolved["nprobe"] = min(resolved["nprobe"], resolved["nlist"])
+    if "pq_bits" in resolved:
+        # PQ training needs at least 2^bits points per sub-quantizer
+        resolved["pq_bits"] = max(1, min(resolved["pq_bits"], int(math.log2(max(num_vectors, 2)))))
+    return resolved
+
+
+def build_ann_index(vectors, config):
+    """
+    Build a FAISS index of the configured type over a matrix of vectors.
+
+    Args:
+        vectors (np.ndarray): float32 matrix, one row per chunk
+        config (dict): Resolved index configuration
+
+    Returns:
+        faiss.Index: Trained index containing every vector
+    """
+    dimension = vectors.shape[1]
+    index_type = config["type"]
+    if index_type == "flat":
+        index = faiss.IndexFlatL2(dimension)
+    elif index_type == "ivf":
+        index = faiss.IndexIVFFlat(faiss.IndexFlatL2(dimension), dimension, config["nlist"])
+    elif index_type == "hnsw":
+        index = faiss.IndexHNSWFlat(dimension, config["M"])
+        index.hnsw.efConstruction = config["ef_construction"]
+    else:
+        if dimension % config["pq_m"]:
+            raise ValueError(f"pq_m={config['pq_m']} must divide the embedding dimension {dimension}")
+        index = faiss.IndexIVFPQ(faiss.IndexFlatL2(dimension), dimension, config["nlist"], config["pq_m"], config["pq_bits"])
+
+    if not index.is_trained:
+        index.train(vectors)
+    index.add(vectors)
+    apply_search_params(index, config)
+    return index
+
+
+def apply_search_params(index, config):
+    """Set query-time parameters (nprobe, efSearch) on a loaded index."""
+    if "nprobe" in config:
+        faiss.extract_index_ivf(index).nprobe = config["nprobe"]
+    if "ef_search" in config:
+        index.hnsw.efSearch = config["ef_search"]
+
+
+def read_index_config(folder):
+    path = os.path.join(resolve_index_folder(folder), CONFIG_FILE)
+    if not os.path.exists(path):
+        return {"type": "flat"}
+    with open(path) as f:
+        return json.load(f)
+
+
+def load_vectors(folder, mmap=True):
+    """
+    Load the exact vectors stored next to an index, in FAISS row order.
+
+    Args:
+        folder (str): Index folder
+        mmap (bool): Memory-map instead of reading into RAM
+
+    Returns:
+        np.ndarray: float32 matrix
+    """
+    return np.load(os.path.join(resolve_index_folder(folder), VECTORS_FILE), mmap_mode="r" if mmap else None)
+
+
+def write_shards(folder, vectors, index_config=None):
+    """
+    Split the vectors of a saved chunk store into one index per source document.
+
+    Each shard is written as shards/<source id>.faiss plus shards/<source id>_rows.npy,
+    the global FAISS rows of its vectors in shard order; shards.json lists them.
+    A chunk that near-duplicates were collapsed into is put in the shard of every
+    source it appears in, so filtering by any of them still finds it.
+
+    Args:
+        folder (str): Version folder that already holds the chunk store
+        vectors (np.ndarray): float32 matrix in FAISS row order
+        index_config (dict, optional): Index configuration, resolved again for each shard's size
+
+    Returns:
+        list: {"source_id", "source", "chunks", "config"} per shard
+    """
+    members = source_rows(folder)
+    with open(os.path.join(folder, SOURCES_FILE)) as f:
+        sources = json.load(f)
+    os.makedirs(os.path.join(folder, SHARDS_DIR))
+    shards = []
+    for source_id, source in enumerate(sources):
+        rows = members[source_id]
+        if not len(rows):
+            continue
+        config = resolve_index_config(index_config, len(rows))
+        index = build_ann_index(np.ascontiguousarray(vectors[rows]), config)
+        faiss.write_index(index, os.path.join(folder, SHARDS_DIR, f"{source_id}.faiss"))
+        np.save(os.path.join(folder, SHARDS_DIR, f"{source_id}_rows.npy"), rows)
+        shards.append({"source_id": source_id, "source": source, "chunks": len(rows), "config": config})
+    with open(os.path.join(folder, SHARDS_FILE), "w") as f:
+        json.dump({"shards": shards}, f, indent=2)
+    return shards
+
+
+def _publish_version(folder, version):
+    # Write CURRENT next to itself and rename over it: atomic on POSIX and Windows
+    tmp_path = os.path.join(folder, f"{CURRENT_FILE}.{uuid.uuid4().hex}.tmp")
+    with open(tmp_path, "w") as f:
+        f.write(version)
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(tmp_path, os.path.join(folder, CURRENT_FILE))
+
+
+def _prune_versions(folder, keep):
+    versions_dir = os.path.join(folder, VERSIONS_DIR)
+    live = current_version(folder)
+    old = sorted((name for name in os.listdir(versions_dir) if name != live),
+                 key=lambda name: os.path.getmtime(os.path.join(versions_dir, name)))
+    for name in old[:max(len(old) - (keep - 1), 0)]:
+        shutil.rmtree(os.path.join(versions_dir, name), ignore_errors=True)
+
+
+def _remove_unversioned_files(folder):
+    # Files of an index saved before versioning; workers that still have them
+    # open keep their mappings (POSIX), new loads go through CURRENT
+    for name in (INDEX_FILE, VECTORS_FILE, CONFIG_FILE, LEGACY_DOCSTORE_FILE, *CHUNK_STORE_FILES):
+        try:
+            os.remove(os.path.join(folder, name))
+        except OSError:
+            pass
+
+
+def save_index(db, folder, index_config=None, embedding=None):
+    """
+    Save a LangChain FAISS vector store as index.faiss plus a chunk store
+    and a BM25 keyword index over the same chunks.
+
+    The exact vectors are kept in vectors.npy so the index can be rebuilt as
+    any type (and searched exactly) without re-embedding. The index written to
+    index.faiss is built with index_config, and the resolved parameters are
+    stored in index_config.json for load_index. The same vectors are also
+    split into per-source shards (write_shards) for routed searches.
+
+    Everything is written to a fresh version folder first and then published by
+    atomically replacing the CURRENT file, so running servers pick up the new
+    index on their next version check without ever reading a partial one.
+
+    Args:
+        db (FAISS): Vector store to save
+        folder (str): Destination folder
+        index_config (dict, optional): {"type": "flat" | "ivf" | "hnsw" | "ivfpq", ...params}
+        embedding (dict, optional): embedding_info() of the embeddings that made the vectors,
+            checked by load_index so the index is never queried with other embeddings
+
+    Returns:
+        dict: The resolved index configuration
+    """
+    version = f"{time.strftime('%Y%m%dT%H%M%S')}-{uuid.uuid4().hex[:8]}"
+    version_folder = os.path.join(folder, VERSIONS_DIR, version)
+    os.makedirs(version_folder)
+    rows = range(db.index.ntotal)
+    if isinstance(db.docstore, MmapDocstore):
+        ids = [db.docstore.chunk_id(row) for row in rows]
+        docs = [db.docstore.get(row) for row in rows]
+    else:
+        ids = [db.index_to_docstore_id[row] for row in rows]
+        docs = [db.docstore.search(chunk_id) for chunk_id in ids]
+    write_chunk_store(version_folder, docs, ids)
+    write_lexical_index(version_folder, [doc.page_content for doc in docs])
+
+    vectors = db.index.reconstruct_n(0, db.index.ntotal).astype(np.float32)
+    np.save(os.path.join(version_folder, VECTORS_FILE), vectors)
+
+    config = resolve_index_config(index_config, len(vectors))
+    index = db.index if config["type"] == "flat" and isinstance(db.index, faiss.IndexFlat) else build_ann_index(vectors, config)
+    faiss.write_index(index, os.path.join(version_folder, INDEX_FILE))
+    with open(os.path.join(version_folder, CONFIG_FILE), "w") as f:
+        metadata = {**config, "dimension": int(vectors.shape[1]), "num_vectors": len(vectors)}
+        if embedding:
+            metadata["embedding"] = {**embedding, "dimension": int(vectors.shape[1])}
+        json.dump(metadata, f, indent=2)
+    write_shards(version_folder, vectors, index_config)
+
+    _publish_version(folder, version)
+    _remove_unversioned_files(folder)
+    _prune_versions(folder, KEEP_VERSIONS)
+    return config
+
+
+def read_faiss_index(path, mmap=True):
+    """
+    Read an index.faiss file, memory-mapping it read-only when possible.
+
+    A mapped index is backed by the page cache, so every worker process that
+    loads the same file shares one physical copy of the vectors.
+
+    Args:
+        path (str): index.faiss file
+        mmap (bool): Memory-map the file instead of reading it into private memory
+
+    Returns:
+        faiss.Index: Index
+    """
+    if mmap:
+        flags = getattr(faiss, "IO_FLAG_MMAP_IFC", faiss.IO_FLAG_MMAP) | faiss.IO_FLAG_READ_ONLY
+        try:
+            return faiss.read_index(path, flags)
+        except RuntimeError as e:
+            print(f"Could not memory-map {path} ({e}); reading it into memory instead.")
+    return faiss.read_index(path)
+
+
+def load_index(folder, embeddings, mutable=False, mmap=True):
+    """
+    Load a FAISS vector store saved by save_index, without unpickling anything.
+
+    Raises ValueError when the index was built with different embeddings (backend,
+    model or dimension) than the ones given, instead of returning meaningless hits.
+
+    Args:
+        folder (str): Index folder
+        embeddings (Embeddings): Embeddings used for queries
+        mutable (bool): Load an exact flat index (from vectors.npy) and an in-memory
+            docstore keyed by chunk id, so the store can be updated (index builds).
+            The default loads whichever index type was built and memory-maps the
+            chunk store read-only, decoding only the chunks a search returns.
+        mmap (bool): Memory-map index.faiss read-only (read-only loads only)
+
+    Returns:
+        FAISS: Vector store
+    """
+    root = folder
+    folder = resolve_index_folder(root)
+    if not index_exists(root):
+        hint = ""
+        if os.path.exists(os.path.join(folder, LEGACY_DOCSTORE_FILE)):
+            hint = " Found a legacy index.pkl; convert it with: python -m scripts.vector_index migrate " + root
+        raise FileNotFoundError(f"FAISS index not found at: {root}. Please create the FAISS index first.{hint}")
+
+    config = read_index_config(root)
+    mismatch = embedding_mismatch(config.get("embedding"), embeddings, config.get("dimension"))
+    if mismatch:
+        raise ValueError(f"FAISS index at {root} was {mismatch}. Rebuild the index or switch EMBEDDING_BACKEND back.")
+
+    docstore = MmapDocstore(folder)
+    if not mutable:
+        index = read_faiss_index(os.path.join(folder, INDEX_FILE), mmap=mmap)
+        apply_search_params(index, config)
+        return FAISS(embeddings, index, docstore, RowIdMap(len(docstore)))
+
+    if os.path.exists(os.path.join(folder, VECTORS_FILE)):
+        vectors = load_vectors(folder, mmap=False)
+    else:
+        # Saved before vectors.npy existed; those indexes were always flat
+        flat = faiss.read_index(os.path.join(folder, INDEX_FILE))
+        vectors = flat.reconstruct_n(0, flat.ntotal)
+    index = faiss.IndexFlatL2(vectors.shape[1])
+    index.add(vectors)
+    ids = [docstore.chunk_id(row) for row in range(len(docstore))]
+    return FAISS(
+        embeddings,
+        index,
+        InMemoryDocstore({chunk_id: docstore.get(row) for row, chunk_id in enumerate(ids)}),
+        dict(enumerate(ids)),
+    )
+
+
+def migrate_legacy_index(folder):
+    """
+    One-off conversion of a pickled index.pkl docstore to the chunk store format.
+
+    This is the only place that still unpickles, so only run it on an index you built yourself.
+
+    Args:
+        folder (str): Index folder containing index.faiss and index.pkl
+    """
+    db = FAISS.load_local(folder, embeddings=None, allow_dangerous_deserialization=True)
+    save_index(db, folder)
+    print(f"Converted {db.index.ntotal} chunks in {folder} to the chunk store format.")
+
+
+if __name__ == "__main__":
+    # Usage: python -m scripts.vector_index migrate vector_store/faiss_index
+    if len(sys.argv) == 3 and sys.argv[1] == "migrate":
+        migrate_legacy_index(sys.argv[2])
+    else:
+        print("Usage: python -m scripts.vector_index migrate <index folder>")
+        sys.exit(1)
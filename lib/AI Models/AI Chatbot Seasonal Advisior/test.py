@@ -1,8 +1,8 @@
 import os
 from dotenv import load_dotenv
 from langchain_google_genai import GoogleGenerativeAI
-from langchain_community.vectorstores import FAISS
 from langchain_google_genai import GoogleGenerativeAIEmbeddings
+from scripts.vector_index import load_index
 
 # Load API key
 load_dotenv()
@@ -11,7 +11,7 @@ load_dotenv()
 embeddings = GoogleGenerativeAIEmbeddings(model="models/embedding-001")
 
 # Load FAISS Index
-faiss_index = FAISS.load_local("vector_store/faiss_index", embeddings, allow_dangerous_deserialization=True)
+faiss_index = load_index("vector_store/faiss_index", embeddings)
 
 # Initialize Gemini model 
 llm = GoogleGenerativeAI(model="gemini-1.5-flash")
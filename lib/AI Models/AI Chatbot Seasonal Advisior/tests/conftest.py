@@ -0,0 +1,72 @@
+import json
+import os
+import sys
+import tempfile
+
+import pytest
+from langchain_core.documents import Document
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from scripts.fake_backends import isolate_state  # noqa: E402
+
+# Caches and stores must never touch the real ones, even if a test imports the chatbot
+_state = tempfile.TemporaryDirectory(prefix="farm-advisor-tests-")
+isolate_state(_state.name)
+
+CORPUS = {
+    "soil.txt": [
+        "Add compost every season to build soil organic matter and feed soil life.",
+        "Sandy soil drains fast; mulch it to keep moisture in the root zone.",
+        "Test soil pH every few years and lime acid soil before sowing legumes.",
+    ],
+    "cattle.txt": [
+        "Vaccinate calves against blackleg before they go out to pasture.",
+        "Milk cows twice a day at the same times and keep the udder clean to prevent mastitis.",
+    ],
+    "pests.txt": [
+        "Yellow sticky traps catch whiteflies and aphids before their numbers build up.",
+        "Ladybirds and lacewings eat aphids, so spare them when you spray.",
+    ],
+}
+TOPICS = {"topics": {
+    "livestock": {"sources": ["cattle"], "keywords": ["cattle", "cows", "calves"]},
+    "pests": {"sources": ["pests"], "keywords": ["aphids", "whiteflies"]},
+}}
+
+
+def _load_paragraphs(paths):
+    # One chunk per paragraph; page numbers are paragraph numbers
+    for path in paths:
+        with open(path) as f:
+            paragraphs = f.read().split("\n\n")
+        yield path, [Document(page_content=text, metadata={"source": os.path.basename(path), "page": page})
+                     for page, text in enumerate(paragraphs)], None
+
+
+@pytest.fixture
+def chatbot(tmp_path, monkeypatch):
+    """The chatbot module serving a small index of CORPUS with FakeLLM and FakeEmbeddings."""
+    import chatbot
+    from scripts import shards
+    from scripts.fake_backends import FakeEmbeddings, FakeLLM
+    from scripts.index_builder import update_index
+    from scripts.semantic_cache import SemanticCache
+
+    paths = []
+    for name, paragraphs in CORPUS.items():
+        (tmp_path / name).write_text("\n\n".join(paragraphs))
+        paths.append(str(tmp_path / name))
+    embeddings = FakeEmbeddings(size=16)
+    folder = str(tmp_path / "index")
+    update_index(paths, _load_paragraphs, embeddings, folder)
+    (tmp_path / "topics.json").write_text(json.dumps(TOPICS))
+
+    monkeypatch.setattr(shards, "TOPICS_PATH", str(tmp_path / "topics.json"))
+    monkeypatch.setattr(chatbot, "faiss_path", folder)
+    monkeypatch.setattr(chatbot, "answer_cache", SemanticCache())
+    # Restored after the test, so the next one loads its own index and clients
+    for name in ("_llm", "_embeddings", "_stores", "_qa_chain"):
+        monkeypatch.setattr(chatbot, name, None)
+    chatbot.configure(llm=FakeLLM(answer_words=20), embeddings=embeddings)
+    return chatbot
@@ -0,0 +1,89 @@
+import asyncio
+
+import pytest
+
+from scripts.admission import AdmissionController, DeadlineExceeded, Overloaded, with_deadline
+
+
+def test_full_queue_is_rejected_right_away():
+    async def scenario():
+        admission = AdmissionController(max_concurrent=1, max_queue=1, max_wait=5)
+        release = asyncio.Event()
+
+        async def hold():
+            async with admission.admit("ask"):
+                await release.wait()
+
+        tasks = [asyncio.ensure_future(hold()) for _ in range(2)]
+        await asyncio.sleep(0.01)
+        assert admission.stats()["active"] == 1
+        assert admission.stats()["waiting"] == 1
+
+        with pytest.raises(Overloaded) as error:
+            async with admission.admit("ask"):
+                pass
+        assert error.value.retry_after >= 1
+        assert admission.stats()["rejected"] == 1
+
+        release.set()
+        await asyncio.gather(*tasks)
+        assert admission.stats()["active"] == 0
+
+    asyncio.run(scenario())
+
+
+def test_queue_wait_times_out():
+    async def scenario():
+        admission = AdmissionController(max_concurrent=1, max_queue=4, max_wait=0.05)
+        release = asyncio.Event()
+
+        async def hold():
+            async with admission.admit("ask"):
+                await release.wait()
+
+        holder = asyncio.ensure_future(hold())
+        await asyncio.sleep(0.01)
+        with pytest.raises(Overloaded):
+            async with admission.admit("ask"):
+                pass
+        assert admission.stats()["waiting"] == 0
+
+        release.set()
+        await holder
+
+    asyncio.run(scenario())
+
+
+def test_missed_deadline_cancels_the_work_and_frees_the_slot():
+    async def scenario():
+        admission = AdmissionController(max_concurrent=1, max_queue=0, max_wait=1)
+        cancelled = asyncio.Event()
+
+        async def slow():
+            try:
+                await asyncio.sleep(10)
+            except asyncio.CancelledError:
+                cancelled.set()
+                raise
+
+        with pytest.raises(DeadlineExceeded):
+            await admission.run("ask", slow(), deadline=0.05)
+        assert cancelled.is_set()
+        assert admission.stats()["active"] == 0
+
+        async def fast():
+            return "answer"
+
+        assert await admission.run("ask", fast(), deadline=1) == "answer"
+
+    asyncio.run(scenario())
+
+
+def test_with_deadline():
+    async def scenario():
+        assert await with_deadline(asyncio.sleep(0, result=1), 1) == 1
+        assert await with_deadline(asyncio.sleep(0, result=2), 0) == 2
+        with pytest.raises(DeadlineExceeded):
+            await with_deadline(asyncio.sleep(10), 0.01)
+
+    asyncio.run(scenario())
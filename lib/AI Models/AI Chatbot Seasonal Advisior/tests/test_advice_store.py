@@ -0,0 +1,39 @@
+import datetime
+
+from scripts.advice_store import AdviceStore, normalize_key
+
+SPRING = datetime.date(2026, 3, 1)
+SUMMER = datetime.date(2026, 6, 1)
+AUTUMN = datetime.date(2026, 9, 1)
+
+
+def test_normalize_key():
+    assert normalize_key("United States  Midwest", "Corn") == normalize_key("united states midwest.", " corn ")
+    assert normalize_key("Kenya") == "kenya|"
+
+
+def test_spelling_variants_share_an_entry(tmp_path):
+    store = AdviceStore(str(tmp_path / "advice.sqlite3"))
+    store.put("Iowa, USA", "Corn", "Northern", "Summer", SUMMER, "Scout for rootworm.")
+
+    assert store.get("iowa usa", "corn", "northern", SUMMER) == "Scout for rootworm."
+    assert store.get("iowa usa", "corn", "southern", SUMMER) is None
+    assert store.get("iowa usa", "corn", "northern", AUTUMN) is None
+    assert store.contains("IOWA USA", "CORN", "northern", SUMMER)
+    assert store.stats() == {"hits": 1, "misses": 2, "hit_rate": 1 / 3, "size": 1}
+
+
+def test_purge_drops_only_past_seasons(tmp_path):
+    store = AdviceStore(str(tmp_path / "advice.sqlite3"))
+    store.put("Iowa", "Corn", "northern", "Spring", SPRING, "Plant once the soil is warm.")
+    store.put("Iowa", "Corn", "northern", "Summer", SUMMER, "Scout for rootworm.")
+    store.put("Iowa", "Corn", "northern", "Autumn", AUTUMN, "Harvest at 25% moisture.")
+    store.put("Victoria", "Wheat", "southern", "Autumn", SPRING, "Sow after the autumn break.")
+
+    assert store.purge_expired("northern", SUMMER) == 1
+    assert store.get("Iowa", "Corn", "northern", SPRING) is None
+    assert store.get("Iowa", "Corn", "northern", SUMMER) is not None
+    assert store.get("Iowa", "Corn", "northern", AUTUMN) is not None
+    # The other hemisphere keeps its own seasons
+    assert store.contains("Victoria", "Wheat", "southern", SPRING)
+    assert store.purge_expired("northern", SUMMER) == 0
@@ -0,0 +1,207 @@
+import asyncio
+import json
+import time
+
+import httpx
+import pytest
+
+import api
+from scripts import seasonal_advice
+from scripts.admission import AdmissionController
+from scripts.advice_store import AdviceStore
+from scripts.fake_backends import FakeLLM
+
+QUESTION = "How often should I test the pH of acid soil before sowing legumes?"
+ADVICE = {"location": "Iowa", "crop_type": "Corn", "hemisphere": "Northern"}
+
+
+async def _post(path, payload):
+    async with httpx.AsyncClient(transport=httpx.ASGITransport(app=api.app), base_url="http://test") as client:
+        return await client.post(path, json=payload)
+
+
+def post(path, payload):
+    return asyncio.run(_post(path, payload))
+
+
+async def _post_and_disconnect(path, payload):
+    # Raw ASGI call whose client goes away right after sending the request body
+    messages = [{"type": "http.request", "body": json.dumps(payload).encode(), "more_body": False},
+                {"type": "http.disconnect"}]
+    sent = []
+
+    async def receive():
+        if len(messages) > 1:
+            return messages.pop(0)
+        return messages[0]
+
+    async def send(message):
+        sent.append(message)
+
+    scope = {"type": "http", "asgi": {"version": "3.0"}, "http_version": "1.1", "method": "POST", "scheme": "http",
+             "path": path, "raw_path": path.encode(), "root_path": "", "query_string": b"",
+             "headers": [(b"host", b"test"), (b"content-type", b"application/json")],
+             "client": ("127.0.0.1", 1234), "server": ("test", 80)}
+    await api.app(scope, receive, send)
+    return sent[0]["status"]
+
+
+class ShortDeadline(AdmissionController):
+    """AdmissionController with a 0.1s request deadline."""
+
+    async def run(self, operation, coro, receive=None, deadline=0.1):
+        return await super().run(operation, coro, receive, deadline)
+
+
+def sse_events(response):
+    # [(event, data)] in the order they were sent
+    assert response.headers["content-type"].startswith("text/event-stream")
+    events = []
+    for block in response.text.split("\n\n"):
+        if block:
+            event, data = block.split("\n")
+            events.append((event.removeprefix("event: "), json.loads(data.removeprefix("data: "))))
+    return events
+
+
+@pytest.fixture
+def advice(tmp_path, monkeypatch):
+    store = AdviceStore(str(tmp_path / "advice.sqlite3"))
+    monkeypatch.setattr(seasonal_advice, "_advice_store", store)
+    monkeypatch.setattr(seasonal_advice, "_llm", FakeLLM(answer_words=20))
+    return store
+
+
+def test_ask(chatbot):
+    response = post("/ask", {"question": QUESTION})
+    assert response.status_code == 200
+    assert response.json() == {"question": QUESTION, "answer": chatbot.ask_chatbot(QUESTION)}
+
+    filtered = post("/ask", {"question": QUESTION, "topic": "livestock", "search_type": "mmr"})
+    assert filtered.status_code == 200
+    assert "soil.txt" not in filtered.json()["answer"]
+
+
+def test_concurrent_questions_do_not_wait_for_each_other(chatbot):
+    chatbot.configure(llm=FakeLLM(answer_words=20, latency=0.3))
+
+    async def ask_four():
+        return await asyncio.gather(*(_post("/ask", {"question": f"{QUESTION} ({i})"}) for i in range(4)))
+
+    started = time.perf_counter()
+    responses = asyncio.run(ask_four())
+    assert [response.status_code for response in responses] == [200] * 4
+    assert time.perf_counter() - started < 1.0
+
+
+def test_ask_batch(chatbot, monkeypatch):
+    questions = [QUESTION, "", "How do I keep cows healthy when milking them twice a day?"]
+    response = post("/ask/batch", {"questions": questions})
+    assert response.status_code == 200
+    results = response.json()["results"]
+    assert [result["question"] for result in results] == questions
+    assert results[0]["answer"] == chatbot.ask_chatbot(QUESTION)
+    assert results[1] == {"question": "", "error": "Question is empty."}
+    assert "- cattle.txt" in results[2]["answer"]
+
+    monkeypatch.setattr(api, "MAX_BATCH_SIZE", 2)
+    response = post("/ask/batch", {"questions": questions})
+    assert response.status_code == 413
+    assert response.json() == {"detail": "At most 2 questions per batch."}
+
+
+def test_invalid_retrieval_options_are_rejected(chatbot):
+    for options in ({"topic": "orchards"}, {"search_type": "random"}, {"lambda_mult": 2}, {"sources": ["wheat"]}):
+        response = post("/ask", {"question": QUESTION, **options})
+        assert response.status_code == 422, options
+    assert "orchards" in post("/ask", {"question": QUESTION, "topic": "orchards"}).json()["detail"]
+
+
+def test_seasonal_advice(advice):
+    response = post("/seasonal_advice", ADVICE)
+    assert response.status_code == 200
+    body = response.json()
+    assert body["season"] == seasonal_advice.get_current_season("northern")
+    assert len(body["advice"].split()) == 20
+    # The second request is served from the store
+    assert post("/seasonal_advice", ADVICE).json() == body
+    assert advice.stats()["hits"] == 1
+
+
+def test_ask_stream_sends_tokens_then_sources_then_done(chatbot):
+    events = sse_events(post("/ask/stream", {"question": QUESTION}))
+    kinds = [kind for kind, _ in events]
+    assert kinds == ["token"] * 20 + ["sources", "done"]
+    answer = "".join(data for kind, data in events if kind == "token")
+    assert answer + chatbot._sources_markdown(events[-2][1]) == chatbot.ask_chatbot(QUESTION)
+    assert events[-1][1] == {"question": QUESTION}
+
+    assert post("/ask/stream", {"question": QUESTION, "topic": "orchards"}).status_code == 422
+
+
+def test_seasonal_advice_stream(advice):
+    events = sse_events(post("/seasonal_advice/stream", ADVICE))
+    assert [kind for kind, _ in events] == ["token"] * 20 + ["done"]
+    assert events[-1][1]["season"] == seasonal_advice.get_current_season("northern")
+    streamed = "".join(data for kind, data in events if kind == "token")
+
+    # The streamed advice was stored: the next stream is one piece, and /seasonal_advice agrees
+    events = sse_events(post("/seasonal_advice/stream", ADVICE))
+    assert events[0] == ("token", streamed)
+    assert post("/seasonal_advice", ADVICE).json()["advice"] == streamed
+
+
+def test_full_queue_is_shed_with_503(chatbot, monkeypatch):
+    admission = AdmissionController(max_concurrent=1, max_queue=0)
+    monkeypatch.setattr(api, "admission", admission)
+
+    async def while_busy():
+        async with admission.admit("ask"):
+            return (await _post("/ask", {"question": QUESTION}),
+                    await _post("/ask/batch", {"questions": [QUESTION]}),
+                    await _post("/ask/stream", {"question": QUESTION}))
+
+    for response in asyncio.run(while_busy()):
+        assert response.status_code == 503
+        assert int(response.headers["Retry-After"]) >= 1
+    assert admission.stats()["rejected"] == 3
+
+
+def test_stream_that_cannot_get_a_slot_ends_with_an_error_event(chatbot, monkeypatch):
+    admission = AdmissionController(max_concurrent=1, max_queue=1, max_wait=0.05)
+    monkeypatch.setattr(api, "admission", admission)
+
+    async def while_busy():
+        async with admission.admit("ask"):
+            return await _post("/ask/stream", {"question": QUESTION})
+
+    events = sse_events(asyncio.run(while_busy()))
+    assert [kind for kind, _ in events] == ["error"]
+    assert events[0][1]["retry_after"] >= 1
+
+
+def test_request_deadline_returns_504(chatbot, monkeypatch):
+    monkeypatch.setattr(api, "admission", ShortDeadline(max_concurrent=4))
+    chatbot.configure(llm=FakeLLM(answer_words=20, latency=5))
+    response = post("/ask", {"question": QUESTION})
+    assert response.status_code == 504
+    assert response.json() == {"detail": "Request took longer than 0.1s"}
+    assert api.admission.stats()["active"] == 0
+
+
+def test_stream_first_token_deadline_ends_with_an_error_event(chatbot, monkeypatch):
+    chatbot.configure(llm=FakeLLM(answer_words=20, time_to_first_token=5))
+    monkeypatch.setattr(chatbot, "LLM_DEADLINE_SECONDS", 0.05)
+    monkeypatch.setattr(chatbot, "LLM_FALLBACK_ENABLED", False)
+    events = sse_events(post("/ask/stream", {"question": QUESTION}))
+    assert [kind for kind, _ in events] == ["error"]
+
+
+def test_client_disconnect_cancels_the_request_with_499(chatbot, monkeypatch):
+    admission = AdmissionController(max_concurrent=4)
+    monkeypatch.setattr(api, "admission", admission)
+    chatbot.configure(llm=FakeLLM(answer_words=20, latency=5))
+    started = time.perf_counter()
+    assert asyncio.run(_post_and_disconnect("/ask", {"question": QUESTION})) == 499
+    assert time.perf_counter() - started < 1.0
+    assert admission.stats()["active"] == 0
@@ -0,0 +1,160 @@
+import asyncio
+import os
+import time
+
+import pytest
+from langchain_core.documents import Document
+
+from scripts.admission import DeadlineExceeded
+from scripts.fake_backends import FakeLLM
+from scripts.vector_index import CURRENT_FILE, load_index, save_index
+
+QUESTION = "How often should I test the pH of acid soil before sowing legumes?"
+FALLBACK = "The AI assistant is taking too long to respond right now"
+
+
+def _astream(chatbot, question, retrieval=None):
+    async def collect():
+        return [event async for event in chatbot.astream_chatbot(question, retrieval)]
+
+    return asyncio.run(collect())
+
+
+def _source_files(answer):
+    return {line[2:].split(" (Page")[0] for line in answer.split("**Sources:**")[1].strip().splitlines()}
+
+
+def test_entry_points_give_the_same_answer(chatbot):
+    answer = chatbot.ask_chatbot(QUESTION)
+    assert "\n\n**Sources:**\n- soil.txt" in answer
+
+    assert "".join(chatbot.stream_chatbot(QUESTION)) == answer
+    assert asyncio.run(chatbot.aask_chatbot(QUESTION)) == answer
+
+    events = _astream(chatbot, QUESTION)
+    assert {kind for kind, _ in events[:-1]} == {"token"}
+    assert events[-1][0] == "sources"
+    assert "".join(data for _, data in events[:-1]) + chatbot._sources_markdown(events[-1][1]) == answer
+
+    results = asyncio.run(chatbot.aask_chatbot_batch([QUESTION, " ", "Sandy soil"]))
+    assert results[0] == {"question": QUESTION, "answer": answer}
+    assert results[1] == {"question": " ", "error": "Question is empty."}
+    assert results[2]["answer"] == chatbot.ask_chatbot("Sandy soil")
+
+
+def test_semantic_cache_serves_repeated_questions(chatbot, monkeypatch):
+    monkeypatch.setattr(chatbot, "SEMANTIC_CACHE_ENABLED", True)
+    answer = asyncio.run(chatbot.aask_chatbot(QUESTION))
+    assert chatbot.answer_cache.stats()["size"] == 1
+
+    # A model with shorter answers shows that the later answers come from the cache
+    chatbot.configure(llm=FakeLLM(answer_words=3))
+    assert chatbot.ask_chatbot(QUESTION) == answer
+    assert "".join(chatbot.stream_chatbot(QUESTION)) == answer
+    assert asyncio.run(chatbot.aask_chatbot_batch([QUESTION])) == [{"question": QUESTION, "answer": answer}]
+    events = _astream(chatbot, QUESTION)
+    assert events[0][1] + chatbot._sources_markdown(events[1][1]) == answer
+    assert chatbot.answer_cache.stats()["hits"] == 4
+
+
+def test_only_default_vector_answers_are_cached(chatbot, monkeypatch):
+    monkeypatch.setattr(chatbot, "SEMANTIC_CACHE_ENABLED", True)
+    # Keyword fast path: every soil.txt chunk contains "soil", so there is no query vector
+    chatbot.ask_chatbot("soil")
+    chatbot.ask_chatbot(QUESTION, chatbot.retrieval_options(search_type="mmr"))
+    chatbot.ask_chatbot(QUESTION, chatbot.retrieval_options(topic="livestock"))
+    assert chatbot.answer_cache.stats()["size"] == 0
+
+    chatbot.configure(llm=FakeLLM(answer_words=0))
+    chatbot.ask_chatbot(QUESTION)
+    assert chatbot.answer_cache.stats()["size"] == 0
+
+
+def test_retrieval_filters_limit_the_sources(chatbot):
+    assert _source_files(chatbot.ask_chatbot(QUESTION)) == {"soil.txt", "cattle.txt", "pests.txt"}
+    assert _source_files(chatbot.ask_chatbot(QUESTION, chatbot.retrieval_options(topic="livestock"))) == {"cattle.txt"}
+    assert _source_files(chatbot.ask_chatbot(QUESTION, chatbot.retrieval_options(sources=["pests"]))) == {"pests.txt"}
+    with pytest.raises(ValueError):
+        chatbot.retrieval_options(sources=["wheat"])
+
+
+def test_missed_llm_deadline_answers_from_passages(chatbot, monkeypatch):
+    chatbot.configure(llm=FakeLLM(answer_words=20, latency=5, time_to_first_token=5))
+    monkeypatch.setattr(chatbot, "LLM_DEADLINE_SECONDS", 0.05)
+
+    answer = asyncio.run(chatbot.aask_chatbot(QUESTION))
+    assert answer.startswith(FALLBACK)
+    assert "> Test soil pH every few years" in answer
+    assert "\n\n**Sources:**\n- soil.txt" in answer
+
+    events = _astream(chatbot, QUESTION)
+    assert [kind for kind, _ in events] == ["token", "sources"]
+    assert events[0][1] + chatbot._sources_markdown(events[1][1]) == answer
+    assert asyncio.run(chatbot.aask_chatbot_batch([QUESTION]))[0]["answer"] == answer
+
+    monkeypatch.setattr(chatbot, "LLM_FALLBACK_ENABLED", False)
+    with pytest.raises(DeadlineExceeded):
+        asyncio.run(chatbot.aask_chatbot(QUESTION))
+    assert asyncio.run(chatbot.aask_chatbot_batch([QUESTION]))[0]["error"].startswith("Generation failed")
+
+
+def test_concurrent_identical_questions_share_one_answer(chatbot):
+    chatbot.configure(llm=FakeLLM(answer_words=20, latency=0.2))
+    before = chatbot.coalescing_stats()["async"]["coalesced"]
+
+    async def ask_three():
+        return await asyncio.gather(*(chatbot.aask_chatbot(question)
+                                      for question in (QUESTION, QUESTION.lower(), f"  {QUESTION} ")))
+
+    answers = asyncio.run(ask_three())
+    assert len(set(answers)) == 1
+    assert chatbot.coalescing_stats()["async"]["coalesced"] - before == 2
+
+
+def _publish_with(chatbot, text, source):
+    # A rebuilt index: the served one plus one chunk
+    db = load_index(chatbot.faiss_path, chatbot.get_embeddings(), mutable=True)
+    db.add_documents([Document(page_content=text, metadata={"source": source, "page": 1})])
+    save_index(db, chatbot.faiss_path)
+
+
+def test_new_index_version_is_swapped_in(chatbot, monkeypatch):
+    monkeypatch.setattr(chatbot, "SEMANTIC_CACHE_ENABLED", True)
+    question = "When should winter wheat be sown in a cold region?"
+    assert "wheat.txt" not in chatbot.ask_chatbot(question)
+    old_db, old_version = chatbot.get_db(), chatbot._db_version
+    assert chatbot.answer_cache.stats()["size"] == 1
+
+    _publish_with(chatbot, question, "wheat.txt")
+    assert chatbot.reload_index() is not old_db
+    assert chatbot._db_version != old_version
+    # Answers cached for the old index are dropped, and the new chunk is found
+    assert chatbot.answer_cache.stats()["size"] == 0
+    assert "- wheat.txt (Page 1)" in chatbot.ask_chatbot(question)
+    # A request that still holds the old store can finish its search
+    assert len(old_db.similarity_search(question, k=5)) == 5
+
+
+def test_coroutines_pick_up_a_new_version_in_the_background(chatbot, monkeypatch):
+    question = "When should winter wheat be sown in a cold region?"
+    asyncio.run(chatbot.aask_chatbot(question))
+    old_version = chatbot._db_version
+    _publish_with(chatbot, question, "wheat.txt")
+    monkeypatch.setattr(chatbot, "INDEX_RELOAD_INTERVAL", 0.01)
+    time.sleep(0.02)
+
+    # The due check does not hold up the request: it is answered from the loaded index
+    assert "wheat.txt" not in asyncio.run(chatbot.aask_chatbot(question))
+    for _ in range(100):
+        if chatbot._db_version != old_version:
+            break
+        time.sleep(0.02)
+    assert "wheat.txt" in asyncio.run(chatbot.aask_chatbot(question))
+
+
+def test_broken_new_version_keeps_the_old_one(chatbot, capsys):
+    db = chatbot.get_db()
+    with open(os.path.join(chatbot.faiss_path, CURRENT_FILE), "w") as f:
+        f.write("missing-version")
+    assert chatbot.reload_index() is db
+    assert "still serving" in capsys.readouterr().out
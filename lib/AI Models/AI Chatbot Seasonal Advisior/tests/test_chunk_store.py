@@ -0,0 +1,70 @@
+import os
+
+import pytest
+from langchain_community.vectorstores import FAISS
+from langchain_core.documents import Document
+
+from scripts.chunk_store import MmapDocstore, RowIdMap, write_chunk_store
+from scripts.fake_backends import FakeEmbeddings
+from scripts.vector_index import LEGACY_DOCSTORE_FILE, load_index, migrate_legacy_index
+
+DOCS = [
+    Document(page_content="Plant corn once the soil is warm.", metadata={"source": "corn.pdf", "page": 3}),
+    Document(page_content="Préparez le sol au printemps 🌱", metadata={"source": "sol.pdf", "page": "iv"}),
+    Document(page_content="", metadata={"source": "corn.pdf"}),
+    Document(page_content="Rotate corn with soybeans.",
+             metadata={"source": "corn.pdf", "page": 0, "sources": [{"source": "corn.pdf", "page": 0},
+                                                                    {"source": "soy.pdf", "page": 2}]}),
+]
+
+
+def test_round_trip(tmp_path):
+    write_chunk_store(str(tmp_path), DOCS, ["a", "b", "c", "d"])
+    docstore = MmapDocstore(str(tmp_path))
+
+    assert len(docstore) == 4
+    for row, doc in enumerate(DOCS):
+        loaded = docstore.get(row)
+        assert loaded.page_content == doc.page_content
+        assert loaded.metadata == doc.metadata
+        assert loaded.id == "abcd"[row]
+    # Source names are interned, including those only listed under "sources"
+    assert docstore.sources == ["corn.pdf", "sol.pdf", "soy.pdf"]
+    assert list(docstore.source_ids) == [0, 1, 0, 0]
+
+    assert docstore.search("3").page_content == "Rotate corn with soybeans."
+    assert docstore.search("4") == "ID 4 not found."
+
+
+def test_empty_store(tmp_path):
+    write_chunk_store(str(tmp_path), [], [])
+    assert len(MmapDocstore(str(tmp_path))) == 0
+
+
+def test_row_id_map():
+    ids = RowIdMap(3)
+    assert ids[2] == "2"
+    assert ids.get(3) is None
+    with pytest.raises(KeyError):
+        ids[-1]
+    assert len(ids) == 3
+    assert list(ids) == [0, 1, 2]
+    assert dict(ids.items()) == {0: "0", 1: "1", 2: "2"}
+    assert list(ids.values()) == ["0", "1", "2"]
+
+
+def test_migrate_legacy_index(tmp_path):
+    embeddings = FakeEmbeddings(size=16)
+    folder = str(tmp_path / "index")
+    FAISS.from_documents(DOCS, embeddings).save_local(folder)
+
+    with pytest.raises(FileNotFoundError, match="migrate"):
+        load_index(folder, embeddings)
+
+    migrate_legacy_index(folder)
+    assert not os.path.exists(os.path.join(folder, LEGACY_DOCSTORE_FILE))
+    db = load_index(folder, embeddings)
+    assert isinstance(db.docstore, MmapDocstore)
+    hits = db.similarity_search(DOCS[3].page_content, k=1)
+    assert hits[0].page_content == DOCS[3].page_content
+    assert hits[0].metadata == DOCS[3].metadata
@@ -0,0 +1,58 @@
+from langchain_core.documents import Document
+
+from scripts.context_packing import count_tokens, pack_context
+
+TEXT = ("Apply nitrogen fertilizer to corn in two splits, the first at planting and the second when the plants "
+        "reach knee height, to limit losses from leaching after heavy rain. Test the soil first.")
+
+
+def chunk(start, end, source="corn.pdf", page=1, with_start=True):
+    metadata = {"source": source, "page": page}
+    if with_start:
+        metadata["start_index"] = start
+    return Document(page_content=TEXT[start:end], metadata=metadata)
+
+
+def test_overlapping_chunks_of_a_page_are_merged():
+    for with_start in (True, False):
+        docs = [chunk(60, 150, with_start=with_start), chunk(0, 90, with_start=with_start)]
+        packed, report = pack_context(docs, 0)
+        assert [doc.page_content for doc in packed] == [TEXT[:150]]
+        assert report["merged"] == 1
+
+    # Touching chunks (start_index only) are joined with a space
+    packed, _ = pack_context([chunk(0, 59), chunk(60, 150)], 0)
+    assert packed[0].page_content == TEXT[:59] + " " + TEXT[60:150]
+
+
+def test_chunks_of_other_pages_are_not_merged():
+    docs = [chunk(0, 90), chunk(60, 150, page=2), chunk(30, 110, source="other.pdf")]
+    packed, report = pack_context(docs, 0)
+    assert len(packed) == 3
+    assert report["merged"] == 0
+
+
+def test_near_duplicates_of_more_relevant_passages_are_dropped():
+    docs = [
+        Document(page_content=TEXT, metadata={"source": "corn.pdf", "page": 1}),
+        Document(page_content="Store potatoes in a cool dark place.", metadata={"source": "potato.pdf", "page": 4}),
+        Document(page_content=TEXT.replace("Test the soil first.", "Test the soil."), metadata={"source": "guide.pdf"}),
+    ]
+    packed, report = pack_context(docs, 0)
+    assert [doc.metadata["source"] for doc in packed] == ["corn.pdf", "potato.pdf"]
+    assert report["duplicates_dropped"] == 1
+
+
+def test_token_budget():
+    docs = [Document(page_content=f"Passage {i}: " + "word " * 40, metadata={"source": f"{i}.pdf"}) for i in range(5)]
+    size = count_tokens(docs[0].page_content)
+    packed, report = pack_context(docs, 2 * size + 1)
+    assert [doc.metadata["source"] for doc in packed] == ["0.pdf", "1.pdf"]
+    assert report["over_budget_dropped"] == 3
+    assert report["tokens_saved"] == report["tokens_in"] - report["tokens_out"] > 0
+
+    # A single passage larger than the budget is truncated rather than dropped
+    packed, report = pack_context(docs[:1], 10)
+    assert len(packed) == 1
+    assert 0 < count_tokens(packed[0].page_content) <= 10
+    assert docs[0].page_content.startswith(packed[0].page_content)
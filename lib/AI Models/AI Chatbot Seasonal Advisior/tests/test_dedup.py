@@ -0,0 +1,47 @@
+from langchain_core.documents import Document
+
+from scripts.dedup import NearDuplicateIndex, dedup_chunks, lsh_bands, minhash
+
+PASSAGE = ("Apply nitrogen fertilizer to corn in two splits, the first at planting and the second "
+           "when the plants reach knee height, to limit losses from leaching after heavy rain.")
+
+
+def test_lsh_bands_put_the_s_curve_below_the_threshold():
+    for threshold in (0.7, 0.8, 0.9):
+        bands, rows = lsh_bands(threshold)
+        assert bands * rows <= 128
+        assert (1 / bands) ** (1 / rows) <= threshold - 0.1
+
+    bands, rows = lsh_bands(0.9)
+    assert 1 - (1 - 0.9 ** rows) ** bands > 0.99
+    # Clearly different chunks almost never become candidates
+    assert 1 - (1 - 0.5 ** rows) ** bands < 0.02
+
+
+def test_near_duplicate_index():
+    index = NearDuplicateIndex(0.8)
+    index.add("a", minhash(PASSAGE))
+    match, similarity = index.query(minhash(PASSAGE + " Wait for dry weather."))
+    assert match == "a"
+    assert 0.8 <= similarity < 1.0
+    assert index.query(minhash("Store potatoes in a cool dark place away from light.")) == (None, 0.0)
+    assert index.query(minhash("")) == (None, 0.0)
+
+
+def test_dedup_chunks_merges_locations():
+    docs = [
+        Document(page_content=PASSAGE, metadata={"source": "corn.pdf", "page": 3}),
+        Document(page_content="Store potatoes in a cool dark place.", metadata={"source": "potato.pdf", "page": 1}),
+        Document(page_content=PASSAGE, metadata={"source": "handbook.pdf", "page": 40}),
+        Document(page_content=PASSAGE, metadata={"source": "corn.pdf", "page": 3}),
+    ]
+    kept, report = dedup_chunks(docs, threshold=0.9)
+
+    assert [doc.metadata["source"] for doc in kept] == ["corn.pdf", "potato.pdf"]
+    assert kept[0].metadata["page"] == 3
+    assert kept[0].metadata["sources"] == [
+        {"source": "corn.pdf", "page": 3},
+        {"source": "handbook.pdf", "page": 40},
+    ]
+    assert "sources" not in kept[1].metadata
+    assert report == {"chunks_in": 4, "chunks_out": 2, "duplicates": 2, "shrink": 0.5}
@@ -0,0 +1,95 @@
+import numpy as np
+import pytest
+from langchain_community.vectorstores import FAISS
+
+from scripts import embedding_backends
+from scripts.embedding_backends import (TfidfSvdEmbeddings, _count_matrix, _sparse_dot, _tfidf, embedding_info,
+                                        embedding_mismatch, get_embedding_backend)
+from scripts.embedding_cache import CachedEmbeddings
+from scripts.fake_backends import FakeEmbeddings
+from scripts.vector_index import load_index, save_index
+
+CORPUS = [
+    "Milk cows twice a day and keep the udder clean.",
+    "Dairy cows need clean water and good feed to give milk.",
+    "Vaccinate calves and cows against common diseases.",
+    "Aphids and whiteflies suck sap from crop leaves.",
+    "Sticky traps catch aphids and whiteflies early.",
+    "Spray neem oil on leaves against aphids.",
+    "Add compost to improve soil structure and feed soil life.",
+    "Mulch keeps moisture in sandy soil and adds organic matter.",
+]
+
+
+@pytest.fixture(scope="module")
+def model():
+    return TfidfSvdEmbeddings.fit(CORPUS, dimension=4)
+
+
+def test_similar_texts_get_similar_vectors(model):
+    vectors = np.array(model.embed_documents(CORPUS))
+    assert vectors.shape == (8, 4)
+    assert np.allclose(np.linalg.norm(vectors, axis=1), 1, atol=1e-5)
+
+    query = np.array(model.embed_query("How often should I milk my cows?"))
+    scores = vectors @ query
+    assert set(np.argsort(-scores)[:2]) <= {0, 1, 2}
+    # No known term: a zero vector rather than NaNs
+    assert model.embed_query("tractor") == [0.0] * 4
+
+
+def test_fit_is_reproducible_and_saved(model, tmp_path):
+    assert TfidfSvdEmbeddings.fit(CORPUS, dimension=4).model == model.model
+    assert TfidfSvdEmbeddings.fit(CORPUS[:6], dimension=4).model != model.model
+
+    path = str(tmp_path / "tfidf.npz")
+    model.save(path)
+    loaded = get_embedding_backend("tfidf", path)
+    assert loaded.model == model.model
+    assert np.allclose(loaded.embed_documents(CORPUS), model.embed_documents(CORPUS))
+
+    with pytest.raises(FileNotFoundError, match="build_faiss.py"):
+        TfidfSvdEmbeddings.load(str(tmp_path / "missing.npz"))
+    with pytest.raises(ValueError):
+        get_embedding_backend("word2vec")
+    with pytest.raises(ValueError):
+        TfidfSvdEmbeddings.fit(["one", "two"])
+
+
+def test_sparse_product_in_blocks(monkeypatch):
+    rng = np.random.default_rng(0)
+    token_lists = [list(rng.choice(["a", "b", "c", "d", "e"], size=rng.integers(0, 6))) for _ in range(50)]
+    vocab = {term: i for i, term in enumerate("abcde")}
+    indptr, indices, counts = _count_matrix(token_lists, vocab)
+    data = _tfidf(indptr, indices, counts, np.ones(5, dtype=np.float32))
+    dense = np.zeros((50, 5), dtype=np.float32)
+    for row in range(50):
+        dense[row, indices[indptr[row]:indptr[row + 1]]] = data[indptr[row]:indptr[row + 1]]
+    matrix = rng.standard_normal((5, 3)).astype(np.float32)
+
+    monkeypatch.setattr(embedding_backends, "_BLOCK_NNZ", 4)
+    assert np.allclose(_sparse_dot(indptr, indices, data, matrix), dense @ matrix, atol=1e-5)
+
+
+def test_embedding_info_looks_through_the_cache(model, tmp_path):
+    assert embedding_info(model) == {"backend": "tfidf", "model": model.model, "dimension": 4}
+    cached = CachedEmbeddings(FakeEmbeddings(size=16), str(tmp_path / "cache.sqlite3"))
+    assert embedding_info(cached) == {"backend": "FakeEmbeddings", "model": "fake-16", "dimension": 16}
+
+
+def test_embedding_mismatch(model):
+    fake = FakeEmbeddings(size=4)
+    recorded = embedding_info(model)
+    assert embedding_mismatch(recorded, model) is None
+    assert "queried with FakeEmbeddings (fake-4)" in embedding_mismatch(recorded, fake)
+    # Indexes saved before the metadata existed: only the dimension can be checked
+    assert embedding_mismatch(None, fake, index_dimension=4) is None
+    assert "768-dimensional" in embedding_mismatch(None, fake, index_dimension=768)
+
+
+def test_index_refuses_other_embeddings(model, tmp_path):
+    folder = str(tmp_path / "index")
+    save_index(FAISS.from_texts(CORPUS, model), folder, embedding=embedding_info(model))
+    assert load_index(folder, model).similarity_search("milk cows", k=1)[0].page_content in CORPUS[:3]
+    with pytest.raises(ValueError, match="Rebuild the index"):
+        load_index(folder, FakeEmbeddings(size=4))
@@ -0,0 +1,100 @@
+import asyncio
+
+import numpy as np
+
+from scripts.embedding_cache import CachedEmbeddings, aembed_query_batch, normalize_query
+from scripts.fake_backends import FakeEmbeddings
+
+
+class CountingEmbeddings(FakeEmbeddings):
+    """FakeEmbeddings that records the texts of every query request."""
+
+    def __init__(self, size=16):
+        super().__init__(size=size)
+        self.requests = []
+
+    def embed_query(self, text):
+        self.requests.append([text])
+        return super().embed_query(text)
+
+    async def aembed_query(self, text):
+        self.requests.append([text])
+        return await super().aembed_query(text)
+
+
+class BatchingEmbeddings(CountingEmbeddings):
+    """Embeds a list of queries in one request when asked for query-type vectors, like Gemini."""
+
+    async def aembed_documents(self, texts, task_type=None):
+        assert task_type == "retrieval_query"
+        self.requests.append(list(texts))
+        return [self._vector(text) for text in texts]
+
+
+def test_normalize_query():
+    assert normalize_query("  When to PLANT\tcorn? ") == "when to plant corn?"
+
+
+def test_memory_then_disk_then_model(tmp_path):
+    path = str(tmp_path / "embeddings.sqlite3")
+    underlying = CountingEmbeddings()
+    cache = CachedEmbeddings(underlying, path)
+
+    vector = cache.embed_query("When should I plant corn?")
+    assert np.allclose(vector, underlying._vector("When should I plant corn?"), atol=1e-6)
+    assert cache.embed_query("when should i  plant corn?") == vector
+    assert asyncio.run(cache.aembed_query("When should I plant corn?")) == vector
+    assert len(underlying.requests) == 1
+    assert cache.stats()["memory_hits"] == 2
+
+    # Another worker process: its memory is empty but the SQLite file is shared
+    other = CachedEmbeddings(CountingEmbeddings(), path)
+    assert other.embed_query("When should I plant corn?") == vector
+    assert other.underlying.requests == []
+    assert other.stats() == {"memory_hits": 0, "disk_hits": 1, "misses": 0, "hit_rate": 1.0, "memory_size": 1}
+
+
+def test_models_do_not_share_vectors(tmp_path):
+    path = str(tmp_path / "embeddings.sqlite3")
+    CachedEmbeddings(FakeEmbeddings(size=16), path).embed_query("question")
+    other = CachedEmbeddings(CountingEmbeddings(size=32), path)
+    assert len(other.embed_query("question")) == 32
+    assert other.stats()["misses"] == 1
+
+
+def test_memory_keeps_the_most_recent_queries(tmp_path):
+    cache = CachedEmbeddings(CountingEmbeddings(), str(tmp_path / "embeddings.sqlite3"), max_memory_entries=2)
+    for text in ("a", "b", "a", "c"):
+        cache.embed_query(text)
+    assert cache.stats()["memory_size"] == 2
+    cache.embed_query("a")
+    cache.embed_query("b")
+    assert cache.stats()["memory_hits"] == 2
+    assert cache.stats()["disk_hits"] == 1
+
+
+def test_documents_are_not_cached(tmp_path):
+    underlying = CountingEmbeddings()
+    cache = CachedEmbeddings(underlying, str(tmp_path / "embeddings.sqlite3"))
+    assert cache.embed_documents(["a", "b"]) == underlying.embed_documents(["a", "b"])
+    assert cache.stats()["misses"] == 0
+
+
+def test_batch_embeds_all_misses_in_one_request(tmp_path):
+    underlying = BatchingEmbeddings()
+    cache = CachedEmbeddings(underlying, str(tmp_path / "embeddings.sqlite3"))
+    cache.embed_query("a")
+
+    vectors = asyncio.run(aembed_query_batch(cache, ["a", "b", "B ", "c"]))
+    assert underlying.requests == [["a"], ["b", "c"]]
+    assert vectors[1] == vectors[2]
+    assert vectors == [cache.embed_query(text) for text in ("a", "b", "b", "c")]
+    assert asyncio.run(aembed_query_batch(cache, [])) == []
+
+
+def test_batch_without_query_batching_embeds_concurrently():
+    underlying = CountingEmbeddings()
+    vectors = asyncio.run(aembed_query_batch(underlying, ["a", "b"]))
+    assert underlying.requests == [["a"], ["b"]]
+    assert vectors == [underlying._vector("a"), underlying._vector("b")]
+    assert asyncio.run(aembed_query_batch(BatchingEmbeddings(), ["a", "b"])) == vectors
@@ -0,0 +1,124 @@
+import threading
+import time
+
+import pytest
+from langchain_core.documents import Document
+
+from scripts.embedding_pipeline import EmbeddingCheckpoint, EmbeddingStage, is_rate_limit_error
+from scripts.fake_backends import FakeEmbeddings
+
+
+class FlakyEmbeddings(FakeEmbeddings):
+    """FakeEmbeddings whose document requests fail as scripted, recording the texts embedded."""
+
+    def __init__(self, failures=(), latency=0.0):
+        """
+        Args:
+            failures (iterable): Exceptions raised by the first requests, in order (None = succeed)
+        """
+        super().__init__(size=8, latency=latency)
+        self.failures = list(failures)
+        self.embedded = []
+        self._lock = threading.Lock()
+
+    def embed_documents(self, texts):
+        with self._lock:
+            failure = self.failures.pop(0) if self.failures else None
+        time.sleep(self.latency)
+        if failure is not None:
+            raise failure
+        with self._lock:
+            self.embedded.extend(texts)
+        return [self._vector(text) for text in texts]
+
+
+def items(count):
+    return [(f"id{i}", Document(page_content=f"chunk {i}")) for i in range(count)]
+
+
+def collect(stage, pairs):
+    vectors = {}
+    for ids, docs, batch in stage.run(iter(pairs)):
+        assert [doc.page_content for doc in docs] == [f"chunk {cid[2:]}" for cid in ids]
+        vectors.update(zip(ids, batch))
+    return vectors
+
+
+def test_is_rate_limit_error():
+    assert is_rate_limit_error(RuntimeError("429 Too Many Requests"))
+    assert is_rate_limit_error(RuntimeError("Resource has been exhausted (e.g. check quota)."))
+    assert not is_rate_limit_error(RuntimeError("503 Service Unavailable"))
+
+
+def test_all_chunks_are_embedded_once():
+    embeddings = FlakyEmbeddings()
+    vectors = collect(EmbeddingStage(embeddings, batch_size=3, max_concurrency=2), items(10))
+    assert sorted(embeddings.embedded) == sorted(f"chunk {i}" for i in range(10))
+    assert vectors["id7"] == embeddings._vector("chunk 7")
+
+
+def test_rate_limit_halves_concurrency_and_cools_down():
+    stage = EmbeddingStage(FlakyEmbeddings(), max_concurrency=4)
+    stage._acquire()
+    stage._release(rate_limited_delay=0.1)
+    assert stage._limit == 2
+    assert stage.rate_limited == 1
+
+    # Nothing starts during the cooldown
+    started = time.monotonic()
+    stage._acquire()
+    assert time.monotonic() - started >= 0.09
+    stage._release(rate_limited_delay=0.0)
+    assert stage._limit == 1
+
+    # Additive increase: one slot back after twice the current limit of successes
+    for _ in range(2):
+        stage._acquire()
+        stage._release()
+    assert stage._limit == 2
+    for _ in range(4):
+        stage._acquire()
+        stage._release()
+    assert stage._limit == 3
+
+
+def test_rate_limited_batches_are_retried_with_fewer_requests():
+    embeddings = FlakyEmbeddings(failures=[RuntimeError("429 Resource exhausted")] * 2, latency=0.02)
+    stage = EmbeddingStage(embeddings, batch_size=2, max_concurrency=4, base_delay=0.01)
+    vectors = collect(stage, items(20))
+    assert len(vectors) == 20
+    assert stage.rate_limited == 2
+    assert stage._limit < 4
+    assert len(embeddings.embedded) == 20
+
+
+def test_other_errors_are_retried_then_raised():
+    embeddings = FlakyEmbeddings(failures=[RuntimeError("503 Service Unavailable")])
+    assert len(collect(EmbeddingStage(embeddings, batch_size=5, base_delay=0.01), items(5))) == 5
+    assert embeddings.embedded == [f"chunk {i}" for i in range(5)]
+
+    embeddings = FlakyEmbeddings(failures=[RuntimeError("503 Service Unavailable")] * 2)
+    with pytest.raises(RuntimeError, match="503"):
+        collect(EmbeddingStage(embeddings, batch_size=5, max_retries=1, base_delay=0.01), items(5))
+
+
+def test_checkpoint_resumes_an_interrupted_build(tmp_path):
+    path = str(tmp_path / "checkpoint.sqlite3")
+    embeddings = FlakyEmbeddings(failures=[None, None, RuntimeError("connection reset")])
+    stage = EmbeddingStage(embeddings, EmbeddingCheckpoint(path, "fake-8"), batch_size=4, max_concurrency=1,
+                           max_retries=0)
+    with pytest.raises(RuntimeError):
+        collect(stage, items(12))
+    assert len(embeddings.embedded) == 8
+
+    # The next run only embeds what the interrupted one did not finish
+    embeddings = FlakyEmbeddings()
+    checkpoint = EmbeddingCheckpoint(path, "fake-8")
+    vectors = collect(EmbeddingStage(embeddings, checkpoint, batch_size=4), items(12))
+    assert sorted(embeddings.embedded) == sorted(f"chunk {i}" for i in range(8, 12))
+    assert vectors["id0"] == pytest.approx(embeddings._vector("chunk 0"), abs=1e-6)
+
+    # Vectors of another model are not reused, and a cleared checkpoint is empty
+    assert EmbeddingCheckpoint(path, "other-model").get_many(["id0"]) == {}
+    checkpoint.clear()
+    assert checkpoint.get_many(["id0", "id11"]) == {}
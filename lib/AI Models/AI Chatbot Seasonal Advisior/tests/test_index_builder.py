@@ -0,0 +1,89 @@
+import os
+
+from langchain_core.documents import Document
+
+from scripts.fake_backends import FakeEmbeddings
+from scripts.index_builder import load_manifest, update_index
+from scripts.vector_index import load_index
+
+SHARED = ("Rotate corn with soybeans to break the life cycle of rootworm and other pests, "
+          "and to let the soybeans fix nitrogen for the next corn crop in the field.")
+
+
+def load_files(paths):
+    # One chunk per paragraph; page numbers are paragraph numbers
+    for path in paths:
+        with open(path) as f:
+            paragraphs = [text.strip() for text in f.read().split("\n\n") if text.strip()]
+        chunks = [Document(page_content=text, metadata={"source": os.path.basename(path), "page": page})
+                  for page, text in enumerate(paragraphs)]
+        yield path, chunks, None
+
+
+def write(path, *paragraphs):
+    with open(path, "w") as f:
+        f.write("\n\n".join(paragraphs))
+    return str(path)
+
+
+def build(files, folder, embeddings):
+    return update_index(files, load_files, embeddings, folder, settings={"chunk_size": 1000},
+                        dedup_threshold=0.9)
+
+
+def sources(folder, embeddings):
+    db = load_index(folder, embeddings)
+    return {doc.page_content: doc.metadata for doc in (db.docstore.search(cid) for cid in db.index_to_docstore_id.values())}
+
+
+def test_incremental_update_embeds_only_new_chunks(tmp_path):
+    embeddings = FakeEmbeddings(size=16)
+    folder = str(tmp_path / "index")
+    corn = write(tmp_path / "corn.txt", "Plant corn in spring.", "Harvest corn in autumn.")
+    wheat = write(tmp_path / "wheat.txt", "Sow winter wheat in October.")
+
+    report = build([corn, wheat], folder, embeddings)
+    assert report["chunks_added"] == 3
+    assert report["total_chunks"] == 3
+
+    report = build([corn, wheat], folder, embeddings)
+    assert report["files_unchanged"] == 2
+    assert report["chunks_added"] == 0
+    assert report["chunks_kept"] == 3
+
+    # Changed file: the new paragraph is embedded, the dropped one removed, the kept one reused
+    write(tmp_path / "corn.txt", "Plant corn in spring.", "Irrigate corn during tasseling.")
+    report = build([corn, wheat], folder, embeddings)
+    assert report["files_changed"] == [corn]
+    assert report["chunks_added"] == 1
+    assert report["chunks_removed"] == 1
+    assert report["total_chunks"] == 3
+
+    report = build([corn], folder, embeddings)
+    assert report["files_removed"] == [wheat]
+    assert report["chunks_removed"] == 1
+    assert set(sources(folder, embeddings)) == {"Plant corn in spring.", "Irrigate corn during tasseling."}
+    assert set(load_manifest(folder)["files"]) == {corn}
+
+
+def test_near_duplicates_are_relabeled_when_a_copy_goes_away(tmp_path):
+    embeddings = FakeEmbeddings(size=16)
+    folder = str(tmp_path / "index")
+    corn = write(tmp_path / "corn.txt", SHARED)
+    soy = write(tmp_path / "soy.txt", "Soybeans need well-drained soil.", SHARED)
+
+    report = build([corn, soy], folder, embeddings)
+    assert report["chunks_deduplicated"] == 1
+    assert report["total_chunks"] == 2
+    assert sources(folder, embeddings)[SHARED]["sources"] == [
+        {"source": "corn.txt", "page": 0},
+        {"source": "soy.txt", "page": 1},
+    ]
+
+    # The file the vector came from is gone; the passage stays, now pointing at its remaining copy
+    report = build([soy], folder, embeddings)
+    assert report["chunks_removed"] == 0
+    assert report["chunks_added"] == 0
+    shared = sources(folder, embeddings)[SHARED]
+    assert (shared["source"], shared["page"]) == ("soy.txt", 1)
+    assert "sources" not in shared
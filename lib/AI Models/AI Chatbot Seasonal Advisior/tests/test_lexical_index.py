@@ -0,0 +1,44 @@
+import numpy as np
+
+from scripts.lexical_index import load_lexical_index, reciprocal_rank_fusion, tokenize, write_lexical_index
+
+TEXTS = [
+    "Plant corn in spring once the soil is warm.",
+    "Wheat rust is a fungal disease of wheat; wheat rust spreads in humid weather.",
+    "Store potatoes in a cool dark place.",
+    "Corn and wheat rotations reduce pests.",
+]
+
+
+def test_tokenize_drops_stopwords():
+    assert tokenize("When should I plant the Corn?") == ["plant", "corn"]
+
+
+def test_bm25_ranks_by_term_weight(tmp_path):
+    write_lexical_index(str(tmp_path), TEXTS)
+    index = load_lexical_index(str(tmp_path))
+
+    hits = index.search("wheat rust", k=5)
+    assert [row for row, _, _ in hits] == [1, 3]
+    assert hits[0][1] > hits[1][1]
+    assert [matched for _, _, matched in hits] == [2, 1]
+
+    assert index.search("tomatoes") == []
+    assert index.query_terms("wheat tomatoes") == (["wheat", "tomatoes"], 1)
+
+
+def test_bm25_respects_the_allowed_mask(tmp_path):
+    write_lexical_index(str(tmp_path), TEXTS)
+    index = load_lexical_index(str(tmp_path))
+    allowed = np.array([True, False, True, True])
+    assert [row for row, _, _ in index.search("wheat corn", allowed=allowed)] == [3, 0]
+
+
+def test_missing_index_loads_as_none(tmp_path):
+    assert load_lexical_index(str(tmp_path)) is None
+
+
+def test_reciprocal_rank_fusion_rewards_agreement():
+    fused = reciprocal_rank_fusion([["a", "b", "c"], ["b", "c", "d"]])
+    assert fused == ["b", "c", "a", "d"]
+    assert reciprocal_rank_fusion([]) == []
@@ -0,0 +1,224 @@
+import asyncio
+import threading
+import time
+
+import pytest
+
+from scripts import llm_client
+from scripts.fake_backends import FakeGeminiServer
+from scripts.llm_client import GeminiClient, LLMError, _response_text
+
+
+@pytest.fixture
+def server():
+    with FakeGeminiServer(answer_words=5) as server:
+        yield server
+
+
+@pytest.fixture(autouse=True)
+def fast_backoff(monkeypatch):
+    monkeypatch.setattr(llm_client, "LLM_RETRY_BASE_SECONDS", 0.01)
+
+
+def test_generate_and_stream(server):
+    client = GeminiClient(base_url=server.url, api_key=None)
+    answer = client.generate("hello")
+    assert len(answer.split()) == 5
+    assert "".join(client.stream("hello")) == answer
+    assert asyncio.run(client.agenerate("hello")) == answer
+
+    async def astream():
+        return "".join([text async for text in client.astream("hello")])
+
+    assert asyncio.run(astream()) == answer
+    # One connection for the two sync calls, one per event loop for the async ones
+    assert server.counts["connections"] == 3
+    assert client.stats()["calls"] == 4
+
+
+def test_failed_attempts_are_retried():
+    with FakeGeminiServer(answer_words=5, fail_first=2) as server:
+        client = GeminiClient(base_url=server.url, api_key=None, max_retries=2)
+        assert len(client.generate("hello").split()) == 5
+        assert server.counts["requests"] == 3
+        assert client.stats()["retries"] == 2
+
+    with FakeGeminiServer(answer_words=5, fail_first=2) as server:
+        client = GeminiClient(base_url=server.url, api_key=None, max_retries=2)
+        assert len(asyncio.run(client.agenerate("hello")).split()) == 5
+        assert client.stats()["retries"] == 2
+
+    with FakeGeminiServer(answer_words=5, fail_first=2) as server:
+        client = GeminiClient(base_url=server.url, api_key=None, max_retries=1)
+        with pytest.raises(LLMError) as error:
+            client.generate("hello")
+        assert error.value.status_code == 503
+        assert client.stats()["errors"] == 1
+
+
+def test_errors_that_will_not_go_away_are_not_retried():
+    client = GeminiClient(api_key=None, max_retries=2)
+    for error in (LLMError("Bad request", 400), LLMError("Prompt was blocked by the LLM API: OTHER")):
+        attempts = []
+
+        def attempt():
+            attempts.append(1)
+            raise error
+
+        with pytest.raises(LLMError):
+            client._retrying(attempt)
+        assert len(attempts) == 1
+    assert client.stats()["retries"] == 0
+
+
+def test_retry_waits_for_retry_after(monkeypatch):
+    monkeypatch.setattr(llm_client, "LLM_RETRY_MAX_SECONDS", 0.3)
+    with FakeGeminiServer(answer_words=5, fail_first=1, retry_after=60) as server:
+        client = GeminiClient(base_url=server.url, api_key=None, max_retries=1)
+        started = time.perf_counter()
+        client.generate("hello")
+        # Retry-After is honoured, up to LLM_RETRY_MAX_SECONDS
+        assert 0.3 <= time.perf_counter() - started < 2
+
+
+def test_streams_are_retried_until_the_first_chunk():
+    with FakeGeminiServer(answer_words=25, fail_first=1) as server:
+        client = GeminiClient(base_url=server.url, api_key=None, max_retries=1)
+        chunks = list(client.stream("hello"))
+        assert len(chunks) == 3
+        assert len("".join(chunks).split()) == 25
+        assert server.counts["requests"] == 2
+
+
+def test_slow_calls_are_hedged():
+    client = GeminiClient(api_key=None, hedge=True, hedge_min_samples=5, hedge_max_fraction=1.0)
+    for _ in range(5):
+        client.latency.add(0.01)
+    started = []
+
+    async def call():
+        # The first attempt hangs; the hedged duplicate answers at once
+        started.append(time.perf_counter())
+        if len(started) == 1:
+            await asyncio.sleep(5)
+        return "answer"
+
+    began = time.perf_counter()
+    assert asyncio.run(client._hedged(call, client.latency)) == "answer"
+    assert time.perf_counter() - began < 1
+    assert started[1] - started[0] >= llm_client.LLM_HEDGE_MIN_DELAY
+    assert {key: client.stats()[key] for key in ("calls", "hedges", "hedge_wins")} == {"calls": 1, "hedges": 1, "hedge_wins": 1}
+
+
+def test_hedging_waits_for_samples_and_respects_its_budget():
+    client = GeminiClient(api_key=None, hedge=True, hedge_min_samples=5, hedge_max_fraction=0.5)
+    assert client.hedge_delay(client.latency) is None
+    for _ in range(4):
+        client.latency.add(0.01)
+    assert client.hedge_delay(client.latency) is None
+    # Enough fast samples that the slow calls below don't move the 95th percentile
+    for _ in range(100):
+        client.latency.add(0.01)
+    assert client.hedge_delay(client.latency) == llm_client.LLM_HEDGE_MIN_DELAY
+
+    async def slow():
+        await asyncio.sleep(0.1)
+        return "answer"
+
+    async def run_four():
+        return [await client._hedged(slow, client.latency) for _ in range(4)]
+
+    assert asyncio.run(run_four()) == ["answer"] * 4
+    # At most half of the calls: the first and third
+    assert client.stats()["hedges"] == 2
+    assert GeminiClient(api_key=None, hedge=False).hedge_delay(client.latency) is None
+
+
+def test_hedged_stream_closes_the_losing_stream():
+    client = GeminiClient(api_key=None, hedge=True, hedge_min_samples=1, hedge_max_fraction=1.0)
+    client.first_chunk_latency.add(0.01)
+
+    class Stream:
+        closed = False
+
+        async def aclose(self):
+            self.closed = True
+
+    async def run():
+        # Both attempts open their stream in the same event loop step
+        release = asyncio.Event()
+        streams = []
+
+        async def call():
+            streams.append(Stream())
+            stream = streams[-1]
+            if len(streams) == 2:
+                asyncio.get_running_loop().call_later(0.01, release.set)
+            await release.wait()
+            return "first chunk", stream
+
+        first, stream = await client._hedged(call, client.first_chunk_latency, discard=lambda opened: opened[1].aclose())
+        return first, stream, streams
+
+    first, stream, streams = asyncio.run(run())
+    assert first == "first chunk"
+    assert len(streams) == 2
+    assert not stream.closed
+    assert [other.closed for other in streams if other is not stream] == [True]
+
+
+def test_response_text():
+    assert _response_text({"candidates": [{"content": {"parts": [{"text": "a"}, {"text": "b"}]}}]}) == "ab"
+    assert _response_text({"candidates": [{"content": {"parts": []}}]}) == ""
+    assert _response_text({"candidates": [{"content": {"parts": []}, "finishReason": "STOP"}]}) == ""
+    with pytest.raises(LLMError, match="SAFETY"):
+        _response_text({"candidates": [{"content": {"parts": []}, "finishReason": "SAFETY"}]})
+    with pytest.raises(LLMError, match="OTHER"):
+        _response_text({"promptFeedback": {"blockReason": "OTHER"}})
+
+
+def test_async_client_is_closed_with_its_event_loop(server):
+    client = GeminiClient(base_url=server.url, api_key=None)
+
+    async def call():
+        await client.agenerate("hello")
+        return client._async_client()
+
+    first = asyncio.run(call())
+    assert first.is_closed
+    second = asyncio.run(call())
+    assert second.is_closed
+    assert second is not first
+    assert len(client._async_clients) == 1
+
+
+def test_aclose_closes_clients_of_other_running_loops(server):
+    client = GeminiClient(base_url=server.url, api_key=None)
+    opened, done = threading.Event(), threading.Event()
+    clients = {}
+
+    def other_loop():
+        async def main():
+            await client.agenerate("hello")
+            clients["other"] = client._async_client()
+            opened.set()
+            while not clients["other"].is_closed:
+                await asyncio.sleep(0.01)
+            done.set()
+
+        asyncio.run(main())
+
+    thread = threading.Thread(target=other_loop, daemon=True)
+    thread.start()
+    opened.wait(5)
+
+    async def close():
+        await client.agenerate("hello")
+        clients["own"] = client._async_client()
+        await client.aclose()
+
+    asyncio.run(close())
+    assert clients["own"].is_closed
+    assert done.wait(5)
+    thread.join(5)
+    assert client._async_clients == {}
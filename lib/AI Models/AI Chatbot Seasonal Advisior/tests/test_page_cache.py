@@ -0,0 +1,83 @@
+import datetime
+
+from langchain_core.documents import Document
+
+from scripts import load_data
+from scripts.page_cache import PageCache, open_page_cache, parser_tag
+
+
+class CountingLoader:
+    """LangChain-style loader: one page per line of a text file, counting every parse."""
+
+    parsed = []
+
+    def __init__(self, path):
+        self.path = path
+
+    def load(self):
+        CountingLoader.parsed.append(self.path)
+        with open(self.path) as f:
+            return [Document(page_content=line.strip(), metadata={"source": self.path, "page": page})
+                    for page, line in enumerate(f)]
+
+
+class OtherLoader(CountingLoader):
+    pass
+
+
+def write(path, *lines):
+    path.write_text("\n".join(lines))
+    return str(path)
+
+
+def test_pages_are_parsed_once_per_file_version(tmp_path):
+    CountingLoader.parsed = []
+    cache = PageCache(str(tmp_path / "pages.sqlite3"))
+    path = write(tmp_path / "guide.pdf", "Plant corn in spring.", "Harvest in autumn.")
+
+    first = cache.load(path, CountingLoader)
+    again = cache.load(path, CountingLoader)
+    assert CountingLoader.parsed == [path]
+    assert [doc.page_content for doc in again] == [doc.page_content for doc in first]
+    # "source" is set by the caller, so a renamed copy of the file can share the entry
+    assert again[1].metadata == {"page": 1}
+    assert cache.stats() == {"hits": 1, "misses": 1, "files": 1, "pages": 2}
+
+    # Another parser may extract different text
+    cache.load(path, OtherLoader)
+    assert len(CountingLoader.parsed) == 2
+    assert parser_tag(OtherLoader) != parser_tag(CountingLoader)
+
+    # A changed file is parsed again and replaces the old version's row
+    write(tmp_path / "guide.pdf", "Plant corn in spring.", "Harvest in autumn.", "Store dry.")
+    assert len(cache.load(path, CountingLoader)) == 3
+    assert len(CountingLoader.parsed) == 3
+    assert cache.stats()["pages"] == 3
+
+
+def test_metadata_that_is_not_json_is_stored_as_text(tmp_path):
+    cache = PageCache(str(tmp_path / "pages.sqlite3"))
+    cache.put("key", "a.pdf", [Document(page_content="text", metadata={"created": datetime.date(2024, 5, 1)})])
+    assert cache.get("key")[0].metadata == {"created": "2024-05-01"}
+    assert cache.get("other") is None
+
+
+def test_open_page_cache(tmp_path):
+    path = str(tmp_path / "pages.sqlite3")
+    assert open_page_cache(path) is open_page_cache(path)
+    assert open_page_cache("") is None
+
+
+def test_load_file_uses_the_cache_for_pdfs(tmp_path, monkeypatch):
+    CountingLoader.parsed = []
+    monkeypatch.setitem(load_data.LOADERS, ".pdf", CountingLoader)
+    path = write(tmp_path / "guide.pdf", "Plant corn in spring.")
+    database = str(tmp_path / "pages.sqlite3")
+
+    for _ in range(2):
+        docs = load_data.load_file(path, page_cache=database)
+        assert docs[0].metadata == {"source": "guide.pdf", "page": 0}
+    assert CountingLoader.parsed == [path]
+
+    load_data.load_file(path, page_cache=None)
+    assert len(CountingLoader.parsed) == 2
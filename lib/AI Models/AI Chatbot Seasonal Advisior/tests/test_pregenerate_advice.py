@@ -0,0 +1,38 @@
+import asyncio
+import datetime
+
+import pytest
+
+from pregenerate_advice import pregenerate
+from scripts import seasonal_advice
+from scripts.advice_store import AdviceStore
+from scripts.fake_backends import FakeLLM
+
+PAIRS = [("Iowa", "Corn", "northern"), ("Kenya", "", "southern")]
+TARGET = datetime.date(2026, 7, 1)
+
+
+@pytest.fixture
+def store(tmp_path, monkeypatch):
+    store = AdviceStore(str(tmp_path / "advice.sqlite3"))
+    monkeypatch.setattr(seasonal_advice, "_advice_store", store)
+    yield store
+    seasonal_advice.configure(None)
+
+
+def test_pregenerate_stores_advice_and_resumes(store):
+    seasonal_advice.configure(FakeLLM(answer_words=20))
+    assert asyncio.run(pregenerate(PAIRS, TARGET, retries=1)) == {"generated": 2, "skipped": 0, "failed": 0}
+    assert asyncio.run(pregenerate(PAIRS, TARGET, retries=1)) == {"generated": 0, "skipped": 2, "failed": 0}
+    # Pre-generation does not count as store traffic
+    assert store.stats()["hits"] == 0
+    assert store.stats()["misses"] == 0
+
+
+def test_empty_advice_counts_as_failed_and_is_retried_next_run(store):
+    seasonal_advice.configure(FakeLLM(answer_words=0))
+    assert asyncio.run(pregenerate(PAIRS, TARGET, retries=1)) == {"generated": 0, "skipped": 0, "failed": 2}
+    assert store.stats()["size"] == 0
+
+    seasonal_advice.configure(FakeLLM(answer_words=20))
+    assert asyncio.run(pregenerate(PAIRS, TARGET, retries=1)) == {"generated": 2, "skipped": 0, "failed": 0}
@@ -0,0 +1,50 @@
+import numpy as np
+
+from scripts.reranking import mmr_select
+
+QUERY = [1.0, 0.0, 0.0]
+CANDIDATES = np.array([
+    [0.9, 0.1, 0.0],   # most relevant
+    [0.9, 0.11, 0.0],  # a near-copy of it
+    [0.7, 0.0, 0.7],   # less relevant, different
+    [0.0, 1.0, 0.0],   # unrelated
+])
+
+
+def test_pure_relevance_is_similarity_order():
+    assert mmr_select(QUERY, CANDIDATES, 4, lambda_mult=1.0) == [0, 1, 2, 3]
+
+
+def test_near_copies_are_pushed_down():
+    assert mmr_select(QUERY, CANDIDATES, 2, lambda_mult=0.5) == [0, 2]
+    # Scaling a candidate changes nothing: similarities are cosine
+    assert mmr_select(QUERY, CANDIDATES * [[1], [5], [0.1], [2]], 2, lambda_mult=0.5) == [0, 2]
+
+
+def test_max_per_group():
+    groups = np.array([0, 0, 0, 1])
+    assert mmr_select(QUERY, CANDIDATES, 3, lambda_mult=1.0, groups=groups, max_per_group=1) == [0, 3]
+    assert mmr_select(QUERY, CANDIDATES, 3, lambda_mult=1.0, groups=groups, max_per_group=2) == [0, 1, 3]
+    assert mmr_select(QUERY, CANDIDATES, 3, lambda_mult=1.0, groups=groups, max_per_group=0) == [0, 1, 2]
+
+
+def test_fewer_candidates_than_k():
+    assert sorted(mmr_select(QUERY, CANDIDATES[:2], 5)) == [0, 1]
+    assert mmr_select(QUERY, np.empty((0, 3)), 5) == []
+    assert mmr_select(QUERY, np.array([[0.0, 0.0, 0.0], [1.0, 0.0, 0.0]]), 1) == [1]
+
+
+def test_chatbot_mmr_retrieval(chatbot):
+    question = "How often should I test the pH of acid soil before sowing legumes?"
+    db, _, vectors, _ = chatbot._get_stores()
+    vector = chatbot.get_embeddings().embed_query(question)
+
+    options = chatbot.retrieval_options(search_type="mmr", fetch_k=7, lambda_mult=1.0)
+    relevant = chatbot._mmr_retrieve(db, vectors, vector, options)
+    assert [doc.page_content for doc in relevant] == [doc.page_content for doc in db.similarity_search_by_vector(vector, k=5)]
+
+    options = chatbot.retrieval_options(search_type="mmr", max_per_source=1)
+    sources = [doc.metadata["source"] for doc in chatbot._mmr_retrieve(db, vectors, vector, options)]
+    assert sorted(sources) == ["cattle.txt", "pests.txt", "soil.txt"]
+    # Indexes saved without vectors.npy fall back to reconstructing the candidates
+    assert chatbot._mmr_retrieve(db, None, vector, options) == chatbot._mmr_retrieve(db, vectors, vector, options)
@@ -0,0 +1,96 @@
+import os
+import threading
+import time
+
+import numpy as np
+
+from scripts.fake_backends import FakeEmbeddings
+from scripts.semantic_cache import SemanticCache
+
+embeddings = FakeEmbeddings(size=32)
+
+
+def _near(vector, noise, seed=0):
+    # A paraphrase: same direction plus a little noise
+    vector = np.asarray(vector) + noise * np.random.default_rng(seed).standard_normal(len(vector))
+    return (vector / np.linalg.norm(vector)).tolist()
+
+
+def test_similarity_threshold():
+    cache = SemanticCache(threshold=0.95)
+    vector = embeddings.embed_query("When should I plant corn?")
+    cache.store("When should I plant corn?", vector, "In spring.", ["guide.pdf"])
+
+    hit = cache.lookup(_near(vector, 0.02))
+    assert hit["answer"] == "In spring."
+    assert hit["sources"] == ["guide.pdf"]
+    assert hit["similarity"] >= 0.95
+
+    assert cache.lookup(embeddings.embed_query("How do I store potatoes?")) is None
+    assert cache.stats()["hits"] == 1
+    assert cache.stats()["misses"] == 1
+
+
+def test_entries_expire():
+    cache = SemanticCache(ttl_seconds=0.05)
+    vector = embeddings.embed_query("question")
+    cache.store("question", vector, "answer", [])
+    assert cache.lookup(vector) is not None
+
+    time.sleep(0.1)
+    assert cache.lookup(vector) is None
+    assert cache.stats()["size"] == 0
+
+
+def test_least_recently_used_entry_is_evicted():
+    cache = SemanticCache(max_entries=2)
+    vectors = [embeddings.embed_query(f"question {i}") for i in range(3)]
+    cache.store("question 0", vectors[0], "answer 0", [])
+    cache.store("question 1", vectors[1], "answer 1", [])
+    cache.lookup(vectors[0])
+    cache.store("question 2", vectors[2], "answer 2", [])
+
+    assert cache.lookup(vectors[0])["answer"] == "answer 0"
+    assert cache.lookup(vectors[1]) is None
+    assert cache.lookup(vectors[2])["answer"] == "answer 2"
+
+
+def test_new_index_version_invalidates():
+    cache = SemanticCache()
+    vector = embeddings.embed_query("question")
+    cache.set_index_version("v1")
+    cache.store("question", vector, "answer", [])
+    cache.set_index_version("v1")
+    assert cache.lookup(vector) is not None
+    cache.set_index_version("v2")
+    assert cache.lookup(vector) is None
+
+
+def test_save_and_load_round_trip(tmp_path):
+    path = str(tmp_path / "semantic_cache.npz")
+    cache = SemanticCache(path=path)
+    cache.set_index_version("v1")
+    vector = embeddings.embed_query("question")
+    cache.store("question", vector, "answer", ["guide.pdf"])
+    cache.save()
+    assert os.listdir(tmp_path) == ["semantic_cache.npz"]
+
+    restored = SemanticCache(path=path)
+    assert restored.load() == 1
+    assert restored.index_version == "v1"
+    hit = restored.lookup(vector)
+    assert hit["question"] == "question"
+    assert hit["answer"] == "answer"
+    assert hit["sources"] == ["guide.pdf"]
+
+
+def test_store_saves_in_the_background(tmp_path):
+    path = str(tmp_path / "semantic_cache.npz")
+    cache = SemanticCache(path=path, save_every=2)
+    for i in range(2):
+        cache.store(f"question {i}", embeddings.embed_query(f"question {i}"), f"answer {i}", [])
+
+    for thread in threading.enumerate():
+        if thread.name == "semantic-cache-save":
+            thread.join()
+    assert SemanticCache(path=path).load() == 2
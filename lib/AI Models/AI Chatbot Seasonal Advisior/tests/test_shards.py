@@ -0,0 +1,87 @@
+import json
+import os
+
+import numpy as np
+import pytest
+from langchain_core.documents import Document
+
+from scripts.fake_backends import FakeEmbeddings
+from scripts.index_builder import update_index
+from scripts.shards import ShardRouter, load_topics
+from scripts.vector_index import load_index, resolve_index_folder
+
+SHARED = ("Rotate corn with soybeans to break the life cycle of rootworm and other pests, "
+          "and to let the soybeans fix nitrogen for the next corn crop in the field.")
+FILES = {
+    "corn.txt": ["Plant corn once the soil is warm.", SHARED],
+    "soybeans.txt": ["Soybeans need well-drained soil.", SHARED],
+    "cattle.txt": ["Vaccinate calves against blackleg.", "Milk cows twice a day."],
+}
+TOPICS = {"topics": {
+    "livestock": {"sources": ["cattle"], "keywords": ["cattle", "cows", "calves"]},
+    "row_crops": {"sources": ["corn", "soybeans"], "keywords": ["corn", "soybeans"]},
+}}
+
+
+def load_files(paths):
+    for path in paths:
+        with open(path) as f:
+            paragraphs = f.read().split("\n\n")
+        yield path, [Document(page_content=text, metadata={"source": os.path.basename(path), "page": page})
+                     for page, text in enumerate(paragraphs)], None
+
+
+@pytest.fixture
+def index(tmp_path):
+    embeddings = FakeEmbeddings(size=16)
+    paths = []
+    for name, paragraphs in FILES.items():
+        (tmp_path / name).write_text("\n\n".join(paragraphs))
+        paths.append(str(tmp_path / name))
+    folder = str(tmp_path / "index")
+    update_index(paths, load_files, embeddings, folder, dedup_threshold=0.9)
+    (tmp_path / "topics.json").write_text(json.dumps(TOPICS))
+
+    version_folder = resolve_index_folder(folder)
+    db = load_index(folder, embeddings)
+    router = ShardRouter(version_folder, db.docstore.source_ids, topics=load_topics(str(tmp_path / "topics.json")))
+    return db, router, embeddings
+
+
+def _texts(db, rows):
+    return [db.docstore.get(int(row)).page_content for row in rows if row != -1]
+
+
+def test_routing_by_sources_topic_and_keywords(index):
+    db, router, _ = index
+    assert router.select(sources=["cattle"]).names == ["cattle.txt"]
+    assert sorted(router.select(topic="row_crops").names) == ["corn.txt", "soybeans.txt"]
+    assert router.select("How often should I milk cows?").names == ["cattle.txt"]
+    assert router.select("What is the weather like?") is None
+    with pytest.raises(ValueError):
+        router.select(sources=["wheat"])
+    with pytest.raises(ValueError):
+        router.select(topic="orchards")
+    assert router.stats()["routed"] == {"sources": 1, "topic": 1, "keywords": 1, "unrouted": 1}
+
+
+def test_collapsed_chunks_are_found_through_every_source(index):
+    db, router, embeddings = index
+    assert db.index.ntotal == 5  # SHARED is stored once, under corn.txt
+
+    soybeans = router.select(sources=["soybeans"])
+    assert sorted(_texts(db, np.flatnonzero(soybeans.mask))) == sorted(FILES["soybeans.txt"])
+    _, rows = soybeans.search([embeddings.embed_query(SHARED)], 5)
+    assert _texts(db, rows[0])[0] == SHARED
+    assert sorted(_texts(db, rows[0])) == sorted(FILES["soybeans.txt"])
+
+
+def test_chunks_in_several_selected_shards_are_returned_once(index):
+    db, router, embeddings = index
+    row_crops = router.select(topic="row_crops")
+    distances, rows = row_crops.search([embeddings.embed_query(SHARED)], 5)
+    texts = _texts(db, rows[0])
+    assert texts[0] == SHARED
+    assert sorted(texts) == sorted({*FILES["corn.txt"], *FILES["soybeans.txt"]})
+    assert list(rows[0][3:]) == [-1, -1]
+    assert np.all(np.diff(distances[0][:3]) >= 0)
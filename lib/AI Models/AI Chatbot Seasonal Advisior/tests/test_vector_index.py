@@ -0,0 +1,108 @@
+import os
+
+import faiss
+import numpy as np
+import pytest
+from langchain_community.vectorstores import FAISS
+from langchain_core.documents import Document
+
+from benchmark_index import benchmark_config, make_queries
+from scripts.fake_backends import FakeEmbeddings
+from scripts.vector_index import (KEEP_VERSIONS, VERSIONS_DIR, current_version, index_version, load_index, read_index_config,
+                                  resolve_index_config, resolve_index_folder, save_index)
+
+embeddings = FakeEmbeddings(size=16)
+
+
+def _corpus(size):
+    docs = [Document(page_content=f"Passage {i} about crop {i % 7}", metadata={"source": f"file{i % 3}.pdf"})
+            for i in range(size)]
+    return FAISS.from_documents(docs, embeddings)
+
+
+def test_resolve_index_config():
+    assert resolve_index_config(None, 100) == {"type": "flat"}
+    assert resolve_index_config({"type": "hnsw", "nprobe": 4, "ef_search": 16}, 100) == {
+        "type": "hnsw", "M": 32, "ef_construction": 200, "ef_search": 16}
+    # ~39 training points per list, and nprobe never above nlist
+    assert resolve_index_config({"type": "ivf"}, 100) == {"type": "ivf", "nlist": 2, "nprobe": 2}
+    assert resolve_index_config({"type": "ivf", "nprobe": 4}, 10000)["nlist"] == 256
+    assert resolve_index_config({"type": "ivfpq"}, 100)["pq_bits"] == 6
+    with pytest.raises(ValueError):
+        resolve_index_config({"type": "lsh"}, 100)
+
+
+@pytest.mark.parametrize("config, index_class", [
+    ({"type": "flat"}, faiss.IndexFlatL2),
+    ({"type": "ivf", "nprobe": 3}, faiss.IndexIVFFlat),
+    ({"type": "hnsw", "M": 8, "ef_search": 20}, faiss.IndexHNSWFlat),
+    ({"type": "ivfpq", "pq_m": 4}, faiss.IndexIVFPQ),
+])
+def test_saved_index_type_is_loaded(tmp_path, config, index_class):
+    folder = str(tmp_path / "index")
+    db = _corpus(400)
+    resolved = save_index(db, folder, config)
+    assert read_index_config(folder)["type"] == config["type"]
+    assert read_index_config(folder)["num_vectors"] == 400
+
+    loaded = load_index(folder, embeddings)
+    assert isinstance(loaded.index, index_class)
+    if "nprobe" in resolved:
+        assert faiss.extract_index_ivf(loaded.index).nprobe == resolved["nprobe"]
+    if "ef_search" in resolved:
+        assert loaded.index.hnsw.efSearch == 20
+    assert len(loaded.similarity_search("Passage 12 about crop 5", k=5)) == 5
+
+    # Mutable loads (index builds) always get an exact flat index over the stored vectors
+    mutable = load_index(folder, embeddings, mutable=True)
+    assert isinstance(mutable.index, faiss.IndexFlatL2)
+    assert np.allclose(mutable.index.reconstruct_n(0, 400), db.index.reconstruct_n(0, 400))
+
+
+def test_pq_m_must_divide_the_dimension(tmp_path):
+    with pytest.raises(ValueError, match="pq_m"):
+        save_index(_corpus(100), str(tmp_path / "index"), {"type": "ivfpq", "pq_m": 5})
+
+
+def test_recall_benchmark():
+    vectors = np.random.default_rng(0).standard_normal((2000, 16)).astype(np.float32)
+    queries = make_queries(vectors, 50)
+    exact = faiss.IndexFlatL2(16)
+    exact.add(vectors)
+    _, truth = exact.search(queries, 5)
+
+    flat = benchmark_config(vectors, queries, truth, {"type": "flat"}, 5)
+    assert flat["recall@5"] == 1.0
+    narrow = benchmark_config(vectors, queries, truth, {"type": "ivf", "nprobe": 1}, 5)
+    wide = benchmark_config(vectors, queries, truth, {"type": "ivf", "nprobe": 32}, 5)
+    assert narrow["recall@5"] < wide["recall@5"]
+    assert benchmark_config(vectors, queries, truth, {"type": "hnsw"}, 5)["recall@5"] > 0.9
+    assert benchmark_config(vectors, queries, truth, {"type": "ivfpq", "pq_m": 8}, 5)["index_bytes"] < flat["index_bytes"]
+
+
+
+def test_each_save_publishes_a_new_version(tmp_path):
+    folder = str(tmp_path / "index")
+    db = _corpus(50)
+    versions = []
+    for _ in range(KEEP_VERSIONS + 2):
+        save_index(db, folder)
+        versions.append(current_version(folder))
+        assert index_version(folder) == versions[-1]
+        assert resolve_index_folder(folder) == os.path.join(folder, VERSIONS_DIR, versions[-1])
+    assert len(set(versions)) == len(versions)
+
+    # The oldest versions are pruned; CURRENT is only ever replaced, never left half-written
+    assert sorted(os.listdir(os.path.join(folder, VERSIONS_DIR))) == sorted(versions[-KEEP_VERSIONS:])
+    assert sorted(os.listdir(folder)) == ["CURRENT", VERSIONS_DIR]
+
+
+def test_open_index_survives_a_new_version(tmp_path):
+    folder = str(tmp_path / "index")
+    save_index(_corpus(50), folder)
+    old = load_index(folder, embeddings)
+    save_index(_corpus(60), folder)
+
+    assert load_index(folder, embeddings).index.ntotal == 60
+    assert old.index.ntotal == 50
+    assert len(old.similarity_search("Passage 3 about crop 3", k=5)) == 5